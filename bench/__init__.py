@@ -0,0 +1 @@
+"""Benchmark harness: synthetic CSV generator, a local ShowAds stand-in and scenarios."""
@@ -0,0 +1,212 @@
+"""Local stand-in for the ShowAds API.
+
+Implements /auth, /banners/show and /banners/show/bulk with configurable latency,
+429/500 error rates and token expiry, and records request counts, bulk latencies and
+request body sizes. Bodies sent with Content-Encoding gzip or zstd are decompressed.
+"""
+import argparse
+import json
+import random
+import secrets
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from src.payload import decode
+
+@dataclass(frozen=True)
+class FakeSettings:
+    latency_seconds: float = 0.0
+    rate_429: float = 0.0
+    rate_500: float = 0.0
+    # Issued tokens are rejected with 401 after this long; 0 never expires them
+    token_ttl_seconds: float = 0.0
+    retry_after_seconds: Optional[float] = None
+    seed: int = 0
+
+class FakeShowAds:
+    """Threaded HTTP server on 127.0.0.1; port 0 picks a free port."""
+
+    def __init__(self, settings: FakeSettings = FakeSettings(), port: int = 0):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._rng = random.Random(settings.seed)
+        self._tokens: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        self.banners_shown = 0
+        self.bulk_latencies: list[float] = []
+        # Request body bytes as received and after Content-Encoding is undone
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeShowAds":
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Serve in the calling thread until interrupted."""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts.clear()
+            self.banners_shown = 0
+            self.bulk_latencies.clear()
+            self.bytes_received = 0
+            self.bytes_decoded = 0
+
+    def snapshot(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                "counts": dict(self.counts),
+                "banners_shown": self.banners_shown,
+                "bulk_latencies": list(self.bulk_latencies),
+                "bytes_received": self.bytes_received,
+                "bytes_decoded": self.bytes_decoded,
+            }
+
+    def __enter__(self) -> "FakeShowAds":
+        return self.start()
+
+    def __exit__(self, *exc: object) -> None:
+        self.stop()
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _injected_error(self) -> Optional[int]:
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.settings.rate_429:
+            return 429
+        if roll < self.settings.rate_429 + self.settings.rate_500:
+            return 500
+        return None
+
+    def _issue_token(self) -> str:
+        token = secrets.token_hex(8)
+        with self._lock:
+            self._tokens[token] = time.monotonic()
+        return token
+
+    def _token_valid(self, authorization: Optional[str]) -> bool:
+        if not authorization or not authorization.startswith("Bearer "):
+            return False
+        with self._lock:
+            issued_at = self._tokens.get(authorization[len("Bearer "):])
+        if issued_at is None:
+            return False
+        ttl = self.settings.token_ttl_seconds
+        return ttl <= 0 or time.monotonic() - issued_at < ttl
+
+    def _received(self, received: int, decoded: int) -> None:
+        with self._lock:
+            self.bytes_received += received
+            self.bytes_decoded += decoded
+
+    def _shown(self, count: int, started: Optional[float]) -> None:
+        with self._lock:
+            self.banners_shown += count
+            if started is not None:
+                self.bulk_latencies.append(time.perf_counter() - started)
+
+def _handler(fake: FakeShowAds) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: object) -> None:
+            pass
+
+        def do_POST(self) -> None:
+            started = time.perf_counter()
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            fake._count(self.path)
+            if fake.settings.latency_seconds:
+                time.sleep(fake.settings.latency_seconds)
+            if self.path not in ("/auth", "/banners/show", "/banners/show/bulk"):
+                return self._reply(404, {"error": "not found"})
+            status = fake._injected_error()
+            if status is not None:
+                fake._count(str(status))
+                return self._reply(status, {"error": "injected"})
+            try:
+                decoded = decode(body, self.headers.get("Content-Encoding"))
+            except ValueError as e:
+                return self._reply(400, {"error": str(e)})
+            fake._received(len(body), len(decoded))
+            try:
+                payload = json.loads(decoded or b"{}")
+            except ValueError:
+                return self._reply(400, {"error": "invalid json"})
+
+            if self.path == "/auth":
+                if not payload.get("ProjectKey"):
+                    return self._reply(400, {"error": "missing ProjectKey"})
+                return self._reply(200, {"AccessToken": fake._issue_token()})
+            if not fake._token_valid(self.headers.get("Authorization")):
+                fake._count("401")
+                return self._reply(401, {"error": "invalid token"})
+            if self.path == "/banners/show":
+                fake._shown(1, None)
+            else:
+                fake._shown(len(payload.get("Data", [])), started)
+            self._reply(200, {})
+
+        def _reply(self, status: int, payload: dict[str, str]) -> None:
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            if status == 429 and fake.settings.retry_after_seconds is not None:
+                self.send_header("Retry-After", f"{fake.settings.retry_after_seconds:g}")
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a local ShowAds stand-in")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-500", type=float, default=0.0)
+    parser.add_argument("--token-ttl", type=float, default=0.0, help="Seconds until issued tokens are rejected")
+    parser.add_argument("--retry-after", type=float, help="Retry-After header sent with 429 responses")
+    args = parser.parse_args(argv)
+
+    settings = FakeSettings(
+        latency_seconds=args.latency_ms / 1000,
+        rate_429=args.rate_429,
+        rate_500=args.rate_500,
+        token_ttl_seconds=args.token_ttl,
+        retry_after_seconds=args.retry_after,
+    )
+    fake = FakeShowAds(settings, args.port)
+    print(f"Fake ShowAds listening on {fake.url}", flush=True)
+    try:
+        fake.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""Synthetic customer CSVs for benchmarks."""
+import argparse
+import random
+import sys
+from pathlib import Path
+
+from src.models import Customer
+
+_FIRST_NAMES = ["John", "Jane", "Ann", "Peter", "Maria", "Luke", "Olga", "Sam"]
+_LAST_NAMES = ["Doe", "Smith", "Brown", "Novak", "Garcia", "Jensen", "Ito"]
+# One kind of defect per invalid row, so each one fails exactly one check
+_DEFECTS = ("name", "age", "banner_id")
+
+def generate_csv(
+    path: Path,
+    rows: int,
+    invalid_ratio: float = 0.1,
+    malformed_ratio: float = 0.0,
+    seed: int = 0,
+    max_banner_id: int = 99,
+) -> Path:
+    """Write rows customers to path; invalid_ratio of them fail validation, malformed_ratio fail parsing."""
+    rng = random.Random(seed)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", newline="", buffering=1 << 20) as f:
+        f.write(",".join(Customer.header()) + "\n")
+        lines = []
+        for i in range(rows):
+            name = f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}"
+            age = str(rng.randint(18, 100))
+            banner_id = str(rng.randint(1, max_banner_id))
+            roll = rng.random()
+            if roll < malformed_ratio:
+                age = "n/a"
+            elif roll < malformed_ratio + invalid_ratio:
+                defect = _DEFECTS[i % len(_DEFECTS)]
+                if defect == "name":
+                    name += "_1"
+                elif defect == "age":
+                    age = str(rng.randint(0, 17))
+                else:
+                    banner_id = str(max_banner_id + 1 + rng.randint(0, 100))
+            lines.append(f"{name},{age},cookie-{seed}-{i},{banner_id}\n")
+            if len(lines) >= 10000:
+                f.writelines(lines)
+                lines.clear()
+        f.writelines(lines)
+    return path
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a synthetic customers CSV")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--invalid-ratio", type=float, default=0.1)
+    parser.add_argument("--malformed-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    generate_csv(args.path, args.rows, args.invalid_ratio, args.malformed_ratio, args.seed)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
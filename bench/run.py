@@ -0,0 +1,297 @@
+"""Benchmark scenarios against the local ShowAds stand-in.
+
+Each scenario runs in a fresh process, so its peak RSS is not inflated by earlier ones:
+- process_csv / process_csv_async: the library entry points, in-process
+- cli: `python -m src.cli` as a subprocess
+- api: `POST /process/csv` on a uvicorn subprocess
+
+Results are written as JSON. With --baseline, the run fails when a scenario got slower
+than the baseline by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+import requests
+
+from .fake_server import FakeSettings, FakeShowAds
+from .generate import generate_csv
+
+SCENARIOS = ("process_csv", "process_csv_async", "cli", "api")
+ROOT = Path(__file__).resolve().parent.parent
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    csv_path: str
+    rows: int
+    # Environment for Config.load() in the scenario process
+    env: dict[str, str] = field(default_factory=dict)
+
+@dataclass
+class Measurement:
+    elapsed_seconds: float
+    peak_rss_mb: float
+    # Client-side durations of bulk calls, including retries; None when measured out of process
+    batch_latencies: Optional[list[float]] = None
+    stats: dict[str, int] = field(default_factory=dict)
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[min(98, max(0, round(pct) - 1))]
+
+def run_scenario(scenario: Scenario, fake: FakeShowAds) -> dict[str, Any]:
+    fake.reset()
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        measurement: Measurement = pool.apply(_measure, (scenario,))
+    server = fake.snapshot()
+    counts = server["counts"]
+    requests_sent = sum(v for k, v in counts.items() if k.startswith("/"))
+    if measurement.batch_latencies is not None:
+        latencies, latency_source = measurement.batch_latencies, "client"
+    else:
+        latencies, latency_source = server["bulk_latencies"], "server"
+    elapsed = measurement.elapsed_seconds
+    return {
+        "name": scenario.name,
+        "rows": scenario.rows,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(scenario.rows / elapsed, 1) if elapsed else 0.0,
+        "requests": requests_sent,
+        "requests_per_second": round(requests_sent / elapsed, 1) if elapsed else 0.0,
+        "peak_rss_mb": round(measurement.peak_rss_mb, 1),
+        "batch_latency_ms": {
+            "source": latency_source,
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+        },
+        "banners_shown": server["banners_shown"],
+        "request_bytes": {"sent": server["bytes_received"], "uncompressed": server["bytes_decoded"]},
+        "server_counts": counts,
+        "stats": measurement.stats,
+    }
+
+def _measure(scenario: Scenario) -> Measurement:
+    os.environ.update(scenario.env)
+    if scenario.name in ("process_csv", "process_csv_async"):
+        return _measure_in_process(scenario)
+    if scenario.name == "cli":
+        return _measure_cli(scenario)
+    return _measure_api(scenario)
+
+def _measure_in_process(scenario: Scenario) -> Measurement:
+    import logging
+
+    from src.async_showads_client import AsyncShowAdsClient
+    from src.config import Config
+    from src.models import AgeLimit
+    from src.processor import ProcessStats, process_csv, process_csv_async
+    from src.showads_client import ShowAdsClient
+
+    logging.disable(logging.WARNING)
+    config = Config.load()
+    stats = ProcessStats()
+    latencies: list[float] = []
+    started = time.perf_counter()
+    if scenario.name == "process_csv":
+        client = ShowAdsClient(config)
+        bulk = client.show_banners_bulk
+
+        def timed_bulk(banners: Any, retry_budget: Any = None) -> bool:
+            t = time.perf_counter()
+            try:
+                return bulk(banners, retry_budget)
+            finally:
+                latencies.append(time.perf_counter() - t)
+
+        client.show_banners_bulk = timed_bulk  # type: ignore[method-assign]
+        process_csv(scenario.csv_path, config, AgeLimit(), client, stats)
+        client.close()
+    else:
+        async def run() -> None:
+            async with AsyncShowAdsClient(config) as client:
+                bulk = client.show_banners_bulk
+
+                async def timed_bulk(banners: Any, retry_budget: Any = None) -> bool:
+                    t = time.perf_counter()
+                    try:
+                        return await bulk(banners, retry_budget)
+                    finally:
+                        latencies.append(time.perf_counter() - t)
+
+                client.show_banners_bulk = timed_bulk  # type: ignore[method-assign]
+                await process_csv_async(scenario.csv_path, config, AgeLimit(), client, stats)
+
+        asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return Measurement(elapsed, peak_rss_mb, latencies, stats.counts())
+
+def _measure_cli(scenario: Scenario) -> Measurement:
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "src.cli", scenario.csv_path],
+        cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    elapsed = time.perf_counter() - started
+    return Measurement(elapsed, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024)
+
+def _measure_api(scenario: Scenario) -> Measurement:
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.api:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        _wait_until_up(f"{base}/health")
+        started = time.perf_counter()
+        with open(scenario.csv_path, "rb") as f:
+            response = requests.post(f"{base}/process/csv", files={"file": ("bench.csv", f, "text/csv")}, timeout=3600)
+        elapsed = time.perf_counter() - started
+        response.raise_for_status()
+        peak_rss_mb = _peak_rss_mb(server.pid)
+        return Measurement(elapsed, peak_rss_mb, stats=response.json().get("stats", {}))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+def _wait_until_up(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            requests.get(url, timeout=1).raise_for_status()
+            return
+        except requests.RequestException:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+def _peak_rss_mb(pid: int) -> float:
+    """High-water RSS of a running process (Linux only, 0 elsewhere)."""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+def regressions(results: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """Scenarios whose throughput dropped or p99 latency grew by more than tolerance."""
+    previous = {s["name"]: s for s in baseline.get("scenarios", [])}
+    found = []
+    for scenario in results["scenarios"]:
+        before = previous.get(scenario["name"])
+        if before is None:
+            continue
+        if scenario["rows_per_second"] < before["rows_per_second"] * (1 - tolerance):
+            found.append(f"{scenario['name']}: rows/s {before['rows_per_second']} -> {scenario['rows_per_second']}")
+        p99, before_p99 = scenario["batch_latency_ms"]["p99"], before["batch_latency_ms"]["p99"]
+        if before_p99 and p99 > before_p99 * (1 + tolerance):
+            found.append(f"{scenario['name']}: p99 batch latency {before_p99} ms -> {p99} ms")
+    return found
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the connector against a local ShowAds stand-in")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--invalid-ratio", type=float, default=0.1)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Latency the fake server adds to every request")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-500", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds sent with 429 responses")
+    parser.add_argument("--token-ttl", type=float, default=0.0, help="Seconds until the fake server rejects a token")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="Extra connector setting, repeatable")
+    parser.add_argument("--csv", type=Path, help="Reuse this CSV instead of generating one")
+    parser.add_argument("--output", type=Path, default=Path("bench/results/latest.json"))
+    parser.add_argument("--baseline", type=Path, help="Earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression vs --baseline")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(names).difference(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    settings = FakeSettings(
+        latency_seconds=args.latency_ms / 1000,
+        rate_429=args.rate_429,
+        rate_500=args.rate_500,
+        token_ttl_seconds=args.token_ttl,
+        retry_after_seconds=args.retry_after,
+    )
+    with tempfile.TemporaryDirectory(prefix="showads-bench-") as tmp, FakeShowAds(settings) as fake:
+        csv_path = args.csv or generate_csv(Path(tmp) / "bench.csv", args.rows, args.invalid_ratio)
+        rows = args.rows if args.csv is None else sum(1 for _ in open(csv_path, "rb")) - 1
+        env = {
+            "SHOWADS_BASE_URL": fake.url,
+            "STATE_DIR": str(Path(tmp) / "state"),
+            "RETRY_BACKOFF_SECONDS": "0",
+            "FALLBACK_RATE_PER_SECOND": "0",
+        }
+        env.update(item.split("=", 1) for item in args.env)
+        scenarios = []
+        for name in names:
+            print(f"Running {name} ({rows} rows)...", file=sys.stderr, flush=True)
+            scenarios.append(run_scenario(Scenario(name, str(csv_path), rows, env), fake))
+
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "fake_server": asdict(settings),
+        "settings": {k: v for k, v in env.items() if k not in ("SHOWADS_BASE_URL", "STATE_DIR")},
+        "scenarios": scenarios,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2) + "\n")
+    for scenario in scenarios:
+        print(
+            f"{scenario['name']:>18}: {scenario['rows_per_second']:>10.0f} rows/s "
+            f"{scenario['requests_per_second']:>8.1f} req/s  rss {scenario['peak_rss_mb']:.0f} MB  "
+            f"p50/p99 {scenario['batch_latency_ms']['p50']}/{scenario['batch_latency_ms']['p99']} ms"
+        )
+    print(f"Results written to {args.output}")
+
+    if args.baseline is not None:
+        found = regressions(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,67 +1,338 @@
-import os
+import asyncio
+import io
 import shutil
-from tempfile import NamedTemporaryFile
-from typing import Optional, cast
+import threading
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import replace
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Optional, cast
 
-from fastapi import Depends, FastAPI, File, HTTPException, UploadFile
+from fastapi import Depends, FastAPI, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import FileResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 
+from . import metrics
+from .checkpoint import Checkpoint, CheckpointStore, stream_digest
 from .config import Config
+from .dedup import DedupIndex
+from .csv_loader import CSV_SUFFIXES, ChunkStream, CsvStreamSource, RowSource, check_compression, compression_of
+from .jobs import Job, JobManager, JobStore
 from .logger import setup_logging
 from .models import AgeLimit
-from .processor import process_csv
-from .showads_client import ShowAdsClient
+from .processor import ProcessStats, process_source, process_source_async, validate_source
+from .profiles import DEFAULT_PROFILE, Profile, ProfileRegistry
+from .rejects import RejectSink, rejects_path, remove_expired_rejects
 
-app = FastAPI()
 setup_logging()
 config = Config.load()
-app.state.age_limit = AgeLimit()
+
+# How often rejects files past REJECTS_RETENTION_SECONDS are deleted
+REJECTS_SWEEP_SECONDS = 3600
+
+async def _expire_rejects() -> None:
+    while True:
+        await asyncio.sleep(REJECTS_SWEEP_SECONDS)
+        await run_in_threadpool(remove_expired_rejects, config.state_dir, config.rejects_retention_seconds)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Clients are cached per profile project key: uploads of a tenant share pooled connections and its token
+    profiles = ProfileRegistry.load(config)
+    default = cast(Profile, profiles.get(DEFAULT_PROFILE))
+    store = JobStore(Path(config.state_dir) / "jobs.sqlite3")
+    checkpoints = CheckpointStore(Path(config.state_dir) / "checkpoints.sqlite3")
+    jobs = JobManager(
+        config,
+        store,
+        profiles.client(default),
+        profiles.async_client(default),
+        asyncio.get_running_loop(),
+        checkpoints,
+        profiles.outbox(default),
+        profiles,
+    )
+    jobs.recover()
+    app.state.profiles = profiles
+    app.state.checkpoints = checkpoints
+    app.state.jobs = jobs
+    expiring: Optional[asyncio.Task[None]] = None
+    if config.rejects_retention_seconds > 0:
+        await run_in_threadpool(remove_expired_rejects, config.state_dir, config.rejects_retention_seconds)
+        expiring = asyncio.create_task(_expire_rejects())
+    try:
+        yield
+    finally:
+        if expiring is not None:
+            expiring.cancel()
+        await run_in_threadpool(jobs.shutdown)
+        store.close()
+        checkpoints.close()
+        await profiles.aclose()
+        profiles.close()
+
+app = FastAPI(lifespan=lifespan)
+# Caps uploads processed at once; extra uploads are rejected instead of queued
+upload_slots = threading.BoundedSemaphore(config.max_concurrent_uploads)
 
 class AgeLimitPayload(BaseModel):  # type: ignore
     min_age: int
     max_age: int
 
-def get_age_limit() -> AgeLimit:
-    return cast(AgeLimit, app.state.age_limit)
+def get_profiles() -> ProfileRegistry:
+    return cast(ProfileRegistry, app.state.profiles)
+
+def get_profile(profile: str = Query(DEFAULT_PROFILE)) -> Profile:
+    """The profile named by ?profile=, as it is when the request starts."""
+    found = get_profiles().get(profile)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Profile not found: {profile}")
+    return found
+
+def get_jobs() -> JobManager:
+    return cast(JobManager, app.state.jobs)
+
+def get_checkpoints() -> CheckpointStore:
+    return cast(CheckpointStore, app.state.checkpoints)
+
+def _require_csv(file: UploadFile) -> Optional[str]:
+    """Check the upload is a plain or compressed CSV file, returning its compression."""
+    if not file.filename or not file.filename.lower().endswith(CSV_SUFFIXES):
+        raise HTTPException(status_code=400, detail="Only .csv, .csv.gz and .csv.zst files are supported")
+    compression = compression_of(file.filename)
+    _require_decompressor(compression)
+    return compression
+
+def _require_decompressor(compression: Optional[str]) -> None:
+    try:
+        check_compression(compression)
+    except RuntimeError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+def _body_compression(request: Request) -> Optional[str]:
+    """Compression of a raw request body, from its Content-Encoding header."""
+    encoding = request.headers.get("content-encoding", "identity").strip().lower()
+    if encoding == "identity":
+        return None
+    if encoding not in ("gzip", "zstd"):
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+    _require_decompressor(encoding)
+    return encoding
 
 @app.get("/health")  # type: ignore
 def health() -> dict[str, str]:
     return {"status": "ok"}
 
+@app.get("/metrics")  # type: ignore
+def get_metrics() -> Response:
+    return Response(metrics.exposition(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/profiles")  # type: ignore
+def list_profiles() -> list[dict[str, object]]:
+    return [profile.to_dict() for profile in get_profiles().all()]
+
 @app.get("/config/age-limit")  # type: ignore
-def get_age_limit(age_limit: AgeLimit = Depends(get_age_limit)) -> AgeLimit:
-    return age_limit
+def get_age_limit(profile: Profile = Depends(get_profile)) -> AgeLimit:
+    return profile.age_limit
 
 @app.put("/config/age-limit")  # type: ignore
-def set_age_limit(payload: AgeLimitPayload) -> AgeLimit:
-    age_limit = AgeLimit(min_age=payload.min_age, max_age=payload.max_age)
-    app.state.age_limit = age_limit
-    return age_limit
+def set_age_limit(payload: AgeLimitPayload, profile: Profile = Depends(get_profile)) -> AgeLimit:
+    """Change the age limit of a profile; uploads and jobs already started keep the previous one."""
+    if payload.min_age > payload.max_age:
+        raise HTTPException(status_code=400, detail="min_age must not be greater than max_age")
+    updated = get_profiles().set_age_limit(profile.name, AgeLimit(min_age=payload.min_age, max_age=payload.max_age))
+    return cast(Profile, updated).age_limit
+
+def _acquire_upload_slot() -> None:
+    if not upload_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=503,
+            detail="Too many uploads in progress, retry later",
+            headers={"Retry-After": "1"},
+        )
+
+def _body_chunks(request: Request, loop: asyncio.AbstractEventLoop) -> Iterator[bytes]:
+    """Yield request body chunks in a worker thread as they arrive on the event loop."""
+    body = request.stream().__aiter__()
+
+    async def next_chunk() -> bytes:
+        return await body.__anext__()
+
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(next_chunk(), loop).result()
+        except StopAsyncIteration:
+            return
+
+async def _process_upload(
+    source: RowSource,
+    profile: Profile,
+    use_async: bool,
+    checkpoint: Optional[Checkpoint] = None,
+    use_dedup: bool = False,
+    skip_malformed: bool = False,
+) -> dict[str, object]:
+    """Process rows off the event loop with the settings and clients of profile, in an upload slot.
+
+    Reading the source may block on disk or network.
+    """
+    stats = ProcessStats()
+    dedup: Optional[DedupIndex] = None
+    rejects: Optional[RejectSink] = None
+    rejects_id = uuid.uuid4().hex
+    _acquire_upload_slot()
+    # Everything that can fail runs inside the try, so the slot is always released
+    try:
+        profiles = get_profiles()
+        run_config = replace(profile.config, skip_malformed_rows=True) if skip_malformed else profile.config
+        rejects = RejectSink(rejects_path(config.state_dir, rejects_id))
+        if use_dedup:
+            dedup = await run_in_threadpool(
+                DedupIndex, Path(run_config.state_dir) / "dedup.sqlite3", run_config.dedup_ttl_seconds
+            )
+        if use_async:
+            valid_customers, invalid_customers = await process_source_async(
+                source, run_config, profile.age_limit, profiles.async_client(profile), stats,
+                checkpoint=checkpoint, dedup=dedup, on_reject=rejects.write, outbox=profiles.outbox(profile),
+            )
+        else:
+            # process_source does blocking HTTP I/O and backoff sleeps, keep it off the event loop
+            valid_customers, invalid_customers = await run_in_threadpool(
+                process_source,
+                source,
+                run_config,
+                profile.age_limit,
+                profiles.client(profile),
+                stats,
+                None,
+                checkpoint,
+                dedup,
+                rejects.write,
+                profiles.outbox(profile),
+            )
+        response: dict[str, object] = {
+            "status": "processed",
+            "valid_customers": valid_customers,
+            "invalid_customers": invalid_customers,
+            "stats": stats.counts(),
+        }
+        if rejects.count:
+            response["rejects_url"] = f"/rejects/{rejects_id}"
+        return response
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to process CSV")
+    finally:
+        upload_slots.release()
+        if rejects is not None:
+            rejects.close()
+        if dedup is not None:
+            dedup.close()
 
 @app.post("/process/csv")  # type: ignore
 async def upload_csv(
     file: UploadFile = File(...),
-    age_limit: AgeLimit = Depends(get_age_limit),
-) -> dict[str, str | int]:
-    if not file.filename or not file.filename.lower().endswith(".csv"):
-        raise HTTPException(status_code=400, detail="Only .csv files are supported")
+    profile: Profile = Depends(get_profile),
+    use_async: bool = Query(False, alias="async"),
+    resume: bool = Query(False),
+    use_dedup: bool = Query(False, alias="dedup"),
+    skip_malformed: bool = Query(False),
+) -> dict[str, object]:
+    compression = _require_csv(file)
 
-    client = ShowAdsClient(config)
+    await file.seek(0)
+    checkpoint: Optional[Checkpoint] = None
+    if resume:
+        # Same content as an earlier, interrupted upload of the same profile resumes where that one stopped
+        digest = await run_in_threadpool(stream_digest, file.file)
+        key = digest if profile.name == DEFAULT_PROFILE else f"{profile.name}:{digest}"
+        checkpoint = Checkpoint(get_checkpoints(), key)
 
-    tmp_path: Optional[str] = None
-    try:
-        with NamedTemporaryFile(mode="wb", delete=False, suffix=".csv") as tmp:
-            tmp_path = tmp.name
-            await file.seek(0)
-            shutil.copyfileobj(file.file, tmp)
+    source = CsvStreamSource(file.file, label=cast(str, file.filename), compression=compression)
+    return await _process_upload(source, profile, use_async, checkpoint, use_dedup, skip_malformed)
 
-        valid_customers, invalid_customers = process_csv(tmp_path, config, age_limit, client)
-        return {"status": "processed", "valid_customers": valid_customers, "invalid_customers": invalid_customers}
-    except Exception:
-        raise HTTPException(status_code=500, detail="Failed to process CSV")
+@app.post("/validate/csv")  # type: ignore
+async def validate_csv(
+    file: UploadFile = File(...),
+    profile: Profile = Depends(get_profile),
+    skip_malformed: bool = Query(False),
+) -> dict[str, object]:
+    """Dry run: validate an upload and report what processing it would send, without calling ShowAds."""
+    compression = _require_csv(file)
+
+    await file.seek(0)
+    _acquire_upload_slot()
+    try:
+        source = CsvStreamSource(file.file, label=cast(str, file.filename), compression=compression)
+        run_config = replace(profile.config, skip_malformed_rows=True) if skip_malformed else profile.config
+        report = await run_in_threadpool(validate_source, source, run_config, profile.age_limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-            except OSError:
-                pass
+        upload_slots.release()
+    return {"status": "validated", **report.to_dict()}
+
+@app.post("/process/csv/stream")  # type: ignore
+async def stream_csv(
+    request: Request,
+    profile: Profile = Depends(get_profile),
+    use_async: bool = Query(False, alias="async"),
+    use_dedup: bool = Query(False, alias="dedup"),
+    skip_malformed: bool = Query(False),
+) -> dict[str, object]:
+    """Process a raw CSV request body while it is still being uploaded, gzip or zstd encoded or not."""
+    compression = _body_compression(request)
+    body = io.BufferedReader(ChunkStream(_body_chunks(request, asyncio.get_running_loop())))
+    source = CsvStreamSource(body, label="request body", compression=compression)
+    return await _process_upload(source, profile, use_async, use_dedup=use_dedup, skip_malformed=skip_malformed)
+
+@app.post("/jobs", status_code=202)  # type: ignore
+async def create_job(
+    file: UploadFile = File(...),
+    profile: Profile = Depends(get_profile),
+    use_async: bool = Query(False, alias="async"),
+    skip_malformed: bool = Query(False),
+    jobs: JobManager = Depends(get_jobs),
+) -> dict[str, object]:
+    _require_csv(file)
+
+    job_id = jobs.new_job_id()
+    input_path = jobs.input_path_for(job_id, cast(str, file.filename))
+    await file.seek(0)
+    with input_path.open("wb") as f:
+        await run_in_threadpool(shutil.copyfileobj, file.file, f)
+
+    job = jobs.submit(job_id, cast(str, file.filename), profile.age_limit, use_async, profile.name, skip_malformed)
+    return job.to_dict()
+
+def _job_response(job: Job) -> dict[str, object]:
+    response = job.to_dict()
+    if rejects_path(config.state_dir, job.id).exists():
+        response["rejects_url"] = f"/rejects/{job.id}"
+    return response
+
+@app.get("/jobs/{job_id}")  # type: ignore
+def get_job(job_id: str, jobs: JobManager = Depends(get_jobs)) -> dict[str, object]:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
+
+@app.delete("/jobs/{job_id}")  # type: ignore
+def cancel_job(job_id: str, jobs: JobManager = Depends(get_jobs)) -> dict[str, object]:
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
+
+@app.get("/rejects/{rejects_id}")  # type: ignore
+def download_rejects(rejects_id: str) -> FileResponse:
+    """Rejected rows of an upload or job as JSON Lines."""
+    # The id becomes a file name, so it is checked before any path is built from it
+    if not (rejects_id.isascii() and rejects_id.isalnum()):
+        raise HTTPException(status_code=404, detail="Rejects not found")
+    path = rejects_path(config.state_dir, rejects_id)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Rejects not found")
+    return FileResponse(path, media_type="application/x-ndjson", filename=f"rejects-{rejects_id}.jsonl")
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+from typing import Iterable, Optional, cast
+
+import httpx
+
+from . import metrics, payload
+from .config import Config
+from .models import Banner
+from .rate_limit import RetryBudget, TokenBucket
+from .retry import CircuitBreaker, RetryPolicy, RetryState
+from .showads_client import Token, refresh_margin, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+class AsyncShowAdsClient:
+    """Asyncio counterpart of ShowAdsClient.
+
+    Shares the token, retry, circuit breaker and 401-refresh semantics of the synchronous
+    client, so many bulk requests can be awaited concurrently on one event loop.
+    """
+    def __init__(self, config: Config, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._config = config
+        self._retry = RetryPolicy.from_config(config)
+        self.breaker = CircuitBreaker(config.circuit_breaker_threshold, config.circuit_breaker_reset_seconds)
+        self._encoder = payload.Encoder(config.request_compression)
+        self._token: Optional[Token] = None
+        self._token_lock = asyncio.Lock()
+        keepalive = config.http_keepalive_seconds > 0
+        limits = httpx.Limits(
+            max_connections=config.http_pool_size,
+            max_keepalive_connections=config.http_pool_size if keepalive else 0,
+            keepalive_expiry=config.http_keepalive_seconds if keepalive else None,
+        )
+        self._http = httpx.AsyncClient(transport=transport, limits=limits)
+
+    @property
+    def token(self) -> Optional[Token]:
+        return self._token
+
+    async def __aenter__(self) -> "AsyncShowAdsClient":
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    async def _auth_header(self) -> dict[str, str]:
+        margin = refresh_margin(self._config)
+        token = self._token
+        if token is None or not token.is_valid(margin):
+            async with self._token_lock:
+                # Another coroutine may have refreshed the token while we waited
+                token = self._token
+                if token is None or not token.is_valid(margin):
+                    token = await self._refresh_token()
+        return {"Authorization": f"Bearer {token.access_token}"}
+
+    async def _refresh_stale_token(self, stale_header: str) -> None:
+        async with self._token_lock:
+            # Only the first coroutine to see the stale token refreshes it
+            token = self._token
+            if token is None or stale_header == f"Bearer {token.access_token}":
+                await self._refresh_token()
+
+    async def _refresh_token(self) -> Token:
+        url = f"{self._config.api_base_url}/auth"
+        payload = {
+            "ProjectKey": self._config.project_key
+        }
+        call = self._retry.start()
+        while True:
+            retry_after = None
+            try:
+                with metrics.http_request("/auth"):
+                    response = await self._http.post(url, json=payload, timeout=self._attempt_timeout(call))
+                metrics.http_response("/auth", response.status_code)
+                if response.status_code == 200:
+                    self.breaker.record_success()
+                    data = cast(dict[str, str], response.json())
+                    access_token = data.get("AccessToken")
+                    if not access_token:
+                        raise RuntimeError("Missing AccessToken in auth response")
+                    token = Token(
+                        access_token=access_token,
+                        expires_at=time.time() + self._config.token_expiry_seconds
+                    )
+                    self._token = token
+                    metrics.token_obtained()
+                    logger.info("Obtained access token")
+                    return token
+                if response.status_code in (401, 400):
+                    self.breaker.record_success()
+                    raise RuntimeError(f"Auth request failed: {response.status_code} {response.text}")
+                # if status_code in (429, 500), we continue with backoff
+                self._record_status(response.status_code)
+                retry_after = retry_after_seconds(response.headers) if response.status_code == 429 else None
+            except httpx.HTTPError as e:
+                metrics.http_response("/auth", type(e).__name__)
+                logger.warning(f"Auth request error: {e}")
+                self.breaker.record_failure()
+            delay = call.next_delay(retry_after)
+            if delay is None:
+                raise RuntimeError("Failed to obtain access token")
+            await self._sleep(delay, retry_after)
+            # The first attempt was let through by the request that needed the token
+            self.breaker.check()
+
+    def _record_status(self, status_code: int) -> None:
+        if status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _attempt_timeout(self, call: RetryState) -> "httpx.Timeout | float":
+        """What is left of the call deadline, else the client's default timeout."""
+        remaining = call.timeout()
+        return remaining if remaining is not None else self._http.timeout
+
+    async def _sleep(self, delay: float, retry_after: Optional[float]) -> None:
+        metrics.retry_sleep("retry_after" if retry_after is not None else "backoff", delay)
+        await asyncio.sleep(delay)
+
+    async def show_banner(
+        self,
+        banner: Banner,
+        rate_limiter: Optional[TokenBucket] = None,
+        retry_budget: Optional[RetryBudget] = None,
+    ) -> bool:
+        url = f"{self._config.api_base_url}/banners/show"
+        body = payload.encode_json({
+            "VisitorCookie": banner.visitor_cookie,
+            "BannerId": banner.banner_id
+        })
+        return await self._post_with_retry(url, body, rate_limiter, retry_budget)
+
+    async def show_banners_bulk(self, banners: Iterable[Banner], retry_budget: Optional[RetryBudget] = None) -> bool:
+        url = f"{self._config.api_base_url}/banners/show/bulk"
+        return await self._post_with_retry(url, payload.encode_bulk(banners), retry_budget=retry_budget)
+
+    async def _post_with_retry(
+        self,
+        url: str,
+        body: bytes,
+        rate_limiter: Optional[TokenBucket] = None,
+        retry_budget: Optional[RetryBudget] = None,
+    ) -> bool:
+        endpoint = url[len(self._config.api_base_url):]
+        body, content_encoding = self._encoder.encode(body)
+        call = self._retry.start(retry_budget.deadline if retry_budget is not None else None)
+        refreshed = False
+        while True:
+            if rate_limiter is not None:
+                await rate_limiter.acquire_async()
+            trial = self.breaker.check()
+            retry_after = None
+            try:
+                headers = {"Content-Type": "application/json"}
+                if content_encoding is not None:
+                    headers["Content-Encoding"] = content_encoding
+                headers.update(await self._auth_header())
+                with metrics.http_request(endpoint, len(body)):
+                    response = await self._http.post(url, content=body, headers=headers, timeout=self._attempt_timeout(call))
+                metrics.http_response(endpoint, response.status_code)
+                if response.status_code == 200:
+                    self.breaker.record_success()
+                    return True
+                if response.status_code == 401:
+                    self.breaker.record_success()
+                    logger.info("Access token expired or invalid, refreshing")
+                    await self._refresh_stale_token(headers["Authorization"])
+                    if not refreshed:
+                        refreshed = True
+                        continue
+                elif response.status_code == 400:
+                    self.breaker.record_success()
+                    logger.error(f"Bad request {response.status_code}: {response.text}")
+                    return False
+                else:
+                    self._record_status(response.status_code)
+                    retry_after = retry_after_seconds(response.headers) if response.status_code == 429 else None
+            except httpx.HTTPError as e:
+                metrics.http_response(endpoint, type(e).__name__)
+                logger.warning(f"Request error: {e}")
+                self.breaker.record_failure()
+            except BaseException:
+                if trial:
+                    self.breaker.end_trial()
+                raise
+            delay = call.next_delay(retry_after)
+            if delay is None:
+                return False
+            if retry_budget is not None and not retry_budget.try_spend():
+                logger.warning("Retry budget exhausted")
+                return False
+            if rate_limiter is not None and retry_after is not None:
+                # Every caller sharing the limiter waits out the Retry-After
+                metrics.retry_sleep("retry_after", retry_after)
+                rate_limiter.pause(retry_after)
+                continue
+            await self._sleep(delay, retry_after)
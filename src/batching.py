@@ -0,0 +1,29 @@
+import threading
+
+
+class AdaptiveBatchSize:
+    """Thread-safe bulk batch size tuned by additive increase, multiplicative decrease.
+
+    Grows by `step` after each healthy batch and halves after one that failed, needed
+    retries or took longer than `target_seconds`, staying within [minimum, maximum].
+    """
+    def __init__(self, initial: int, minimum: int, maximum: int, target_seconds: float, step: int = 0):
+        self._minimum = max(1, minimum)
+        self._maximum = max(self._minimum, maximum)
+        self._target_seconds = target_seconds
+        self._step = step if step > 0 else max(1, initial // 10)
+        self._size = min(self._maximum, max(self._minimum, initial))
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def record(self, seconds: float, ok: bool, retried: bool = False) -> int:
+        """Adjust the size after a bulk request and return the new size."""
+        with self._lock:
+            if not ok or retried or seconds > self._target_seconds:
+                self._size = max(self._minimum, self._size // 2)
+            else:
+                self._size = min(self._maximum, self._size + self._step)
+            return self._size
@@ -0,0 +1,77 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import IO
+
+logger = logging.getLogger(__name__)
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of a file's content, used as its checkpoint key."""
+    with path.open("rb") as f:
+        return stream_digest(f)
+
+def stream_digest(stream: IO[bytes]) -> str:
+    """SHA-256 of a seekable stream from its current position; the position is restored."""
+    start = stream.tell()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+        digest.update(chunk)
+    stream.seek(start)
+    return digest.hexdigest()
+
+class CheckpointStore:
+    """SQLite table of the byte offset up to which each input has been delivered."""
+    def __init__(self, db_path: Path):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    key TEXT PRIMARY KEY,
+                    byte_offset INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT byte_offset FROM checkpoints WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row else 0
+
+    def save(self, key: str, offset: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (key, byte_offset, updated_at) VALUES (?, ?, ?)",
+                (key, offset, time.time()),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM checkpoints WHERE key = ?", (key,))
+
+class Checkpoint:
+    """Resume position of one input. advance() is called once a batch has been delivered."""
+    def __init__(self, store: CheckpointStore, key: str):
+        self._store = store
+        self.key = key
+        self.offset = store.get(key)
+
+    def advance(self, offset: int) -> None:
+        self.offset = offset
+        self._store.save(self.key, offset)
+
+    def clear(self) -> None:
+        self.offset = 0
+        self._store.delete(self.key)
@@ -1,11 +1,35 @@
 import argparse
+import asyncio
+import csv
+import io
+import json
 import sys
-from typing import cast
+from contextlib import ExitStack
+from dataclasses import asdict, replace
+from pathlib import Path
+from typing import Optional, cast
 
-from .config import Config
+from . import metrics
+from .async_showads_client import AsyncShowAdsClient
+from .checkpoint import Checkpoint, CheckpointStore, file_digest
+from .config import VALIDATION_ENGINES, Config
+from .csv_loader import CsvFiles, CsvSource, CsvStreamSource, FollowStream, RowSource, compression_of, expand_paths
+from .dedup import DedupIndex
 from .logger import setup_logging
 from .models import AgeLimit
-from .processor import process_csv
+from .outbox import Outbox, outbox_path
+from .processor import (
+	FileSummary,
+	ProcessStats,
+	process_csv,
+	process_csv_async,
+	process_source,
+	process_source_async,
+	replay_outbox,
+	validate_source,
+)
+from .profiles import DEFAULT_PROFILE, Profile, ProfileRegistry
+from .rejects import RejectSink
 from .showads_client import ShowAdsClient
 
 
@@ -14,46 +38,364 @@ def _parse_args(argv: list[str] | None) -> argparse.Namespace:
 
 	Returns parsed arguments namespace.
 	"""
-	parser = argparse.ArgumentParser(description="Send CSV customers to ShowAds")
+	parser = argparse.ArgumentParser(
+		description="Send CSV customers to ShowAds",
+		epilog=(
+			"Run `python -m src.cli replay` to resend banners kept in the outbox after failed deliveries; "
+			"pass a CSV file named replay as ./replay."
+		),
+	)
 	parser.add_argument(
-		"csv_path",
+		"csv_paths",
 		type=str,
-		help="Path to CSV file with customers data",
+		nargs="+",
+		metavar="csv_path",
+		help="CSV files with customers data (.csv, .csv.gz or .csv.zst), glob patterns or directories of such files; or one named pipe, or - to read from stdin",
 	)
 	parser.add_argument(
 		"--age-limit",
 		type=int,
 		nargs=2,
 		metavar=("MIN", "MAX"),
-		help="Age limit for customers as two integers: MIN MAX",
+		help="Age limit for customers as two integers: MIN MAX (default: the profile's)",
+	)
+	parser.add_argument(
+		"--profile",
+		type=str,
+		default=DEFAULT_PROFILE,
+		metavar="NAME",
+		help="Send with the project key, banner ids, age limit and state of this profile from PROFILES_FILE",
+	)
+	parser.add_argument(
+		"--async",
+		dest="use_async",
+		action="store_true",
+		help="Send bulk batches concurrently using the asyncio client",
+	)
+	parser.add_argument(
+		"--max-in-flight",
+		type=int,
+		metavar="N",
+		help="Maximum number of concurrent bulk requests in --async mode (default: MAX_IN_FLIGHT_BATCHES)",
+	)
+	parser.add_argument(
+		"--resume",
+		action="store_true",
+		help="Skip rows already delivered by an earlier run of the same file and record progress while running",
+	)
+	parser.add_argument(
+		"--dedup",
+		action="store_true",
+		help="Skip (cookie, banner id) pairs already sent in this run or within DEDUP_TTL_SECONDS",
+	)
+	parser.add_argument(
+		"--engine",
+		choices=VALIDATION_ENGINES,
+		help="Validation engine; columnar needs pyarrow (default: VALIDATION_ENGINE)",
+	)
+	parser.add_argument(
+		"--workers",
+		type=int,
+		metavar="N",
+		help="Parse and validate the file in N processes (default: PARSE_WORKERS)",
+	)
+	parser.add_argument(
+		"--skip-malformed",
+		action="store_true",
+		help="Count rows with a missing or non-integer Age or Banner_id as invalid instead of stopping (default: SKIP_MALFORMED_ROWS)",
+	)
+	parser.add_argument(
+		"--rejects",
+		type=str,
+		metavar="PATH",
+		help="Write rejected rows with their reason to this CSV file (JSON Lines for .jsonl); implies --skip-malformed",
+	)
+	parser.add_argument(
+		"--follow",
+		action="store_true",
+		help="Keep reading the file as it grows, like tail -f, until interrupted",
+	)
+	parser.add_argument(
+		"--max-linger",
+		type=float,
+		metavar="SECONDS",
+		help="Send a partial batch of stdin, a named pipe or a followed file once its oldest row waited this long (default: MAX_LINGER_SECONDS)",
+	)
+	parser.add_argument(
+		"--dry-run",
+		action="store_true",
+		help="Only validate: print counts by rejection reason, age and banner id histograms and the bulk requests a run would send, as JSON",
+	)
+	parser.add_argument(
+		"--summary",
+		type=str,
+		metavar="PATH",
+		help="Write a CSV report with the counts of each input file to PATH when the run ends",
+	)
+	parser.add_argument(
+		"--metrics-file",
+		type=str,
+		metavar="PATH",
+		help="Write Prometheus metrics of the run to this file when it ends",
+	)
+	args = parser.parse_args(argv)
+	if any(_is_stream(path) for path in args.csv_paths) or args.follow:
+		if len(args.csv_paths) > 1:
+			parser.error("stdin, named pipes and --follow take a single path")
+		args.csv_paths = [args.csv_paths[0]]
+	else:
+		args.csv_paths = [str(path) for path in expand_paths(args.csv_paths)]
+		if not args.csv_paths:
+			parser.error("no CSV files match the given paths")
+	if args.resume and (args.follow or len(args.csv_paths) > 1 or _is_stream(args.csv_paths[0])):
+		parser.error("--resume needs a single regular file")
+	if args.dry_run and (args.resume or args.follow):
+		parser.error("--dry-run cannot be combined with --resume or --follow")
+	return args
+
+
+def _parse_replay_args(argv: list[str]) -> argparse.Namespace:
+	parser = argparse.ArgumentParser(
+		prog="python -m src.cli replay",
+		description="Resend the banners kept in the outbox after failed deliveries",
+	)
+	parser.add_argument(
+		"--batch-size",
+		type=int,
+		metavar="N",
+		help="Banners per bulk request (default: BULK_BATCH_SIZE)",
+	)
+	parser.add_argument(
+		"--profile",
+		type=str,
+		default=DEFAULT_PROFILE,
+		metavar="NAME",
+		help="Resend the outbox of this profile from PROFILES_FILE",
 	)
 	return parser.parse_args(argv)
 
 
+def _is_stream(csv_path: str) -> bool:
+	return csv_path == "-" or Path(csv_path).is_fifo()
+
+
+def _open_stream(csv_path: str, follow: bool, stack: ExitStack) -> Optional[CsvStreamSource]:
+	"""Live source for stdin, a named pipe or a followed file; None for a regular file.
+
+	Pipes and followed files named *.gz or *.zst are decompressed as they are read.
+	"""
+	if csv_path == "-":
+		return CsvStreamSource(sys.stdin.buffer, label="<stdin>", live=True)
+	compression = compression_of(csv_path)
+	if follow:
+		followed = io.BufferedReader(FollowStream(open(csv_path, "rb", buffering=0)))
+		return CsvStreamSource(stack.enter_context(followed), label=csv_path, live=True, compression=compression)
+	if Path(csv_path).is_fifo():
+		return CsvStreamSource(stack.enter_context(open(csv_path, "rb")), label=csv_path, live=True, compression=compression)
+	return None
+
+
+def _write_summary(path: Path, stats: ProcessStats, source_name: str) -> None:
+	"""Write one CSV row per input file; a single-input run gets one row with the run totals."""
+	summaries = stats.files
+	if not summaries:
+		summaries = [
+			FileSummary(
+				path=source_name,
+				rows_read=stats.rows_read,
+				valid=stats.valid,
+				invalid=stats.invalid,
+				malformed=stats.malformed,
+				banners_sent=stats.banners_sent,
+				banners_failed=stats.banners_failed,
+			)
+		]
+	with path.open("w", newline="") as f:
+		writer = csv.DictWriter(f, fieldnames=[*asdict(summaries[0]), "duplicates"])
+		writer.writeheader()
+		for summary in summaries:
+			writer.writerow({**asdict(summary), "duplicates": summary.duplicates})
+
+
+def _load_profile(name: str) -> Profile:
+	"""The named profile; exits with an error when PROFILES_FILE does not define it."""
+	profile = ProfileRegistry.load(Config.load()).get(name)
+	if profile is None:
+		raise SystemExit(f"Unknown profile: {name}")
+	return profile
+
+
+def _open_checkpoints(config: Config) -> CheckpointStore:
+	return CheckpointStore(Path(config.state_dir) / "checkpoints.sqlite3")
+
+
+def _open_dedup(config: Config) -> DedupIndex:
+	return DedupIndex(Path(config.state_dir) / "dedup.sqlite3", config.dedup_ttl_seconds)
+
+
+async def _process_csv_async(
+	csv_path: str,
+	source: Optional[RowSource],
+	config: Config,
+	age_limit: AgeLimit,
+	stats: ProcessStats,
+	checkpoint: Optional[Checkpoint],
+	dedup: Optional[DedupIndex],
+	rejects: Optional[RejectSink],
+	outbox: Optional[Outbox],
+) -> None:
+	async with AsyncShowAdsClient(config) as client:
+		if source is not None:
+			await process_source_async(
+				source,
+				config,
+				age_limit,
+				client,
+				stats=stats,
+				dedup=dedup,
+				on_reject=rejects.write if rejects is not None else None,
+				outbox=outbox,
+			)
+			return
+		await process_csv_async(
+			path=csv_path,
+			config=config,
+			age_limit=age_limit,
+			client=client,
+			stats=stats,
+			checkpoint=checkpoint,
+			dedup=dedup,
+			on_reject=rejects.write if rejects is not None else None,
+			outbox=outbox,
+		)
+
+
+def _replay(argv: list[str]) -> int:
+	"""Resend the outbox; exits with 1 while banners remain undelivered."""
+	args = _parse_replay_args(argv)
+	config = _load_profile(args.profile).config
+	if args.batch_size is not None:
+		config = replace(config, bulk_batch_size=args.batch_size)
+
+	outbox = Outbox(outbox_path(config.state_dir))
+	client = ShowAdsClient(config)
+	try:
+		_, undelivered = replay_outbox(outbox, config, client)
+	finally:
+		client.close()
+		outbox.close()
+	return 1 if undelivered else 0
+
+
+def _dry_run(csv_paths: list[str], config: Config, age_limit: AgeLimit, rejects_path: Optional[str]) -> int:
+	"""Validate the input and print the report, without contacting ShowAds."""
+	rejects = RejectSink(Path(rejects_path)) if rejects_path is not None else None
+	stack = ExitStack()
+	try:
+		source = _open_stream(csv_paths[0], False, stack)
+		if source is None:
+			source = CsvFiles.of(Path(path) for path in csv_paths) if len(csv_paths) > 1 else CsvSource(Path(csv_paths[0]))
+		report = validate_source(source, config, age_limit, rejects.write if rejects is not None else None)
+	finally:
+		stack.close()
+		if rejects is not None:
+			rejects.close()
+	print(json.dumps(report.to_dict(), indent=2))
+	return 0
+
+
 def main(argv: list[str] | None = None) -> int:
 	"""CLI entrypoint.
 
 	Returns a POSIX-style exit code where 0 indicates success.
 	"""
 	setup_logging()
+	if argv is None:
+		argv = sys.argv[1:]
+	if argv[:1] == ["replay"]:
+		return _replay(argv[1:])
 	args = _parse_args(argv)
 
-	config = Config.load()
+	profile = _load_profile(args.profile)
+	config = profile.config
 	if args.age_limit is None:  # type: ignore
-		age_limit = AgeLimit()
+		age_limit = profile.age_limit
 	else:
 		min_age, max_age = cast(tuple[int, int], args.age_limit)
 		age_limit = AgeLimit(min_age=min_age, max_age=max_age)
 
-	client = ShowAdsClient(config)
-	csv_path: str = args.csv_path
-	process_csv(
-		path=csv_path,
-		config=config,
-		age_limit=age_limit,
-		client=client,
-	)
-	return 0
+	if args.max_in_flight is not None:
+		config = replace(config, max_in_flight_batches=args.max_in_flight)
+	if args.engine is not None:
+		config = replace(config, validation_engine=args.engine)
+	if args.workers is not None:
+		config = replace(config, parse_workers=args.workers)
+	if args.skip_malformed or args.rejects is not None:
+		config = replace(config, skip_malformed_rows=True)
+	if args.max_linger is not None:
+		config = replace(config, max_linger_seconds=args.max_linger)
+
+	csv_paths: list[str] = args.csv_paths
+	csv_path = csv_paths[0]
+	if args.dry_run:
+		return _dry_run(csv_paths, config, age_limit, args.rejects)
+
+	stats = ProcessStats()
+	checkpoints = _open_checkpoints(config) if args.resume else None
+	# Keyed by the content hash, so a file that was sent to the end is not sent again
+	checkpoint = Checkpoint(checkpoints, file_digest(Path(csv_path))) if checkpoints is not None else None
+	dedup = _open_dedup(config) if args.dedup else None
+	rejects = RejectSink(Path(args.rejects)) if args.rejects is not None else None
+	outbox = Outbox(outbox_path(config.state_dir)) if config.outbox_enabled else None
+	stack = ExitStack()
+	try:
+		# Several files share one client and fill batches across file boundaries
+		source: Optional[RowSource] = _open_stream(csv_path, args.follow, stack)
+		if len(csv_paths) > 1:
+			source = CsvFiles.of(Path(path) for path in csv_paths)
+		if args.use_async:
+			asyncio.run(_process_csv_async(csv_path, source, config, age_limit, stats, checkpoint, dedup, rejects, outbox))
+			return 0
+
+		client = ShowAdsClient(config)
+		if source is not None:
+			process_source(
+				source,
+				config,
+				age_limit,
+				client,
+				stats=stats,
+				dedup=dedup,
+				on_reject=rejects.write if rejects is not None else None,
+				outbox=outbox,
+			)
+			return 0
+		process_csv(
+			path=csv_path,
+			config=config,
+			age_limit=age_limit,
+			client=client,
+			stats=stats,
+			checkpoint=checkpoint,
+			dedup=dedup,
+			on_reject=rejects.write if rejects is not None else None,
+			outbox=outbox,
+		)
+		return 0
+	finally:
+		stack.close()
+		if checkpoints is not None:
+			checkpoints.close()
+		if dedup is not None:
+			dedup.close()
+		if outbox is not None:
+			outbox.close()
+		if rejects is not None:
+			rejects.close()
+		if args.summary is not None:
+			_write_summary(Path(args.summary), stats, csv_path)
+		if args.metrics_file is not None:
+			metrics.write_textfile(Path(args.metrics_file))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,340 @@
+"""Columnar validation engine backed by pyarrow (optional dependency).
+
+Reads the CSV in blocks of typed arrays and applies the name, age and banner id
+checks of validate_customer as vectorized masks. Counts and error messages are the
+same as the row-by-row engine: messages for invalid rows come from validate_customer
+itself, and blocks whose numbers pyarrow cannot parse are handed to the row parser.
+Records pyarrow cannot split into the header's columns are parsed by field position,
+like the row engine does, so extra fields are ignored here too.
+"""
+import bisect
+import csv
+import io
+import itertools
+import re
+from contextlib import ExitStack
+from typing import IO, Iterator, Optional, cast
+
+from .config import Config
+from .csv_loader import (
+    CsvSource,
+    CsvStreamSource,
+    Reject,
+    RejectHandler,
+    RowSource,
+    _row_dict,
+    decompressing,
+    malformed_reason,
+    parse_customer,
+)
+from .models import AgeLimit, Banner, Customer, ValueCounts
+from .validation import _NAME_RE, customer_validator
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = None
+
+BLOCK_SIZE = 1 << 20
+
+# A newline ending the line before a blank one
+_BLANK_LINE = re.compile(rb"\n\r?(?=\n)")
+# Rows per chunk when an input is left to the row parser
+ROW_CHUNK = 10_000
+# Start of the input checked for records pyarrow cannot split into the header's columns
+SAMPLE_BYTES = 1 << 16
+
+def is_available() -> bool:
+    return pa is not None
+
+def validated_chunks(
+    source: RowSource,
+    config: Config,
+    age_limit: AgeLimit,
+    block_size: int = BLOCK_SIZE,
+    on_malformed: Optional[RejectHandler] = None,
+    counts: Optional[ValueCounts] = None,
+) -> Iterator[tuple[int, list[Banner], list[Reject]]]:
+    """Yield (rows read, valid banners, rejects of invalid customers) per block, in file order.
+
+    Records with another number of fields than the header are parsed by field position, like
+    the row engine does. With on_malformed, records that still fail to parse are passed to it
+    with their line and left out of the rows read; without it they raise ValueError. Records
+    must not span lines. With counts, the ages and banner ids of all rows read are counted in it.
+    """
+    if pa is None:
+        raise RuntimeError("The columnar engine needs pyarrow: pip install pyarrow")
+    if _mostly_other_field_counts(source, SAMPLE_BYTES):
+        yield from _row_chunks(source, config, age_limit, on_malformed, counts)
+        return
+
+    with ExitStack() as stack:
+        lines: Optional[_LineNumbers] = None
+        if on_malformed is None:
+            data = _binary_input(source, stack)
+        else:
+            data = lines = _LineNumbers(cast(IO[bytes], _binary_input(source, stack, path_ok=False)))
+        records = _SkippedRecords()
+        try:
+            reader = pa_csv.open_csv(
+                data,
+                read_options=pa_csv.ReadOptions(block_size=block_size),
+                parse_options=pa_csv.ParseOptions(invalid_row_handler=records.skip),
+                convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in Customer.header()}),
+            )
+        except pa.ArrowInvalid as e:
+            raise ValueError(f"Invalid CSV: {e}") from e
+        missing = set(Customer.header()).difference(reader.schema.names)
+        if missing:
+            raise ValueError(f"Missing headers: {missing}")
+
+        rows = _RowParser(reader.schema.names, config, age_limit, on_malformed, lines, counts)
+        while True:
+            try:
+                batch = reader.read_next_batch()
+            except StopIteration:
+                break
+            except pa.ArrowInvalid as e:
+                raise ValueError(f"Invalid CSV: {e}") from e
+            if not batch.num_rows:
+                continue
+            start, end = records.advance(batch.num_rows)
+            skipped = records.take(end)
+            if skipped:
+                yield rows.validate(start, end, batch, skipped)
+            else:
+                yield _validate_batch(batch, config, age_limit, start, rows, counts)
+        skipped = records.take()
+        if skipped:
+            yield rows.validate(skipped[0][0], skipped[-1][0] + 1, None, skipped)
+
+def _mostly_other_field_counts(source: RowSource, sample_bytes: int) -> bool:
+    """Whether most records at the start of source have another number of fields than the header.
+
+    pyarrow hands each such record to the invalid row handler, which is several times slower
+    than the row parser, so these inputs are left to it. Streams that cannot seek back are not sampled.
+    """
+    if isinstance(source, CsvSource):
+        with source.path.open("rb") as f:
+            sample = decompressing(f, source.compression).read(sample_bytes)
+    elif isinstance(source, CsvStreamSource) and not isinstance(source.stream, io.TextIOBase) and source.compression is None:
+        stream = cast(IO[bytes], source.stream)
+        if not stream.seekable():
+            return False
+        position = stream.tell()
+        sample = stream.read(sample_bytes)
+        stream.seek(position)
+    else:
+        return False
+    # The last line of the sample may be cut short
+    records = [fields for fields in csv.reader(sample.decode(errors="replace").splitlines()[:-1]) if fields]
+    if len(records) < 2:
+        return False
+    return 2 * sum(len(fields) != len(records[0]) for fields in records[1:]) > len(records) - 1
+
+def _row_chunks(
+    source: RowSource,
+    config: Config,
+    age_limit: AgeLimit,
+    on_malformed: Optional[RejectHandler],
+    counts: Optional[ValueCounts] = None,
+) -> Iterator[tuple[int, list[Banner], list[Reject]]]:
+    error_of = customer_validator(age_limit, config)
+    customers = source.row(on_malformed)
+    if counts is not None:
+        customers = counts.counting(customers)
+    while True:
+        chunk = list(itertools.islice(customers, ROW_CHUNK))
+        if not chunk:
+            return
+        banners: list[Banner] = []
+        rejects: list[Reject] = []
+        for customer in chunk:
+            error = error_of(customer)
+            if error is None:
+                banners.append(Banner(customer.cookie, customer.banner_id))
+            else:
+                rejects.append(Reject.for_customer(customer, error))
+        yield len(chunk), banners, rejects
+
+def _binary_input(source: RowSource, stack: ExitStack, path_ok: bool = True) -> "str | IO[bytes]":
+    if isinstance(source, CsvSource):
+        if path_ok:
+            # pyarrow decompresses .gz and .zst paths itself
+            return str(source.path)
+        return stack.enter_context(decompressing(stack.enter_context(source.path.open("rb")), source.compression))
+    if isinstance(source, CsvStreamSource) and not isinstance(source.stream, io.TextIOBase):
+        return decompressing(cast(IO[bytes], source.stream), source.compression)
+    raise ValueError(f"The columnar engine cannot read {source.name}")
+
+class _LineNumbers(io.RawIOBase):
+    """Binary input read by pyarrow that keeps track of line numbers for malformed records.
+
+    pyarrow skips blank lines and numbers the remaining records from 1, the header. The line
+    of record n is n plus the blank lines before it, so only the blank lines are recorded, by
+    the number of records before each.
+    """
+    def __init__(self, f: IO[bytes]):
+        self._f = f
+        self._newlines = 0
+        self._tail = b""
+        self._blank_after: list[int] = []
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: "bytearray | memoryview") -> int:  # type: ignore[override]
+        data = self._f.read(len(buffer))
+        buffer[:len(data)] = data
+        # The tail of the previous read finds blank lines across reads
+        text = self._tail + data
+        newlines_before = self._newlines - self._tail.count(b"\n")
+        for match in _BLANK_LINE.finditer(text):
+            if match.end() >= len(self._tail):
+                line = newlines_before + text.count(b"\n", 0, match.end()) + 1
+                self._blank_after.append(line - 1 - len(self._blank_after))
+        self._newlines += data.count(b"\n")
+        self._tail = text[-2:]
+        return len(data)
+
+    def line(self, record: int) -> int:
+        """Line of the record pyarrow numbers record."""
+        return record + bisect.bisect_right(self._blank_after, record - 1)
+
+class _SkippedRecords:
+    """Records pyarrow could not split into the header's columns, by their record number.
+
+    skip is the invalid_row_handler, so these records are left out of the batches, and advance
+    tells which record numbers the next batch covers, so take can merge them back in order.
+    """
+    def __init__(self):
+        self._skipped: list[int] = []
+        self._pending: list[tuple[int, str]] = []
+        self._consumed = 0
+        # Record number of the next row pyarrow returns; 1 is the header
+        self._next = 2
+
+    def skip(self, row: "pa_csv.InvalidRow") -> str:
+        bisect.insort(self._skipped, row.number)
+        self._pending.append((row.number, row.text))
+        return "skip"
+
+    def advance(self, rows: int) -> tuple[int, int]:
+        """Range of record numbers spanned by the next rows rows pyarrow returns, with the skipped ones among them."""
+        start = end = self._next
+        while rows:
+            end += rows
+            # Each skipped record within the range pushes its end one further
+            consumed = bisect.bisect_left(self._skipped, end, self._consumed)
+            rows, self._consumed = consumed - self._consumed, consumed
+        self._next = end
+        return start, end
+
+    def take(self, end: Optional[int] = None) -> list[tuple[int, list[str]]]:
+        """Skipped records numbered below end, else all of them, with their fields, in file order."""
+        self._pending.sort()
+        count = len(self._pending) if end is None else bisect.bisect_left(self._pending, (end, ""))
+        taken, self._pending = self._pending[:count], self._pending[count:]
+        return [(number, next(csv.reader([text]), [])) for number, text in taken]
+
+class _RowParser:
+    """Validates records one by one, like the row engine: the fallback for blocks pyarrow cannot validate as columns."""
+    def __init__(
+        self,
+        header: list[str],
+        config: Config,
+        age_limit: AgeLimit,
+        on_malformed: Optional[RejectHandler],
+        lines: Optional[_LineNumbers],
+        counts: Optional[ValueCounts] = None,
+    ):
+        self._header = header
+        # The last of repeated column names wins, as in the row engine
+        positions = {name: i for i, name in enumerate(header)}
+        self._positions = [positions[name] for name in Customer.header()]
+        self._error_of = customer_validator(age_limit, config)
+        self._on_malformed = on_malformed
+        self._lines = lines
+        self._counts = counts
+
+    def validate(
+        self,
+        start: int,
+        end: int,
+        batch: "Optional[pa.RecordBatch]",
+        skipped: list[tuple[int, list[str]]],
+    ) -> tuple[int, list[Banner], list[Reject]]:
+        """Validate records start to end, the rows of batch with the skipped records merged in."""
+        rows = iter(batch.select(Customer.header()).to_pylist() if batch is not None else [])
+        fields_of = dict(skipped)
+        name_at, age_at, cookie_at, banner_id_at = self._positions
+        rows_read = 0
+        banners: list[Banner] = []
+        rejects: list[Reject] = []
+        for record in range(start, end):
+            fields = fields_of.get(record)
+            try:
+                if fields is None:
+                    row = next(rows)
+                    customer = parse_customer(row)
+                else:
+                    customer = Customer(fields[name_at].strip(), int(fields[age_at]), fields[cookie_at].strip(), int(fields[banner_id_at]))
+            except (IndexError, ValueError) as e:
+                if fields is not None:
+                    row = _row_dict(self._header, fields)
+                if self._on_malformed is None:
+                    raise ValueError(f"Invalid row: {row}") from e
+                line = self._lines.line(record) if self._lines is not None else record
+                self._on_malformed(Reject(line=line, reason=malformed_reason(row), row=row))
+                continue
+            rows_read += 1
+            if self._counts is not None:
+                self._counts.add(customer)
+            error = self._error_of(customer)
+            if error is None:
+                banners.append(Banner(customer.cookie, customer.banner_id))
+            else:
+                rejects.append(Reject.for_customer(customer, error))
+        return rows_read, banners, rejects
+
+def _validate_batch(
+    batch: "pa.RecordBatch",
+    config: Config,
+    age_limit: AgeLimit,
+    start: int,
+    rows: _RowParser,
+    counts: Optional[ValueCounts] = None,
+) -> tuple[int, list[Banner], list[Reject]]:
+    names = pc.utf8_trim_whitespace(batch.column("Name"))
+    cookies = pc.utf8_trim_whitespace(batch.column("Cookie"))
+    try:
+        ages = pc.cast(batch.column("Age"), pa.int64())
+        banner_ids = pc.cast(batch.column("Banner_id"), pa.int64())
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        # Numbers Python's int() would parse differently (e.g. " 30") or reject
+        return rows.validate(start, start + batch.num_rows, batch, [])
+    if counts is not None:
+        for values, counter in ((ages, counts.ages), (banner_ids, counts.banner_ids)):
+            counter.update({entry["values"]: entry["counts"] for entry in pc.value_counts(values).to_pylist()})
+
+    valid = pc.and_(
+        pc.and_(
+            pc.match_substring_regex(names, _NAME_RE.pattern),
+            pc.and_(pc.greater_equal(ages, age_limit.min_age), pc.less_equal(ages, age_limit.max_age)),
+        ),
+        pc.and_(pc.greater_equal(banner_ids, config.min_banner_id), pc.less_equal(banner_ids, config.max_banner_id)),
+    )
+    banners = [
+        Banner(visitor_cookie=cookie, banner_id=banner_id)
+        for cookie, banner_id in zip(cookies.filter(valid).to_pylist(), banner_ids.filter(valid).to_pylist())
+    ]
+
+    invalid = pc.invert(valid)
+    error_of = customer_validator(age_limit, config)
+    rejects = []
+    for fields in zip(*(column.filter(invalid).to_pylist() for column in (names, ages, cookies, banner_ids))):
+        customer = Customer(*fields)
+        rejects.append(Reject.for_customer(customer, cast(str, error_of(customer))))
+    return batch.num_rows, banners, rejects
@@ -1,6 +1,10 @@
 import os
 from dataclasses import dataclass
 
+FALLBACK_STRATEGIES = ("single", "bisect")
+VALIDATION_ENGINES = ("python", "columnar")
+REQUEST_COMPRESSIONS = ("none", "gzip", "zstd")
+
 
 @dataclass(frozen=True)
 class Config:
@@ -14,6 +18,36 @@ class Config:
     max_retries: int
     retry_backoff_seconds: int
     bulk_batch_size: int
+    max_in_flight_batches: int = 4
+    max_concurrent_uploads: int = 2
+    state_dir: str = ".showads"
+    job_workers: int = 2
+    token_refresh_margin_seconds: int = 300
+    http_pool_size: int = 10
+    http_keepalive_seconds: float = 30.0
+    fallback_concurrency: int = 8
+    fallback_rate_per_second: float = 50.0
+    fallback_retry_budget: int = 20
+    fallback_strategy: str = "single"
+    dedup_ttl_seconds: int = 86400
+    rejects_retention_seconds: int = 86400
+    validation_engine: str = "python"
+    parse_workers: int = 1
+    skip_malformed_rows: bool = False
+    reject_log_interval: int = 100000
+    adaptive_batching: bool = False
+    min_bulk_batch_size: int = 100
+    max_bulk_batch_size: int = 5000
+    bulk_latency_target_seconds: float = 2.0
+    max_linger_seconds: float = 1.0
+    retry_backoff_cap_seconds: float = 30.0
+    request_deadline_seconds: float = 120.0
+    run_deadline_seconds: float = 0.0
+    circuit_breaker_threshold: int = 10
+    circuit_breaker_reset_seconds: float = 30.0
+    outbox_enabled: bool = True
+    request_compression: str = "none"
+    profiles_file: str = ""
     
     @classmethod
     def load(cls) -> "Config":
@@ -22,6 +56,16 @@ class Config:
         if not api_base_url:
             raise ValueError("SHOWADS_BASE_URL is not set in the environment variables")
 
+        fallback_strategy = os.getenv("FALLBACK_STRATEGY", "single")
+        if fallback_strategy not in FALLBACK_STRATEGIES:
+            raise ValueError(f"FALLBACK_STRATEGY must be one of {', '.join(FALLBACK_STRATEGIES)}")
+        validation_engine = os.getenv("VALIDATION_ENGINE", "python")
+        if validation_engine not in VALIDATION_ENGINES:
+            raise ValueError(f"VALIDATION_ENGINE must be one of {', '.join(VALIDATION_ENGINES)}")
+        request_compression = os.getenv("REQUEST_COMPRESSION", "none")
+        if request_compression not in REQUEST_COMPRESSIONS:
+            raise ValueError(f"REQUEST_COMPRESSION must be one of {', '.join(REQUEST_COMPRESSIONS)}")
+
         return cls(
             api_base_url=api_base_url,
             project_key=os.getenv("SHOWADS_PROJECT_KEY", "dev-key"),
@@ -31,4 +75,34 @@ class Config:
             max_retries=int(os.getenv("MAX_RETRIES", "5")),
             retry_backoff_seconds=int(os.getenv("RETRY_BACKOFF_SECONDS", "2")),
             bulk_batch_size=int(os.getenv("BULK_BATCH_SIZE", "1000")),
+            max_in_flight_batches=int(os.getenv("MAX_IN_FLIGHT_BATCHES", "4")),
+            max_concurrent_uploads=int(os.getenv("MAX_CONCURRENT_UPLOADS", "2")),
+            state_dir=os.getenv("STATE_DIR", ".showads"),
+            job_workers=int(os.getenv("JOB_WORKERS", "2")),
+            token_refresh_margin_seconds=int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300")),
+            http_pool_size=int(os.getenv("HTTP_POOL_SIZE", "10")),
+            http_keepalive_seconds=float(os.getenv("HTTP_KEEPALIVE_SECONDS", "30")),
+            fallback_concurrency=int(os.getenv("FALLBACK_CONCURRENCY", "8")),
+            fallback_rate_per_second=float(os.getenv("FALLBACK_RATE_PER_SECOND", "50")),
+            fallback_retry_budget=int(os.getenv("FALLBACK_RETRY_BUDGET", "20")),
+            fallback_strategy=fallback_strategy,
+            dedup_ttl_seconds=int(os.getenv("DEDUP_TTL_SECONDS", "86400")),
+            rejects_retention_seconds=int(os.getenv("REJECTS_RETENTION_SECONDS", "86400")),
+            validation_engine=validation_engine,
+            parse_workers=int(os.getenv("PARSE_WORKERS", "1")),
+            skip_malformed_rows=os.getenv("SKIP_MALFORMED_ROWS", "false").lower() in ("1", "true", "yes"),
+            reject_log_interval=int(os.getenv("REJECT_LOG_INTERVAL", "100000")),
+            adaptive_batching=os.getenv("ADAPTIVE_BATCHING", "false").lower() in ("1", "true", "yes"),
+            min_bulk_batch_size=int(os.getenv("MIN_BULK_BATCH_SIZE", "100")),
+            max_bulk_batch_size=int(os.getenv("MAX_BULK_BATCH_SIZE", "5000")),
+            bulk_latency_target_seconds=float(os.getenv("BULK_LATENCY_TARGET_SECONDS", "2")),
+            max_linger_seconds=float(os.getenv("MAX_LINGER_SECONDS", "1")),
+            retry_backoff_cap_seconds=float(os.getenv("RETRY_BACKOFF_CAP_SECONDS", "30")),
+            request_deadline_seconds=float(os.getenv("REQUEST_DEADLINE_SECONDS", "120")),
+            run_deadline_seconds=float(os.getenv("RUN_DEADLINE_SECONDS", "0")),
+            circuit_breaker_threshold=int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "10")),
+            circuit_breaker_reset_seconds=float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "30")),
+            outbox_enabled=os.getenv("OUTBOX_ENABLED", "true").lower() in ("1", "true", "yes"),
+            request_compression=request_compression,
+            profiles_file=os.getenv("PROFILES_FILE", ""),
         )
@@ -1,34 +1,362 @@
 import csv
-from dataclasses import dataclass
+import glob
+import gzip
+import io
+import time
+from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Iterator, cast
+from typing import IO, Callable, Iterable, Iterator, Optional, Protocol, cast
 
 from .models import Customer
 
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the environment
+    zstandard = None
+
+# Compressed inputs, by file name suffix
+COMPRESSIONS = {".gz": "gzip", ".zst": "zstd"}
+CSV_SUFFIXES = (".csv", *(f".csv{suffix}" for suffix in COMPRESSIONS))
+
+
+@dataclass(frozen=True)
+class Reject:
+    """A CSV record that was skipped: malformed, or a customer that failed validation.
+
+    line is known for malformed records only; invalid customers are identified by their fields.
+    """
+    line: Optional[int]
+    reason: str
+    row: dict[str, Optional[str]]
+
+    @classmethod
+    def for_customer(cls, customer: Customer, reason: str) -> "Reject":
+        return cls(
+            line=None,
+            reason=reason,
+            row={
+                "Name": customer.name,
+                "Age": str(customer.age),
+                "Cookie": customer.cookie,
+                "Banner_id": str(customer.banner_id),
+            },
+        )
+
+
+RejectHandler = Callable[[Reject], None]
+
+
+class RowSource(Protocol):
+    @property
+    def name(self) -> str: ...
+
+    def row(self, on_malformed: Optional[RejectHandler] = None) -> Iterator[Customer]: ...
+
+
+def compression_of(name: str) -> Optional[str]:
+    """Compression implied by a file name: gzip for .gz, zstd for .zst, None otherwise."""
+    return COMPRESSIONS.get(Path(name).suffix.lower())
+
+
+def check_compression(compression: Optional[str]) -> None:
+    """Raise RuntimeError when input with this compression cannot be read here."""
+    if compression == "zstd" and zstandard is None:
+        raise RuntimeError("zstd input needs zstandard: pip install zstandard")
+
+
+def decompressing(f: IO[bytes], compression: Optional[str]) -> IO[bytes]:
+    """Binary stream of f's decompressed content, decompressed as it is read; f itself when not compressed.
+
+    Closing the returned stream leaves f open. Its positions count decompressed bytes,
+    and it can only be read forward.
+    """
+    if compression is None:
+        return f
+    check_compression(compression)
+    if compression == "gzip":
+        return cast(IO[bytes], gzip.GzipFile(fileobj=f, mode="rb"))
+    if compression == "zstd":
+        reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True, closefd=False)
+        return cast(IO[bytes], io.BufferedReader(reader))
+    raise ValueError(f"Unsupported compression: {compression}")
+
 
 @dataclass(frozen=True)
 class CsvSource:
+    """CSV file on disk; .csv.gz and .csv.zst files are decompressed while they are read."""
     path: Path
 
-    def row(self) -> Iterator[Customer]:
-        with self.path.open("r") as f:
-            reader = csv.DictReader(f)
-            expected = set(Customer.header())
-            missing = expected.difference(reader.fieldnames or [])
-            if missing:
-                raise ValueError(f"Missing headers: {missing}")
-            for row in cast(Iterator[dict[str, str]], reader):
-                try:
-                    name = str(row["Name"]).strip()
-                    age = int(row["Age"])
-                    cookie = str(row["Cookie"]).strip()
-                    banner_id = int(row["Banner_id"])
-                except ValueError as e:
-                    raise ValueError(f"Invalid row: {row}") from e
-
-                yield Customer(
-                    name=name,
-                    age=age,
-                    cookie=cookie,
-                    banner_id=banner_id,
-                )
+    @property
+    def name(self) -> str:
+        return str(self.path)
+
+    @property
+    def compression(self) -> Optional[str]:
+        return compression_of(self.path.name)
+
+    def row(self, on_malformed: Optional[RejectHandler] = None) -> Iterator[Customer]:
+        """Yield customers; with on_malformed, records that fail to parse are passed to it and skipped."""
+        if self.compression is None:
+            with self.path.open("r") as f:
+                yield from _parse_rows(f, on_malformed)
+            return
+        with self.path.open("rb") as raw, decompressing(raw, self.compression) as f:
+            yield from _parse_rows(io.TextIOWrapper(f, encoding="utf-8", newline=""), on_malformed)
+
+    def rows_with_offsets(
+        self, start_offset: int = 0, on_malformed: Optional[RejectHandler] = None
+    ) -> Iterator[tuple[Customer, int]]:
+        """Yield each customer with the byte offset just past its record, starting at start_offset.
+
+        Offsets of a compressed file count decompressed bytes.
+        """
+        with self.path.open("rb") as raw, decompressing(raw, self.compression) as f:
+            yield from _parse_rows_with_offsets(f, start_offset, on_malformed=on_malformed, seekable=self.compression is None)
+
+
+@dataclass(frozen=True)
+class CsvFiles:
+    """Rows of several CSV files, one file after the other, delivered as one run."""
+    sources: tuple[CsvSource, ...]
+
+    @classmethod
+    def of(cls, paths: Iterable[Path]) -> "CsvFiles":
+        return cls(tuple(CsvSource(path) for path in paths))
+
+    @property
+    def name(self) -> str:
+        return f"{len(self.sources)} files"
+
+    def row(self, on_malformed: Optional[RejectHandler] = None) -> Iterator[Customer]:
+        for source in self.sources:
+            yield from source.row(on_malformed)
+
+
+def expand_paths(patterns: Iterable[str]) -> list[Path]:
+    """Files named by paths, glob patterns or directories (their CSV_SUFFIXES files), sorted within each pattern.
+
+    A file named twice is only listed once. Paths that do not exist are kept, so opening
+    them reports the error.
+    """
+    paths: dict[Path, None] = {}
+    for pattern in patterns:
+        if Path(pattern).is_dir():
+            matches = sorted(
+                path for path in Path(pattern).iterdir() if path.name.lower().endswith(CSV_SUFFIXES) and path.is_file()
+            )
+        elif glob.has_magic(pattern):
+            matches = sorted(Path(match) for match in glob.glob(pattern) if Path(match).is_file())
+        else:
+            matches = [Path(pattern)]
+        paths.update(dict.fromkeys(matches))
+    return list(paths)
+
+
+@dataclass(frozen=True)
+class CsvStreamSource:
+    """CSV rows read from an already open binary or text stream.
+
+    The stream is consumed lazily, so rows are yielded as soon as their bytes arrive, and
+    a compressed binary stream is decompressed on the fly. The stream is not closed.
+    A live stream (stdin, a pipe, a followed file) may deliver rows slowly, so its partial
+    batches are sent after config.max_linger_seconds.
+    """
+    stream: IO[bytes] | IO[str]
+    label: str = "<stream>"
+    encoding: str = "utf-8"
+    live: bool = False
+    compression: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.label
+
+    def row(self, on_malformed: Optional[RejectHandler] = None) -> Iterator[Customer]:
+        if isinstance(self.stream, io.TextIOBase):
+            yield from _parse_rows(cast(IO[str], self.stream), on_malformed)
+            return
+        stream = decompressing(cast(IO[bytes], self.stream), self.compression)
+        text = io.TextIOWrapper(stream, encoding=self.encoding, newline="")
+        try:
+            yield from _parse_rows(text, on_malformed)
+        finally:
+            # Leave the caller's stream open
+            text.detach()
+
+    def rows_with_offsets(
+        self, start_offset: int = 0, on_malformed: Optional[RejectHandler] = None
+    ) -> Iterator[tuple[Customer, int]]:
+        """Like CsvSource.rows_with_offsets; needs a seekable binary stream positioned at its start."""
+        if isinstance(self.stream, io.TextIOBase) or not self.stream.seekable():
+            raise ValueError(f"{self.label} does not support byte offsets")
+        stream = decompressing(cast(IO[bytes], self.stream), self.compression)
+        yield from _parse_rows_with_offsets(stream, start_offset, self.encoding, on_malformed, self.compression is None)
+
+
+class ChunkStream(io.RawIOBase):
+    """Read-only binary stream over an iterator of byte chunks, e.g. a request body."""
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: "memoryview | bytearray") -> int:  # type: ignore[override]
+        while not self._pending:
+            chunk: Optional[bytes] = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+class FollowStream(io.RawIOBase):
+    """Read-only binary stream over a file that keeps growing, like `tail -f`.
+
+    At end of file, reads wait for more data, checking every poll_seconds, so the stream never ends.
+    """
+    def __init__(self, f: IO[bytes], poll_seconds: float = 0.5):
+        self._f = f
+        self._poll_seconds = poll_seconds
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: "memoryview | bytearray") -> int:  # type: ignore[override]
+        while True:
+            data = self._f.read(len(buffer))
+            if data:
+                buffer[:len(data)] = data
+                return len(data)
+            time.sleep(self._poll_seconds)
+
+    def close(self) -> None:
+        self._f.close()
+        super().close()
+
+
+class _OffsetLines:
+    """Decoded lines of a binary file that remember how many bytes were consumed.
+
+    The header line is always read first; data lines then continue from start_offset, which
+    a seekable file seeks to and a decompressed stream reads up to. With count_skipped,
+    skipped_lines counts the lines jumped over, so line numbers stay absolute.
+    """
+    def __init__(self, f: IO[bytes], start_offset: int, encoding: str, seekable: bool, count_skipped: bool):
+        self._f = f
+        self._start_offset = start_offset
+        self._encoding = encoding
+        self._seekable = seekable
+        self._count_skipped = count_skipped
+        self.offset = f.tell()
+        self.skipped_lines = 0
+
+    def __iter__(self) -> Iterator[str]:
+        header = self._f.readline()
+        self.offset += len(header)
+        yield header.decode(self._encoding)
+        if self._start_offset > self.offset:
+            if self._count_skipped or not self._seekable:
+                self.skipped_lines = count_lines(self._f, self._start_offset - self.offset)
+            else:
+                self._f.seek(self._start_offset)
+            self.offset = self._start_offset
+        for line in self._f:
+            self.offset += len(line)
+            yield line.decode(self._encoding)
+
+
+def count_lines(f: IO[bytes], size: int) -> int:
+    """Count the newlines in the next size bytes of f."""
+    lines = 0
+    while size > 0:
+        chunk = f.read(min(size, 1 << 20))
+        if not chunk:
+            break
+        lines += chunk.count(b"\n")
+        size -= len(chunk)
+    return lines
+
+
+def _parse_rows_with_offsets(
+    f: IO[bytes],
+    start_offset: int,
+    encoding: str = "utf-8",
+    on_malformed: Optional[RejectHandler] = None,
+    seekable: bool = True,
+) -> Iterator[tuple[Customer, int]]:
+    # Line numbers are only needed to report malformed records
+    lines = _OffsetLines(f, start_offset, encoding, seekable, count_skipped=on_malformed is not None)
+
+    def report(reject: Reject) -> None:
+        cast(RejectHandler, on_malformed)(replace(reject, line=reject.line + lines.skipped_lines))
+
+    # csv pulls lines lazily, so after each record lines.offset is the end of that record
+    for customer in _parse_rows(lines, report if on_malformed is not None else None):
+        yield customer, lines.offset
+
+
+def _parse_rows(lines: Iterable[str], on_malformed: Optional[RejectHandler] = None) -> Iterator[Customer]:
+    """Parse records by field position; a dict of the record is only built when it is malformed."""
+    reader = csv.reader(lines)
+    header = next(reader, [])
+    missing = set(Customer.header()).difference(header)
+    if missing:
+        raise ValueError(f"Missing headers: {missing}")
+    # The last of repeated column names wins, as with csv.DictReader
+    positions = {name: i for i, name in enumerate(header)}
+    name_at, age_at, cookie_at, banner_id_at = (positions[name] for name in Customer.header())
+    for fields in reader:
+        if not fields:
+            continue
+        try:
+            customer = Customer(fields[name_at].strip(), int(fields[age_at]), fields[cookie_at].strip(), int(fields[banner_id_at]))
+        except (IndexError, ValueError) as e:
+            row = _row_dict(header, fields)
+            if on_malformed is None:
+                raise ValueError(f"Invalid row: {row}") from e
+            on_malformed(Reject(line=reader.line_num, reason=malformed_reason(row), row=row))
+            continue
+        yield customer
+
+
+def _row_dict(header: list[str], fields: list[str]) -> dict[str, Optional[str]]:
+    """Fields of a record by column name, None for the columns it lacks."""
+    row: dict[str, Optional[str]] = dict.fromkeys(header)
+    row.update(zip(header, fields))
+    return row
+
+
+def malformed_reason(row: dict[str, Optional[str]]) -> str:
+    """Why parse_customer rejects row."""
+    for field in ("Age", "Banner_id"):
+        value = row.get(field)
+        if value is None:
+            return f"malformed row: missing {field}"
+        try:
+            int(value)
+        except ValueError:
+            return f"malformed row: {field} is not an integer (got {value!r})"
+    return "malformed row"
+
+
+def parse_customer(row: dict[str, str]) -> Customer:
+    """Build a Customer from raw CSV fields, raising ValueError for missing or non-integer numbers."""
+    try:
+        name = str(row["Name"]).strip()
+        age = int(row["Age"])
+        cookie = str(row["Cookie"]).strip()
+        banner_id = int(row["Banner_id"])
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid row: {row}") from e
+
+    return Customer(
+        name=name,
+        age=age,
+        cookie=cookie,
+        banner_id=banner_id,
+    )
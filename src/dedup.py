@@ -0,0 +1,73 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .models import Banner
+
+# Keeps IN (...) queries below SQLite's bound parameter limit
+_QUERY_CHUNK = 500
+
+def banner_key(banner: Banner) -> int:
+    """Signed 64-bit hash of a (cookie, banner id) pair, compact enough to index millions of pairs."""
+    digest = hashlib.blake2b(f"{banner.visitor_cookie}\x1f{banner.banner_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+class DedupIndex:
+    """Filters out banners already queued in this run or delivered within ttl_seconds.
+
+    Both sets live in SQLite on disk (the run set in a TEMP table), so memory stays
+    bounded however large the input is. Delivered pairs older than the TTL are purged
+    when the index is opened. One index serves one run at a time.
+    """
+    def __init__(self, db_path: Path, ttl_seconds: int):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS delivered (key INTEGER PRIMARY KEY, delivered_at REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS delivered_at_idx ON delivered (delivered_at)")
+            self._conn.execute("CREATE TEMP TABLE queued (key INTEGER PRIMARY KEY)")
+            self._conn.execute("DELETE FROM delivered WHERE delivered_at < ?", (time.time() - ttl_seconds,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def filter_new(self, banners: list[Banner]) -> list[Banner]:
+        """Return the banners not seen before, and remember them as queued for this run."""
+        keys = [banner_key(banner) for banner in banners]
+        cutoff = time.time() - self._ttl_seconds
+        with self._lock, self._conn:
+            seen: set[int] = set()
+            unique = list(set(keys))
+            for i in range(0, len(unique), _QUERY_CHUNK):
+                chunk = unique[i:i + _QUERY_CHUNK]
+                placeholders = ", ".join("?" for _ in chunk)
+                seen.update(row[0] for row in self._conn.execute(f"SELECT key FROM queued WHERE key IN ({placeholders})", chunk))
+                seen.update(row[0] for row in self._conn.execute(
+                    f"SELECT key FROM delivered WHERE key IN ({placeholders}) AND delivered_at >= ?", [*chunk, cutoff]
+                ))
+            fresh: list[Banner] = []
+            fresh_keys: list[tuple[int]] = []
+            for banner, key in zip(banners, keys):
+                if key in seen:
+                    continue
+                # Also drops repeats within this call
+                seen.add(key)
+                fresh.append(banner)
+                fresh_keys.append((key,))
+            self._conn.executemany("INSERT INTO queued (key) VALUES (?)", fresh_keys)
+        return fresh
+
+    def mark_delivered(self, banners: list[Banner]) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO delivered (key, delivered_at) VALUES (?, ?)",
+                [(banner_key(banner), now) for banner in banners],
+            )
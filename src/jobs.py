@@ -0,0 +1,427 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from enum import Enum
+from pathlib import Path
+from typing import Optional, cast
+
+from .async_showads_client import AsyncShowAdsClient
+from .checkpoint import Checkpoint, CheckpointStore
+from .config import Config
+from .csv_loader import compression_of
+from .models import AgeLimit
+from .outbox import Outbox
+from .processor import ProcessingCancelled, ProcessStats, process_csv, process_csv_async
+from .profiles import DEFAULT_PROFILE, ProfileRegistry
+from .rejects import RejectSink, rejects_path
+from .showads_client import ShowAdsClient
+
+logger = logging.getLogger(__name__)
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def is_finished(self) -> bool:
+        return self in (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+@dataclass(frozen=True)
+class Job:
+    id: str
+    status: JobStatus
+    filename: str
+    input_path: str
+    min_age: int
+    max_age: int
+    use_async: bool
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    rows_read: int = 0
+    valid: int = 0
+    invalid: int = 0
+    banners_sent: int = 0
+    banners_failed: int = 0
+    profile: str = DEFAULT_PROFILE
+    skip_malformed: bool = False
+
+    def rows_per_second(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return self.rows_read / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self) -> dict[str, object]:
+        data = asdict(self)
+        del data["input_path"]
+        data["status"] = self.status.value
+        data["rows_per_second"] = round(self.rows_per_second(), 2)
+        return data
+
+_COLUMNS = [
+    "id", "status", "filename", "input_path", "min_age", "max_age", "use_async",
+    "created_at", "started_at", "finished_at", "error",
+    "rows_read", "valid", "invalid", "banners_sent", "banners_failed", "profile", "skip_malformed",
+]
+
+class JobStore:
+    """SQLite-backed persistence for jobs, shared by the API and job workers."""
+    def __init__(self, db_path: Path):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    input_path TEXT NOT NULL,
+                    min_age INTEGER NOT NULL,
+                    max_age INTEGER NOT NULL,
+                    use_async INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    error TEXT,
+                    rows_read INTEGER NOT NULL DEFAULT 0,
+                    valid INTEGER NOT NULL DEFAULT 0,
+                    invalid INTEGER NOT NULL DEFAULT 0,
+                    banners_sent INTEGER NOT NULL DEFAULT 0,
+                    banners_failed INTEGER NOT NULL DEFAULT 0,
+                    profile TEXT NOT NULL DEFAULT 'default',
+                    skip_malformed INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            # Stores created before profiles and skip_malformed existed
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "profile" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN profile TEXT NOT NULL DEFAULT 'default'")
+            if "skip_malformed" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN skip_malformed INTEGER NOT NULL DEFAULT 0")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def save(self, job: Job) -> None:
+        values = [getattr(job, column) for column in _COLUMNS]
+        values[_COLUMNS.index("status")] = job.status.value
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute(f"INSERT OR REPLACE INTO jobs ({', '.join(_COLUMNS)}) VALUES ({placeholders})", values)
+
+    def save_if(self, job: Job, status: JobStatus) -> bool:
+        """Save job only if its stored status is still status; returns whether it was saved."""
+        values = [getattr(job, column) for column in _COLUMNS]
+        values[_COLUMNS.index("status")] = job.status.value
+        assignments = ", ".join(f"{column} = ?" for column in _COLUMNS)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND status = ?", values + [job.id, status.value]
+            )
+        return cursor.rowcount == 1
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._from_row(row) if row else None
+
+    def unfinished(self) -> list[Job]:
+        statuses = (JobStatus.QUEUED.value, JobStatus.RUNNING.value)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE status IN (?, ?) ORDER BY created_at", statuses
+            ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    @staticmethod
+    def _from_row(row: tuple[object, ...]) -> Job:
+        data = dict(zip(_COLUMNS, row))
+        data["status"] = JobStatus(data["status"])
+        data["use_async"] = bool(data["use_async"])
+        data["skip_malformed"] = bool(data["skip_malformed"])
+        return Job(**data)  # type: ignore[arg-type]
+
+class JobManager:
+    """Runs CSV processing jobs on a pool of background workers.
+
+    Progress of running jobs is tracked in memory and written to the store when a
+    job finishes. Jobs left queued or running by a previous process are requeued
+    by recover(). With a checkpoint store, a requeued job resumes after the last batch
+    it delivered. Async jobs run on loop with async_client when both are given,
+    otherwise on a private event loop and client. With profiles, each job runs with the
+    config, clients and outbox of its profile instead.
+    """
+    def __init__(
+        self,
+        config: Config,
+        store: JobStore,
+        client: ShowAdsClient,
+        async_client: Optional[AsyncShowAdsClient] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        checkpoints: Optional[CheckpointStore] = None,
+        outbox: Optional[Outbox] = None,
+        profiles: Optional[ProfileRegistry] = None,
+    ):
+        self._config = config
+        self._profiles = profiles
+        self._store = store
+        self._checkpoints = checkpoints
+        self._outbox = outbox
+        self._client = client
+        self._async_client = async_client
+        self._loop = loop
+        self._uploads_dir = Path(config.state_dir) / "uploads"
+        self._uploads_dir.mkdir(parents=True, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, config.job_workers), thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._live: dict[str, ProcessStats] = {}
+        self._cancel: dict[str, threading.Event] = {}
+        self._stopping = False
+
+    def input_path_for(self, job_id: str, filename: str = "") -> Path:
+        """Where the upload of a job is kept; compressed uploads keep their suffix and stay compressed."""
+        suffix = Path(filename).suffix.lower() if compression_of(filename) else ""
+        return self._uploads_dir / f"{job_id}.csv{suffix}"
+
+    def new_job_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def submit(
+        self,
+        job_id: str,
+        filename: str,
+        age_limit: AgeLimit,
+        use_async: bool = False,
+        profile: str = DEFAULT_PROFILE,
+        skip_malformed: bool = False,
+    ) -> Job:
+        """Queue a job whose input was already written to input_path_for(job_id, filename).
+
+        With skip_malformed, records that cannot be parsed are rejected instead of failing the job.
+        """
+        job = Job(
+            id=job_id,
+            status=JobStatus.QUEUED,
+            filename=filename,
+            input_path=str(self.input_path_for(job_id, filename)),
+            min_age=age_limit.min_age,
+            max_age=age_limit.max_age,
+            use_async=use_async,
+            created_at=time.time(),
+            profile=profile,
+            skip_malformed=skip_malformed,
+        )
+        self._store.save(job)
+        self._enqueue(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        job = self._store.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            stats = self._live.get(job_id)
+        if stats is not None and job.status == JobStatus.RUNNING:
+            job = self._with_stats(job, stats)
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a job: a queued one at once, a running one when its worker reaches the next batch."""
+        with self._lock:
+            job = self._store.get(job_id)
+            if job is None or job.status.is_finished():
+                return job
+            event = self._cancel.get(job_id)
+            if event is not None:
+                event.set()
+            # Only a job no worker has started yet; _run starts a job with the same compare-and-set
+            never_started = job.status == JobStatus.QUEUED and self._store.save_if(
+                replace(job, status=JobStatus.CANCELLED, finished_at=time.time()), JobStatus.QUEUED
+            )
+        if never_started:
+            self._remove_input(job)
+        return self.get(job_id)
+
+    def recover(self) -> int:
+        """Requeue jobs interrupted by a restart. Returns the number of requeued jobs."""
+        requeued = 0
+        for job in self._store.unfinished():
+            if not Path(job.input_path).exists():
+                self._store.save(replace(job, status=JobStatus.FAILED, finished_at=time.time(), error="Input file is missing"))
+                continue
+            job = replace(job, status=JobStatus.QUEUED, started_at=None)
+            self._store.save(job)
+            self._enqueue(job)
+            requeued += 1
+        if requeued:
+            logger.info(f"Requeued {requeued} unfinished jobs")
+        return requeued
+
+    def shutdown(self) -> None:
+        """Stop workers. Interrupted jobs stay queued and are picked up again by recover()."""
+        with self._lock:
+            self._stopping = True
+            events = list(self._cancel.values())
+        for event in events:
+            event.set()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _enqueue(self, job: Job) -> None:
+        with self._lock:
+            self._cancel[job.id] = threading.Event()
+        self._executor.submit(self._run, job.id)
+
+    def _run(self, job_id: str) -> None:
+        stats = ProcessStats()
+        with self._lock:
+            job = self._store.get(job_id)
+            cancel = self._cancel.get(job_id)
+            started = (
+                job is not None
+                and job.status == JobStatus.QUEUED
+                and cancel is not None
+                and not cancel.is_set()
+                and self._store.save_if(replace(job, status=JobStatus.RUNNING, started_at=stats.started_at), JobStatus.QUEUED)
+            )
+            if started:
+                self._live[job_id] = stats
+        if not started:
+            self._forget(job_id)
+            return
+        job = replace(cast(Job, job), status=JobStatus.RUNNING, started_at=stats.started_at)
+        logger.info(f"Job {job_id} started: {job.filename}")
+
+        age_limit = AgeLimit(min_age=job.min_age, max_age=job.max_age)
+        checkpoint = Checkpoint(self._checkpoints, f"job:{job_id}") if self._checkpoints is not None else None
+        # A resumed job keeps the rejects written before the restart
+        rejects = RejectSink(rejects_path(self._config.state_dir, job_id), append=True)
+        try:
+            config, client, async_client, outbox = self._resources(job)
+            if job.use_async:
+                self._run_async(job, config, async_client, outbox, age_limit, stats, cancel, checkpoint, rejects)
+            else:
+                process_csv(
+                    job.input_path,
+                    config,
+                    age_limit,
+                    client,
+                    stats,
+                    cancel,
+                    checkpoint,
+                    on_reject=rejects.write,
+                    outbox=outbox,
+                )
+            job = replace(self._with_stats(job, stats), status=JobStatus.SUCCEEDED)
+        except ProcessingCancelled:
+            if self._stopping:
+                self._store.save(replace(job, status=JobStatus.QUEUED, started_at=None))
+                self._forget(job_id)
+                logger.info(f"Job {job_id} interrupted by shutdown, will be requeued")
+                return
+            job = replace(self._with_stats(job, stats), status=JobStatus.CANCELLED)
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed")
+            job = replace(self._with_stats(job, stats), status=JobStatus.FAILED, error=str(e))
+        finally:
+            rejects.close()
+
+        job = replace(job, finished_at=time.time())
+        self._store.save(job)
+        if checkpoint is not None:
+            checkpoint.clear()
+        self._forget(job_id)
+        self._remove_input(job)
+        logger.info(f"Job {job_id} {job.status.value}: {job.valid} valid, {job.invalid} invalid")
+
+    def _resources(self, job: Job) -> tuple[Config, ShowAdsClient, Optional[AsyncShowAdsClient], Optional[Outbox]]:
+        """Config, clients and outbox a job runs with: those of its profile when profiles are set."""
+        if self._profiles is None:
+            return self._run_config(self._config, job), self._client, self._async_client, self._outbox
+        profile = self._profiles.get(job.profile)
+        if profile is None:
+            raise ValueError(f"Unknown profile: {job.profile}")
+        async_client = self._profiles.async_client(profile) if self._loop is not None else None
+        return self._run_config(profile.config, job), self._profiles.client(profile), async_client, self._profiles.outbox(profile)
+
+    @staticmethod
+    def _run_config(config: Config, job: Job) -> Config:
+        return replace(config, skip_malformed_rows=True) if job.skip_malformed else config
+
+    def _run_async(
+        self,
+        job: Job,
+        config: Config,
+        async_client: Optional[AsyncShowAdsClient],
+        outbox: Optional[Outbox],
+        age_limit: AgeLimit,
+        stats: ProcessStats,
+        cancel: threading.Event,
+        checkpoint: Optional[Checkpoint],
+        rejects: RejectSink,
+    ) -> None:
+        if async_client is not None and self._loop is not None:
+            run = process_csv_async(
+                job.input_path,
+                config,
+                age_limit,
+                async_client,
+                stats,
+                cancel,
+                checkpoint,
+                on_reject=rejects.write,
+                outbox=outbox,
+            )
+            asyncio.run_coroutine_threadsafe(run, self._loop).result()
+            return
+
+        async def run_with_own_client() -> None:
+            async with AsyncShowAdsClient(config) as client:
+                await process_csv_async(
+                    job.input_path,
+                    config,
+                    age_limit,
+                    client,
+                    stats,
+                    cancel,
+                    checkpoint,
+                    on_reject=rejects.write,
+                    outbox=outbox,
+                )
+
+        asyncio.run(run_with_own_client())
+
+    def _forget(self, job_id: str) -> None:
+        with self._lock:
+            self._live.pop(job_id, None)
+            self._cancel.pop(job_id, None)
+
+    @staticmethod
+    def _with_stats(job: Job, stats: ProcessStats) -> Job:
+        return replace(
+            job,
+            rows_read=stats.rows_read,
+            valid=stats.valid,
+            invalid=stats.invalid,
+            banners_sent=stats.banners_sent,
+            banners_failed=stats.banners_failed,
+        )
+
+    @staticmethod
+    def _remove_input(job: Job) -> None:
+        try:
+            Path(job.input_path).unlink(missing_ok=True)
+        except OSError:
+            pass
@@ -0,0 +1,72 @@
+"""Prometheus metrics of the connector, shared by the API, the CLI and background jobs.
+
+Row counters are exported in per-batch deltas by the processor, so the per-row path
+never touches a metric.
+"""
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram, generate_latest, write_to_textfile
+
+ROWS_PARSED = Counter("showads_rows_parsed", "CSV rows read")
+ROWS_VALID = Counter("showads_rows_valid", "CSV rows that passed validation")
+ROWS_INVALID = Counter("showads_rows_invalid", "CSV rows rejected, by reason", ["reason"])
+BANNERS_SENT = Counter("showads_banners_sent", "Banners accepted by ShowAds")
+BANNERS_FAILED = Counter("showads_banners_failed", "Banners that could not be delivered")
+BULK_FAILURES = Counter("showads_bulk_failures", "Bulk requests that failed and fell back")
+FALLBACK_REQUESTS = Counter("showads_fallback_requests", "Requests spent on fallback after failed bulk requests", ["strategy"])
+
+PARSE_SECONDS = Histogram(
+    "showads_csv_parse_seconds",
+    "Time spent reading and validating the rows of one batch",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HTTP_SECONDS = Histogram("showads_http_request_seconds", "ShowAds HTTP request latency", ["endpoint"])
+HTTP_REQUEST_BYTES = Counter("showads_http_request_bytes", "ShowAds HTTP request body bytes sent", ["endpoint"])
+HTTP_RESPONSES = Counter("showads_http_responses", "ShowAds HTTP responses, by status or error", ["endpoint", "status"])
+RETRY_SLEEP_SECONDS = Histogram(
+    "showads_retry_sleep_seconds",
+    "Time spent waiting before a retry",
+    ["reason"],
+    buckets=(0.1, 0.5, 1, 2, 4, 8, 16, 30, 60),
+)
+HTTP_IN_FLIGHT = Gauge("showads_http_in_flight_requests", "ShowAds HTTP requests in progress", ["endpoint"])
+BULK_BATCH_SIZE = Gauge("showads_bulk_batch_size", "Current number of banners per bulk request")
+TOKEN_AGE = Gauge("showads_token_age_seconds", "Age of the most recently obtained access token")
+
+_token_obtained_at = 0.0
+TOKEN_AGE.set_function(lambda: time.time() - _token_obtained_at if _token_obtained_at else 0.0)
+
+def token_obtained() -> None:
+    global _token_obtained_at
+    _token_obtained_at = time.time()
+
+@contextmanager
+def http_request(endpoint: str, body_bytes: int = 0) -> Iterator[None]:
+    """Track latency, body size and in-flight count of one HTTP request to endpoint (its URL path)."""
+    if body_bytes:
+        HTTP_REQUEST_BYTES.labels(endpoint).inc(body_bytes)
+    in_flight = HTTP_IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        HTTP_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+        in_flight.dec()
+
+def http_response(endpoint: str, status: int | str) -> None:
+    HTTP_RESPONSES.labels(endpoint, str(status)).inc()
+
+def retry_sleep(reason: str, seconds: float) -> None:
+    RETRY_SLEEP_SECONDS.labels(reason).observe(seconds)
+
+def exposition() -> bytes:
+    """All metrics in the Prometheus text format."""
+    return generate_latest(REGISTRY)
+
+def write_textfile(path: Path) -> None:
+    """Dump all metrics to path, e.g. for the node exporter textfile collector."""
+    write_to_textfile(str(path), REGISTRY)
@@ -1,7 +1,10 @@
-from dataclasses import dataclass
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
 
 
-@dataclass(frozen=True)
+# Slotted records: no per-instance __dict__, as millions of them pass through a run
+@dataclass(frozen=True, slots=True)
 class Customer:
     name: str
     age: int
@@ -20,11 +23,31 @@ class AgeLimit:
     def is_valid(self, age: int) -> bool:
         return self.min_age <= age <= self.max_age
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Banner:
     visitor_cookie: str
     banner_id: int
 
     @classmethod
     def from_customer(cls, customer: Customer) -> "Banner":
-        return cls(visitor_cookie=customer.cookie, banner_id=customer.banner_id)
+        return cls(customer.cookie, customer.banner_id)
+
+@dataclass
+class ValueCounts:
+    """Number of parsed customers by age and by banner id, valid or not."""
+    ages: Counter[int] = field(default_factory=Counter)
+    banner_ids: Counter[int] = field(default_factory=Counter)
+
+    def add(self, customer: Customer) -> None:
+        self.ages[customer.age] += 1
+        self.banner_ids[customer.banner_id] += 1
+
+    def update(self, other: "ValueCounts") -> None:
+        self.ages.update(other.ages)
+        self.banner_ids.update(other.banner_ids)
+
+    def counting(self, customers: Iterable[Customer]) -> Iterator[Customer]:
+        """Yield customers, counting each on the way."""
+        for customer in customers:
+            self.add(customer)
+            yield customer
@@ -0,0 +1,98 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+from .models import Banner
+
+class Outbox:
+    """Durable dead-letter queue of banners that could not be delivered, kept in SQLite.
+
+    Banners are added after a run gave up on them and removed once a replay delivers them.
+    The database is only created when the first banner is added or read, so runs without
+    failures leave nothing on disk.
+    """
+    def __init__(self, db_path: Path):
+        self._db_path = db_path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self._db_path), check_same_thread=False, timeout=30)
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS dead_letters (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        visitor_cookie TEXT NOT NULL,
+                        banner_id INTEGER NOT NULL,
+                        source TEXT NOT NULL,
+                        failed_at REAL NOT NULL,
+                        replays INTEGER NOT NULL DEFAULT 0
+                    )
+                    """
+                )
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def add(self, banners: list[Banner], source: str) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO dead_letters (visitor_cookie, banner_id, source, failed_at) VALUES (?, ?, ?, ?)",
+                    [(banner.visitor_cookie, banner.banner_id, source, now) for banner in banners],
+                )
+
+    def count(self) -> int:
+        if self._conn is None and not self._db_path.exists():
+            return 0
+        with self._lock:
+            return int(self._connection().execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0])
+
+    def batches(self, size: int) -> Iterator[list[tuple[int, Banner]]]:
+        """Yield the queued banners with their ids, oldest first, size at a time.
+
+        Paging by id, so banners removed or re-failed while iterating are not seen twice.
+        """
+        if self._conn is None and not self._db_path.exists():
+            return
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._connection().execute(
+                    "SELECT id, visitor_cookie, banner_id FROM dead_letters WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, size),
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [(row[0], Banner(visitor_cookie=row[1], banner_id=row[2])) for row in rows]
+
+    def remove(self, ids: list[int]) -> None:
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany("DELETE FROM dead_letters WHERE id = ?", [(id_,) for id_ in ids])
+
+    def mark_replayed(self, ids: list[int]) -> None:
+        """Count another failed replay of these banners."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany("UPDATE dead_letters SET replays = replays + 1 WHERE id = ?", [(id_,) for id_ in ids])
+
+def outbox_path(state_dir: str) -> Path:
+    return Path(state_dir) / "outbox.sqlite3"
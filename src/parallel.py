@@ -0,0 +1,194 @@
+"""Parallel validation of a CSV file split into newline-aligned byte ranges.
+
+Each range is parsed and validated in a worker process. Results come back in file
+order, so the delivery stage sees banners in the same order as a serial run.
+Ranges end on newlines outside quoted fields, told apart by the parity of the quotes
+before them, so quotes must enclose whole fields as in RFC 4180.
+"""
+import csv
+import io
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Iterator, Optional, cast
+
+from . import columnar
+from .config import Config
+from .csv_loader import CsvSource, CsvStreamSource, Reject, RejectHandler, count_lines
+from .models import AgeLimit, Banner, Customer, ValueCounts
+from .validation import customer_validator
+
+RANGE_BYTES = 4 << 20
+
+class NotSplittable(Exception):
+    """Raised before any result when a file cannot be validated in worker processes; validate it serially instead."""
+
+@dataclass(frozen=True)
+class RangeResult:
+    """Validation output of the rows in [start, end).
+
+    Valid banners are kept as plain columns, which are much cheaper to send between processes.
+    Malformed records are numbered from the start of the range, whose header is line 1.
+    counts holds the ages and banner ids of the rows read when they were asked for.
+    """
+    end: int
+    rows_read: int
+    cookies: list[str]
+    banner_ids: list[int]
+    invalid: list[Reject]
+    lines: int = 0
+    malformed: list[Reject] = field(default_factory=list)
+    counts: Optional[ValueCounts] = None
+
+    def banners(self) -> list[Banner]:
+        return [Banner(visitor_cookie=cookie, banner_id=banner_id) for cookie, banner_id in zip(self.cookies, self.banner_ids)]
+
+    @classmethod
+    def of(
+        cls,
+        end: int,
+        rows_read: int,
+        banners: list[Banner],
+        invalid: list[Reject],
+        lines: int,
+        malformed: list[Reject],
+        counts: Optional[ValueCounts] = None,
+    ) -> "RangeResult":
+        cookies = [b.visitor_cookie for b in banners]
+        return cls(end, rows_read, cookies, [b.banner_id for b in banners], invalid, lines, malformed, counts)
+
+def byte_ranges(path: Path, range_bytes: int = RANGE_BYTES, start_offset: int = 0) -> list[tuple[int, int]]:
+    """Split the data lines of path, from start_offset on, into [start, end) ranges ending on a newline.
+
+    A range only ends after an even number of quotes, so a quoted field with line breaks stays
+    within one range. Raises NotSplittable when the quotes do not pair up by the end of the file.
+    """
+    with path.open("rb") as f:
+        header = f.readline()
+        size = f.seek(0, os.SEEK_END)
+        start = max(len(header), start_offset)
+        f.seek(start)
+        ranges = []
+        while start < size:
+            quotes = f.read(max(1, range_bytes) - 1).count(b'"') + f.readline().count(b'"')
+            while quotes % 2:
+                line = f.readline()
+                if not line:
+                    raise NotSplittable(f"{path} has a quote that is never closed")
+                quotes += line.count(b'"')
+            end = f.tell()
+            ranges.append((start, end))
+            start = end
+        return ranges
+
+def validated_ranges(
+    source: CsvSource,
+    config: Config,
+    age_limit: AgeLimit,
+    workers: int,
+    start_offset: int = 0,
+    range_bytes: int = RANGE_BYTES,
+    on_malformed: Optional[RejectHandler] = None,
+    counts: Optional[ValueCounts] = None,
+) -> Iterator[RangeResult]:
+    """Validate source in a pool of worker processes, yielding one result per range in file order.
+
+    At most 2 * workers ranges are in progress or waiting to be consumed at any time.
+    With on_malformed, records that fail to parse are passed to it with their line in the file.
+    With counts, the ages and banner ids of all rows read are counted in it.
+    Workers are spawned, so they import the caller's main module again: a script must run
+    this under `if __name__ == "__main__":`. Otherwise the workers cannot start, and
+    NotSplittable is raised before any result.
+    """
+    _check_header(source.path)
+    all_ranges = byte_ranges(source.path, range_bytes, start_offset)
+    ranges = iter(all_ranges)
+    lines_before = _lines_before(source.path, all_ranges[0][0]) if all_ranges else 0
+    tolerant = on_malformed is not None
+    counting = counts is not None
+    # Forking would copy the caller's threads and locks (API workers, client sessions) into the workers
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        pending: deque[Future[RangeResult]] = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(_validate_range, source.path, start, end, config, age_limit, tolerant, counting))
+            if len(pending) >= 2 * workers:
+                break
+        first = True
+        while pending:
+            try:
+                result = pending.popleft().result()
+            except BrokenProcessPool as e:
+                if not first:
+                    raise
+                raise NotSplittable("Parse workers could not start; is the main module guarded by `if __name__ == \"__main__\"`?") from e
+            first = False
+            next_range = next(ranges, None)
+            if next_range is not None:
+                pending.append(pool.submit(_validate_range, source.path, *next_range, config, age_limit, tolerant, counting))
+            for reject in result.malformed:
+                cast(RejectHandler, on_malformed)(replace(reject, line=reject.line - 1 + lines_before))
+            lines_before += result.lines
+            if counts is not None and result.counts is not None:
+                counts.update(result.counts)
+            yield result
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+def _check_header(path: Path) -> None:
+    with path.open("r", newline="") as f:
+        header = next(csv.reader(f), [])
+    missing = set(Customer.header()).difference(header)
+    if missing:
+        raise ValueError(f"Missing headers: {missing}")
+
+def _lines_before(path: Path, offset: int) -> int:
+    with path.open("rb") as f:
+        return count_lines(f, offset)
+
+def _validate_range(
+    path: Path, start: int, end: int, config: Config, age_limit: AgeLimit, tolerant: bool, counting: bool = False
+) -> RangeResult:
+    with path.open("rb") as f:
+        header = f.readline()
+        f.seek(start)
+        data = f.read(end - start)
+    source = CsvStreamSource(io.BytesIO(header + data), label=f"{path}[{start}:{end}]")
+    malformed: list[Reject] = []
+    on_malformed = malformed.append if tolerant else None
+    lines = data.count(b"\n")
+    counts = ValueCounts() if counting else None
+
+    if config.validation_engine == "columnar":
+        rows_read = 0
+        banners: list[Banner] = []
+        invalid: list[Reject] = []
+        chunks = columnar.validated_chunks(source, config, age_limit, on_malformed=on_malformed, counts=counts)
+        for chunk_rows, chunk_banners, chunk_invalid in chunks:
+            rows_read += chunk_rows
+            banners.extend(chunk_banners)
+            invalid.extend(chunk_invalid)
+        return RangeResult.of(end, rows_read, banners, invalid, lines, malformed, counts)
+
+    error_of = customer_validator(age_limit, config)
+    rows_read = 0
+    cookies: list[str] = []
+    banner_ids: list[int] = []
+    invalid = []
+    customers = source.row(on_malformed)
+    if counts is not None:
+        customers = counts.counting(customers)
+    # Valid rows go straight into the columns of the result, without a Banner each
+    for customer in customers:
+        rows_read += 1
+        error = error_of(customer)
+        if error is None:
+            cookies.append(customer.cookie)
+            banner_ids.append(customer.banner_id)
+        else:
+            invalid.append(Reject.for_customer(customer, error))
+    return RangeResult(end, rows_read, cookies, banner_ids, invalid, lines, malformed, counts)
@@ -1,49 +1,1015 @@
+import asyncio
+import itertools
 import logging
+import math
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
+from typing import Callable, Iterator, Optional, cast
 
+from . import columnar, metrics, parallel
+from .async_showads_client import AsyncShowAdsClient
+from .batching import AdaptiveBatchSize
+from .checkpoint import Checkpoint
 from .config import Config
-from .csv_loader import CsvSource
-from .models import AgeLimit, Banner
+from .csv_loader import CsvFiles, CsvSource, Reject, RejectHandler, RowSource
+from .dedup import DedupIndex
+from .models import AgeLimit, Banner, Customer, ValueCounts
+from .outbox import Outbox
+from .rate_limit import RetryBudget, TokenBucket
+from .retry import CircuitOpenError, Deadline, DeadlineExceeded
 from .showads_client import ShowAdsClient
-from .validation import validate_customer
+from .validation import customer_validator
 
 logger = logging.getLogger(__name__)
 
-def process_csv(path: str, config: Config, age_limit: AgeLimit, client: ShowAdsClient) -> tuple[int, int]:
-    source = CsvSource(Path(path))
+# How often a live source waiting for input checks whether the run was asked to stop
+STOP_POLL_SECONDS = 0.1
 
-    logger.info(f"Processing CSV file: {path}")
+class ProcessingCancelled(Exception):
+    """Raised when a run is stopped through its cancel event."""
 
+@dataclass
+class ProcessStats:
+    """Live counters of a run, updated in place while the CSV is processed."""
+    rows_read: int = 0
+    valid: int = 0
+    invalid: int = 0
+    banners_sent: int = 0
+    banners_failed: int = 0
+    # Logical requests (retries excluded), to compare fallback strategies
+    bulk_requests: int = 0
+    single_requests: int = 0
+    fallback_requests: int = 0
+    # Valid rows skipped because their (cookie, banner id) pair was already sent
+    duplicates: int = 0
+    # Records that could not be parsed, also counted as invalid
+    malformed: int = 0
+    # Failed banners kept in the outbox for a later replay
+    dead_lettered: int = 0
+    started_at: float = field(default_factory=time.time)
+    # Per-file counts of a run over several files
+    files: list["FileSummary"] = field(default_factory=list)
+
+    def counts(self) -> dict[str, int]:
+        return {name: value for name, value in asdict(self).items() if name not in ("started_at", "files")}
+
+@dataclass
+class FileSummary:
+    """What happened to the rows of one file in a run over several files."""
+    path: str
+    rows_read: int = 0
+    valid: int = 0
+    invalid: int = 0
+    malformed: int = 0
+    banners_sent: int = 0
+    banners_failed: int = 0
+
+    @property
+    def duplicates(self) -> int:
+        """Valid rows that were not sent; exact once the run is over."""
+        return self.valid - self.banners_sent - self.banners_failed
+
+class _FileTally:
+    """Attributes the counts of a multi-file run to its files, while batches span file boundaries.
+
+    Row counts are taken from the run stats whenever the reader moves to the next file.
+    Each batch remembers how many of its banners came from each file, so delivery results
+    are attributed even when batches finish out of order.
+    """
+    def __init__(self, stats: ProcessStats):
+        self._stats = stats
+        self._mark = self._snapshot()
+        self._shares: dict[int, list[tuple[FileSummary, int]]] = {}
+        self.current: Optional[FileSummary] = None
+
+    def _snapshot(self) -> tuple[int, int, int, int]:
+        return self._stats.rows_read, self._stats.valid, self._stats.invalid, self._stats.malformed
+
+    def start(self, path: str) -> None:
+        self.finish()
+        self.current = FileSummary(path)
+        self._stats.files.append(self.current)
+
+    def finish(self) -> None:
+        """Close the row counts of the current file."""
+        if self.current is None:
+            return
+        now = self._snapshot()
+        rows_read, valid, invalid, malformed = (end - start for start, end in zip(self._mark, now))
+        self.current.rows_read += rows_read
+        self.current.valid += valid
+        self.current.invalid += invalid
+        self.current.malformed += malformed
+        self._mark = now
+
+    def batch(self, batch: list[Banner], shares: list[tuple[FileSummary, int]]) -> None:
+        """Record that batch holds, in order, the given number of banners of each file."""
+        if batch:
+            self._shares[id(batch)] = shares
+
+    def delivered(self, batch: list[Banner], failed: list[Banner]) -> list[tuple[str, list[Banner]]]:
+        """Count the delivery of batch per file, returning the failed banners of each file."""
+        # Fallbacks return the banners of the batch itself, so identity tells them apart
+        failed_ids = {id(banner) for banner in failed}
+        failed_by_file: list[tuple[str, list[Banner]]] = []
+        start = 0
+        for summary, count in self._shares.pop(id(batch), []):
+            lost = [banner for banner in batch[start:start + count] if id(banner) in failed_ids] if failed_ids else []
+            summary.banners_sent += count - len(lost)
+            summary.banners_failed += len(lost)
+            if lost:
+                failed_by_file.append((summary.path, lost))
+            start += count
+        return failed_by_file
+
+@dataclass
+class ValidationReport:
+    """Outcome of a dry run: what a run would send, without sending anything.
+
+    ages and banner_ids count every parsed row, valid or not, by value.
+    """
+    rows_read: int
+    valid: int
+    invalid: int
+    malformed: int
+    reasons: dict[str, int]
+    ages: dict[int, int]
+    banner_ids: dict[int, int]
+    bulk_batch_size: int
+
+    @property
+    def bulk_requests(self) -> int:
+        """Bulk requests a run would send, batches being filled across files."""
+        return math.ceil(self.valid / max(1, self.bulk_batch_size))
+
+    def to_dict(self) -> dict[str, object]:
+        return {**asdict(self), "bulk_requests": self.bulk_requests}
+
+class _Rejects:
+    """Counts rejected rows, hands them to on_reject and logs aggregated reasons.
+
+    Rows are not logged one by one: counts per reason are logged every
+    config.reject_log_interval rows read and once at the end of the run.
+    """
+    def __init__(self, config: Config, stats: ProcessStats, on_reject: Optional[RejectHandler]):
+        self._stats = stats
+        self._on_reject = on_reject
+        self._interval = max(1, config.reject_log_interval)
+        self._next_log = self._interval
+        self.reasons: Counter[str] = Counter()
+
+    def invalid(self, reject: Reject) -> None:
+        self._count(reject.reason)
+        if self._on_reject is not None:
+            self._on_reject(reject)
+
+    def invalid_customer(self, customer: Customer, reason: str) -> None:
+        # Only build the reject when someone consumes it
+        self._count(reason)
+        if self._on_reject is not None:
+            self._on_reject(Reject.for_customer(customer, reason))
+
+    def malformed(self, reject: Reject) -> None:
+        self._stats.rows_read += 1
+        self._stats.malformed += 1
+        self.invalid(reject)
+
+    def _count(self, reason: str) -> None:
+        self._stats.invalid += 1
+        # Group by reason without the offending value
+        self.reasons[reason.split(" (got ", 1)[0]] += 1
+
+    def progress(self) -> None:
+        if self._stats.rows_read >= self._next_log:
+            self.log()
+            self._next_log = (self._stats.rows_read // self._interval + 1) * self._interval
+
+    def log(self) -> None:
+        if self.reasons:
+            reasons = "; ".join(f"{reason} ({count})" for reason, count in self.reasons.most_common())
+            logger.warning(f"Rejected {self._stats.invalid} of {self._stats.rows_read} rows: {reasons}")
+
+class _RowMetrics:
+    """Exports row counters and parse time in per-batch deltas, keeping metrics off the per-row path."""
+    def __init__(self, stats: ProcessStats, rejects: _Rejects):
+        self._stats = stats
+        self._rejects = rejects
+        self._rows_read = stats.rows_read
+        self._valid = stats.valid
+        self._reasons: Counter[str] = Counter()
+        self._started = time.perf_counter()
+
+    def flush(self) -> None:
+        """Export what changed since the last flush; call before handing out a batch."""
+        metrics.PARSE_SECONDS.observe(time.perf_counter() - self._started)
+        metrics.ROWS_PARSED.inc(self._stats.rows_read - self._rows_read)
+        metrics.ROWS_VALID.inc(self._stats.valid - self._valid)
+        self._rows_read, self._valid = self._stats.rows_read, self._stats.valid
+        # Copied first: a live source updates the reasons from its reader thread
+        for reason, count in list(self._rejects.reasons.items()):
+            if count != self._reasons[reason]:
+                metrics.ROWS_INVALID.labels(reason).inc(count - self._reasons[reason])
+                self._reasons[reason] = count
+
+    def resume(self) -> None:
+        """Start timing the next batch once the consumer asks for it."""
+        self._started = time.perf_counter()
+
+@dataclass(frozen=True)
+class _Delivery:
+    """State shared by all batches of one run."""
+    config: Config
+    stats: ProcessStats
+    limiter: Optional[TokenBucket]
+    batch_size: AdaptiveBatchSize
+    dedup: Optional[DedupIndex] = None
+    # Requests stop retrying at the run deadline, and no batch starts after it
+    deadline: Optional[Deadline] = None
+    outbox: Optional[Outbox] = None
+    source: str = ""
+    files: Optional[_FileTally] = None
+
+    def retry_budget(self, retries: int) -> RetryBudget:
+        return RetryBudget(retries, self.deadline)
+
+    def check_deadline(self) -> None:
+        if self.deadline is not None and self.deadline.expired():
+            raise DeadlineExceeded(f"Run did not finish within {self.deadline.seconds:g}s")
+
+def process_csv(
+    path: str,
+    config: Config,
+    age_limit: AgeLimit,
+    client: ShowAdsClient,
+    stats: Optional[ProcessStats] = None,
+    cancel: Optional[threading.Event] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    dedup: Optional[DedupIndex] = None,
+    on_reject: Optional[RejectHandler] = None,
+    outbox: Optional[Outbox] = None,
+) -> tuple[int, int]:
+    return process_source(
+        CsvSource(Path(path)), config, age_limit, client, stats, cancel, checkpoint, dedup, on_reject, outbox
+    )
+
+async def process_csv_async(
+    path: str,
+    config: Config,
+    age_limit: AgeLimit,
+    client: AsyncShowAdsClient,
+    stats: Optional[ProcessStats] = None,
+    cancel: Optional[threading.Event] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    dedup: Optional[DedupIndex] = None,
+    on_reject: Optional[RejectHandler] = None,
+    outbox: Optional[Outbox] = None,
+) -> tuple[int, int]:
+    return await process_source_async(
+        CsvSource(Path(path)), config, age_limit, client, stats, cancel, checkpoint, dedup, on_reject, outbox
+    )
+
+def process_source(
+    source: RowSource,
+    config: Config,
+    age_limit: AgeLimit,
+    client: ShowAdsClient,
+    stats: Optional[ProcessStats] = None,
+    cancel: Optional[threading.Event] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    dedup: Optional[DedupIndex] = None,
+    on_reject: Optional[RejectHandler] = None,
+    outbox: Optional[Outbox] = None,
+) -> tuple[int, int]:
+    """Validate customers from any row source and show their banners in bulk.
+
+    With a checkpoint, processing starts at its offset and advances it after each delivered batch.
+    With a dedup index, banners already sent recently are skipped and counted as duplicates.
+    With config.skip_malformed_rows, records that fail to parse are counted as invalid and
+    passed to on_reject instead of aborting the run.
+    With an outbox, banners that could not be delivered are kept there for replay_outbox.
+    With CsvFiles, batches are filled across file boundaries and stats.files gets a
+    FileSummary per file.
+    """
+    stats = stats if stats is not None else ProcessStats()
+
+    logger.info(f"Processing CSV file: {source.name}")
+    _log_resume(checkpoint)
+
+    delivery = _Delivery(
+        config,
+        stats,
+        _fallback_limiter(config),
+        _batch_size(config),
+        dedup,
+        Deadline.after(config.run_deadline_seconds),
+        outbox,
+        source.name,
+        _FileTally(stats) if isinstance(source, CsvFiles) else None,
+    )
+    batches = _batches(
+        source, config, age_limit, stats, cancel, checkpoint, dedup, on_reject, delivery.batch_size, delivery.files
+    )
+    with ThreadPoolExecutor(max_workers=max(1, config.fallback_concurrency), thread_name_prefix="fallback") as pool:
+        for batch, offset in batches:
+            if batch:
+                delivery.check_deadline()
+                failed = _show_banners_with_fallback(client, batch, delivery, pool)
+                _record_delivery(delivery, batch, failed)
+            if checkpoint is not None and offset is not None:
+                checkpoint.advance(offset)
+
+    _log_summary(stats, config)
+
+    return stats.valid, stats.invalid
+
+async def process_source_async(
+    source: RowSource,
+    config: Config,
+    age_limit: AgeLimit,
+    client: AsyncShowAdsClient,
+    stats: Optional[ProcessStats] = None,
+    cancel: Optional[threading.Event] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    dedup: Optional[DedupIndex] = None,
+    on_reject: Optional[RejectHandler] = None,
+    outbox: Optional[Outbox] = None,
+) -> tuple[int, int]:
+    """Like process_source, but keeps up to config.max_in_flight_batches bulk requests in flight.
+
+    The CSV reader waits for a free slot before buffering the next batch, so at most
+    max_in_flight_batches + 1 batches are held in memory at any time. Batches can finish
+    out of order, so the checkpoint only advances past batches whose predecessors are done.
+    When the run is cancelled while a live source waits for input, the buffered banners and
+    the batches in flight are still delivered before CancelledError propagates.
+    """
+    stats = stats if stats is not None else ProcessStats()
+
+    logger.info(f"Processing CSV file: {source.name} ({config.max_in_flight_batches} batches in flight)")
+    _log_resume(checkpoint)
+
+    slots = asyncio.Semaphore(max(1, config.max_in_flight_batches))
+    in_flight: set["asyncio.Task[None]"] = set()
+    delivery = _Delivery(
+        config,
+        stats,
+        _fallback_limiter(config),
+        _batch_size(config),
+        dedup,
+        Deadline.after(config.run_deadline_seconds),
+        outbox,
+        source.name,
+        _FileTally(stats) if isinstance(source, CsvFiles) else None,
+    )
+    # Shared by all in-flight batches, so concurrent fallbacks stay within the limit
+    fallback_slots = asyncio.Semaphore(max(1, config.fallback_concurrency))
+    finished: dict[int, Optional[int]] = {}
+    next_to_commit = 0
+    # Checkpoint writes run in worker threads; the lock keeps them in commit order
+    saving = asyncio.Lock()
+
+    async def commit(seq: int, offset: Optional[int]) -> None:
+        nonlocal next_to_commit
+        finished[seq] = offset
+        latest = None
+        while next_to_commit in finished:
+            committed = finished.pop(next_to_commit)
+            next_to_commit += 1
+            if committed is not None:
+                latest = committed
+        if checkpoint is not None and latest is not None:
+            async with saving:
+                await asyncio.to_thread(checkpoint.advance, latest)
+
+    async def send(seq: int, batch: list[Banner], offset: Optional[int]) -> None:
+        try:
+            if batch:
+                failed = await _show_banners_with_fallback_async(client, batch, delivery, fallback_slots)
+                # Counted on the event loop; the outbox and dedup writes block, so they run in a thread
+                stored = _count_delivery(delivery, batch, failed)
+                if delivery.outbox is not None or delivery.dedup is not None:
+                    await asyncio.to_thread(_store_delivery, delivery, *stored)
+            await commit(seq, offset)
+        finally:
+            slots.release()
+
+    async def dispatch(seq: int, batch: list[Banner], offset: Optional[int]) -> None:
+        await slots.acquire()
+        if batch:
+            delivery.check_deadline()
+        # Surface failures (e.g. auth errors) without waiting for the whole file
+        for done in [t for t in in_flight if t.done()]:
+            in_flight.discard(done)
+            done.result()
+        in_flight.add(asyncio.create_task(send(seq, batch, offset)))
+
+    stop = threading.Event()
+    batches = _batches(
+        source, config, age_limit, stats, cancel, checkpoint, dedup, on_reject, delivery.batch_size, delivery.files, stop
+    )
+    seqs = itertools.count()
+    # Set once the run is cancelled while following a live source; raised after the drain
+    cancelled: Optional[asyncio.CancelledError] = None
+    try:
+        while True:
+            # Parse the next batch in a worker thread, so slow input never blocks the event loop
+            reading = asyncio.ensure_future(asyncio.to_thread(next, batches, None))
+            try:
+                item = await asyncio.shield(reading)
+            except asyncio.CancelledError as e:
+                if cancelled is not None or not getattr(source, "live", False):
+                    raise
+                # Ctrl-C while following a live source: deliver the lingering batch before exiting
+                cancelled = e
+                stop.set()
+                item = await reading
+            if item is None:
+                break
+            await dispatch(next(seqs), *item)
+        if in_flight:
+            await asyncio.gather(*in_flight)
+    except Exception:
+        if cancelled is None:
+            raise
+        logger.exception("Failed to deliver the buffered banners of the cancelled run")
+    finally:
+        for task in in_flight:
+            task.cancel()
+        # Let cancelled batches finish unwinding, so none outlives the run
+        await asyncio.gather(*in_flight, return_exceptions=True)
+    if cancelled is not None:
+        raise cancelled
+
+    _log_summary(stats, config)
+
+    return stats.valid, stats.invalid
+
+def replay_outbox(
+    outbox: Outbox,
+    config: Config,
+    client: ShowAdsClient,
+    stats: Optional[ProcessStats] = None,
+) -> tuple[int, int]:
+    """Resend the banners of the outbox in bulk, with the usual fallback for failed batches.
+
+    Delivered banners leave the outbox; the others stay for the next replay.
+    Returns the number of banners delivered and still undelivered.
+    """
+    stats = stats if stats is not None else ProcessStats()
+    delivery = _Delivery(config, stats, _fallback_limiter(config), _batch_size(config))
+    with ThreadPoolExecutor(max_workers=max(1, config.fallback_concurrency), thread_name_prefix="fallback") as pool:
+        for entries in outbox.batches(config.bulk_batch_size):
+            batch = [banner for _, banner in entries]
+            failed = _show_banners_with_fallback(client, batch, delivery, pool)
+            _record_delivery(delivery, batch, failed)
+            failed_set = set(failed)
+            outbox.remove([id_ for id_, banner in entries if banner not in failed_set])
+            outbox.mark_replayed([id_ for id_, banner in entries if banner in failed_set])
+    logger.info(f"Replayed outbox: {stats.banners_sent} delivered, {stats.banners_failed} still undelivered")
+    return stats.banners_sent, stats.banners_failed
+
+def validate_source(
+    source: RowSource,
+    config: Config,
+    age_limit: AgeLimit,
+    on_reject: Optional[RejectHandler] = None,
+) -> ValidationReport:
+    """Validate every row of source like a run would, without a ShowAds client.
+
+    A single pass over the rows, with no batching or delivery, so it is cheap enough
+    to run on every incoming file. The rows are validated with the configured engine and
+    config.parse_workers, like a run would. With config.skip_malformed_rows, unparsable
+    records are counted instead of raising ValueError.
+    """
+    stats = ProcessStats()
+    rejects = _Rejects(config, stats, on_reject)
+    counts = ValueCounts()
+    logger.info(f"Validating CSV file: {source.name} (dry run)")
+    if config.validation_engine == "python" and config.parse_workers <= 1:
+        _scan_rows(source, config, age_limit, stats, rejects, counts)
+    else:
+        for _ in _valid_banners(source, config, age_limit, stats, None, rejects, counts=counts):
+            pass
+    report = ValidationReport(
+        rows_read=stats.rows_read,
+        valid=stats.valid,
+        invalid=stats.invalid,
+        malformed=stats.malformed,
+        reasons=dict(rejects.reasons.most_common()),
+        ages=dict(sorted(counts.ages.items())),
+        banner_ids=dict(sorted(counts.banner_ids.items())),
+        bulk_batch_size=config.bulk_batch_size,
+    )
+    logger.info(
+        f"Dry run: {report.valid} valid, {report.invalid} invalid of {report.rows_read} rows, "
+        f"{report.bulk_requests} bulk requests of up to {report.bulk_batch_size} banners"
+    )
+    return report
+
+def _scan_rows(
+    source: RowSource, config: Config, age_limit: AgeLimit, stats: ProcessStats, rejects: _Rejects, counts: ValueCounts
+) -> None:
+    """The row engine of validate_source: counts only, without a Banner per row."""
+    error_of = customer_validator(age_limit, config)
+    ages, banner_ids = counts.ages, counts.banner_ids
+    rows_read = valid = 0
+    for customer in source.row(rejects.malformed if config.skip_malformed_rows else None):
+        rows_read += 1
+        ages[customer.age] += 1
+        banner_ids[customer.banner_id] += 1
+        error = error_of(customer)
+        if error is None:
+            valid += 1
+        else:
+            rejects.invalid_customer(customer, error)
+    # Counted locally on the hot path; malformed records were already added by rejects
+    stats.rows_read += rows_read
+    stats.valid += valid
+    rejects.log()
+
+def _counted(
+    rows: Iterator[tuple[Customer, Optional[int]]], counts: ValueCounts
+) -> Iterator[tuple[Customer, Optional[int]]]:
+    for customer, offset in rows:
+        counts.add(customer)
+        yield customer, offset
+
+def _rows(
+    source: RowSource, checkpoint: Optional[Checkpoint], on_malformed: Optional[RejectHandler] = None
+) -> Iterator[tuple[Customer, Optional[int]]]:
+    if checkpoint is None:
+        return zip(source.row(on_malformed), itertools.repeat(None))
+    rows_with_offsets = getattr(source, "rows_with_offsets", None)
+    if rows_with_offsets is None:
+        raise ValueError(f"{source.name} does not support checkpoints")
+    return cast(Iterator[tuple[Customer, Optional[int]]], rows_with_offsets(checkpoint.offset, on_malformed))
+
+def _batches(
+    source: RowSource,
+    config: Config,
+    age_limit: AgeLimit,
+    stats: ProcessStats,
+    cancel: Optional[threading.Event] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    dedup: Optional[DedupIndex] = None,
+    on_reject: Optional[RejectHandler] = None,
+    batch_size: Optional[AdaptiveBatchSize] = None,
+    files: Optional[_FileTally] = None,
+    stop: Optional[threading.Event] = None,
+) -> Iterator[tuple[list[Banner], Optional[int]]]:
+    """Validate customers from source and yield banners in batches of batch_size.size.
+
+    Without batch_size, batches have config.bulk_batch_size banners. With it, the size of
+    each batch is read when the batch starts filling, so it follows the latest feedback.
+    Each batch comes with the byte offset just past its last row when checkpointing, else None.
+    The last batch may be empty, so the checkpoint still reaches the end of the input.
+    With dedup, candidates are filtered whenever they would fill the batch, so batches
+    stay full and never span rows beyond their offset.
+    Rows of a live source are read by a background thread, and a partial batch is yielded
+    once its first banner has waited config.max_linger_seconds. When such a read is interrupted
+    by Ctrl-C or by setting stop, the banners buffered so far are yielded as a last batch first.
+    With files, each batch is registered with the number of its banners from each file.
+    """
     buffer: list[Banner] = []
-    valid_customers = 0
-    invalid_customers = 0
-    for customer in source.row():
-        is_valid, error_message = validate_customer(customer, age_limit, config)
-        if not is_valid:
-            invalid_customers += 1
-            logger.error(f"Invalid customer skipped: {error_message}")
-            continue
-        banner = Banner.from_customer(customer)
-        buffer.append(banner)
-        valid_customers += 1
-        if len(buffer) >= config.bulk_batch_size:
-            _show_banners_with_fallback(client, buffer)
-            buffer.clear()
-    
+    candidates: list[Banner] = []
+    offset: Optional[int] = None
+    rejects = _Rejects(config, stats, on_reject)
+    row_metrics = _RowMetrics(stats, rejects)
+    sizer = batch_size if batch_size is not None else _batch_size(config)
+    size = sizer.size
+    linger = config.max_linger_seconds if getattr(source, "live", False) else 0
+    deadline = math.inf
+    # Files of the banners buffered before those of `owner`, which start at owner_start
+    shares: list[tuple[FileSummary, int]] = []
+    owner: Optional[FileSummary] = None
+    owner_start = 0
+    interrupted = False
+    items = _valid_banners(source, config, age_limit, stats, checkpoint, rejects, files)
+    if linger > 0:
+        items = _read_ahead(items, lambda: max(0.0, deadline - time.monotonic()) if buffer or candidates else None, stop)
+    try:
+        for banner, offset in items:
+            if banner is not None:
+                if files is not None and files.current is not owner:
+                    # Dedup the previous file's candidates first, so the counts of each file stay exact
+                    if candidates:
+                        _take_new(cast(DedupIndex, dedup), candidates, buffer, stats)
+                    if owner is not None and len(buffer) > owner_start:
+                        shares.append((owner, len(buffer) - owner_start))
+                    owner, owner_start = files.current, len(buffer)
+                if linger and not (buffer or candidates):
+                    deadline = time.monotonic() + linger
+                if dedup is None:
+                    buffer.append(banner)
+                else:
+                    candidates.append(banner)
+                    if len(buffer) + len(candidates) >= size or (linger and time.monotonic() >= deadline):
+                        _take_new(dedup, candidates, buffer, stats)
+            elif candidates and time.monotonic() >= deadline:
+                # The linger timer of a live source fired while candidates were pending
+                _take_new(cast(DedupIndex, dedup), candidates, buffer, stats)
+            if len(buffer) >= size or (linger and buffer and time.monotonic() >= deadline):
+                _check_cancelled(cancel)
+                row_metrics.flush()
+                if files is not None:
+                    files.batch(buffer, _close_shares(shares, owner, len(buffer) - owner_start))
+                    shares, owner_start = [], 0
+                yield buffer, offset
+                row_metrics.resume()
+                buffer = []
+                size = sizer.size
+    except KeyboardInterrupt:
+        if not linger:
+            raise
+        # Deliver the banners of a followed source that were waiting out their linger
+        interrupted = True
+
     # Show remaining banners
-    if buffer:
-        _show_banners_with_fallback(client, buffer)
+    if candidates:
+        _take_new(cast(DedupIndex, dedup), candidates, buffer, stats)
+    _check_cancelled(cancel)
+    row_metrics.flush()
+    if files is not None:
+        files.batch(buffer, _close_shares(shares, owner, len(buffer) - owner_start))
+    if buffer or offset is not None:
+        yield buffer, offset
+    if interrupted:
+        raise KeyboardInterrupt
 
-    logger.info(f"Processed customers: {valid_customers} valid, {invalid_customers} invalid (skipped)")
+def _close_shares(
+    shares: list[tuple[FileSummary, int]], owner: Optional[FileSummary], count: int
+) -> list[tuple[FileSummary, int]]:
+    return shares + [(owner, count)] if owner is not None and count else shares
 
-    return valid_customers, invalid_customers
+def _valid_banners(
+    source: RowSource,
+    config: Config,
+    age_limit: AgeLimit,
+    stats: ProcessStats,
+    checkpoint: Optional[Checkpoint],
+    rejects: _Rejects,
+    files: Optional[_FileTally] = None,
+    counts: Optional[ValueCounts] = None,
+) -> Iterator[tuple[Optional[Banner], Optional[int]]]:
+    """Validate customers from source with the configured engine, yielding the banners of valid ones.
 
-def _show_banners_with_fallback(client: ShowAdsClient, banners: list[Banner]) -> None:
-    """Show banners in bulk, falling back to single banner requests if bulk fails."""
-    if client.show_banners_bulk(banners):
+    With config.parse_workers > 1, uncompressed files are validated in that many processes; a
+    range without valid rows yields a None banner so its offset still reaches the checkpoint.
+    Files the workers cannot validate (see parallel.NotSplittable) are validated serially.
+    Otherwise the columnar engine does not track byte offsets, so checkpointed runs use
+    the row engine.
+    The files of CsvFiles are validated one by one, each with the configured engine.
+    With counts, the ages and banner ids of all parsed customers are counted in it.
+    """
+    if isinstance(source, CsvFiles):
+        for part in source.sources:
+            if files is not None:
+                files.start(part.name)
+            yield from _valid_banners(part, config, age_limit, stats, None, rejects, counts=counts)
+        if files is not None:
+            files.finish()
+        return
+    on_malformed = rejects.malformed if config.skip_malformed_rows else None
+    if config.parse_workers > 1 and isinstance(source, CsvSource) and source.compression is not None:
+        logger.info(f"{source.name} is compressed, validating it in one process")
+    elif config.parse_workers > 1 and isinstance(source, CsvSource):
+        start_offset = checkpoint.offset if checkpoint is not None else 0
+        results = parallel.validated_ranges(
+            source, config, age_limit, config.parse_workers, start_offset, on_malformed=on_malformed, counts=counts
+        )
+        try:
+            for result in results:
+                stats.rows_read += result.rows_read
+                for reject in result.invalid:
+                    rejects.invalid(reject)
+                rejects.progress()
+                banners = result.banners()
+                stats.valid += len(banners)
+                for banner in banners[:-1]:
+                    yield banner, None
+                yield (banners[-1] if banners else None), result.end
+            rejects.log()
+            return
+        except parallel.NotSplittable as e:
+            # Raised before the first result, so nothing was counted or yielded yet
+            logger.warning(f"{e}; validating {source.name} in one process")
+    if config.validation_engine == "columnar" and checkpoint is not None:
+        logger.info("Checkpointed run, validating with the python engine instead of columnar")
+    elif config.validation_engine == "columnar":
+        chunks = columnar.validated_chunks(source, config, age_limit, on_malformed=on_malformed, counts=counts)
+        for rows_read, banners, invalid in chunks:
+            stats.rows_read += rows_read
+            for reject in invalid:
+                rejects.invalid(reject)
+            rejects.progress()
+            for banner in banners:
+                stats.valid += 1
+                yield banner, None
+        rejects.log()
         return
+
+    error_of = customer_validator(age_limit, config)
+    last_offset = sent_offset = None
+    rows = _rows(source, checkpoint, on_malformed)
+    if counts is not None:
+        rows = _counted(rows, counts)
+    for customer, last_offset in rows:
+        stats.rows_read += 1
+        error = error_of(customer)
+        if error is not None:
+            rejects.invalid_customer(customer, error)
+            rejects.progress()
+            continue
+        stats.valid += 1
+        sent_offset = last_offset
+        yield Banner(customer.cookie, customer.banner_id), last_offset
+    if last_offset != sent_offset:
+        # Invalid rows at the end still move the checkpoint, so a resumed run does not read them again
+        yield None, last_offset
+    rejects.log()
+
+def _read_ahead(
+    items: Iterator[tuple[Optional[Banner], Optional[int]]],
+    timeout: Callable[[], Optional[float]],
+    stop: Optional[threading.Event] = None,
+) -> Iterator[tuple[Optional[Banner], Optional[int]]]:
+    """Yield items read by a background thread, and (None, None) whenever timeout() seconds pass without one.
+
+    Lets the batcher flush on time while the source blocks on slow input; timeout() returning
+    None waits for the next item indefinitely. Once stop is set, ends without waiting for more input.
+    """
+    pending: "queue.Queue[object]" = queue.Queue(maxsize=1024)
+    closed = threading.Event()
+    done = object()
+
+    def put(item: object) -> None:
+        while not closed.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def read() -> None:
+        try:
+            for item in items:
+                put(item)
+                if closed.is_set():
+                    return
+        except BaseException as e:
+            put(e)
+        put(done)
+
+    threading.Thread(target=read, name="reader", daemon=True).start()
+    try:
+        while True:
+            if stop is not None and stop.is_set():
+                return
+            wait = timeout()
+            if stop is not None:
+                wait = STOP_POLL_SECONDS if wait is None else min(wait, STOP_POLL_SECONDS)
+            try:
+                item = pending.get(timeout=wait)
+            except queue.Empty:
+                yield None, None
+                continue
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield cast(tuple[Optional[Banner], Optional[int]], item)
+    finally:
+        closed.set()
+
+def _take_new(dedup: DedupIndex, candidates: list[Banner], buffer: list[Banner], stats: ProcessStats) -> None:
+    """Move candidates not seen before into buffer, counting the rest as duplicates."""
+    fresh = dedup.filter_new(candidates)
+    stats.duplicates += len(candidates) - len(fresh)
+    buffer.extend(fresh)
+    candidates.clear()
+
+def _log_resume(checkpoint: Optional[Checkpoint]) -> None:
+    if checkpoint is not None and checkpoint.offset:
+        logger.info(f"Resuming from checkpoint at byte offset {checkpoint.offset}")
+
+def _check_cancelled(cancel: Optional[threading.Event]) -> None:
+    if cancel is not None and cancel.is_set():
+        raise ProcessingCancelled("Processing cancelled")
+
+def _record_delivery(delivery: _Delivery, batch: list[Banner], failed: list[Banner]) -> None:
+    _store_delivery(delivery, *_count_delivery(delivery, batch, failed))
+
+def _count_delivery(
+    delivery: _Delivery, batch: list[Banner], failed: list[Banner]
+) -> tuple[list[tuple[str, list[Banner]]], list[Banner]]:
+    """Count a delivered batch, returning its failed banners by source and the banners that went through."""
+    delivery.stats.banners_sent += len(batch) - len(failed)
+    delivery.stats.banners_failed += len(failed)
+    metrics.BANNERS_SENT.inc(len(batch) - len(failed))
+    failed_by_source = [(delivery.source, failed)]
+    if delivery.files is not None:
+        failed_by_source = delivery.files.delivered(batch, failed)
+    if failed:
+        metrics.BANNERS_FAILED.inc(len(failed))
+        if delivery.outbox is not None:
+            delivery.stats.dead_lettered += len(failed)
+        failed_set = set(failed)
+        batch = [banner for banner in batch if banner not in failed_set]
+    return (failed_by_source if failed else []), batch
+
+def _store_delivery(delivery: _Delivery, failed_by_source: list[tuple[str, list[Banner]]], delivered: list[Banner]) -> None:
+    """Keep failed banners in the outbox and remember delivered ones in the dedup index (SQLite writes)."""
+    if delivery.outbox is not None:
+        for source, banners in failed_by_source:
+            delivery.outbox.add(banners, source)
+    if delivery.dedup is not None:
+        delivery.dedup.mark_delivered(delivered)
+
+def _log_summary(stats: ProcessStats, config: Config) -> None:
+    logger.info(f"Processed customers: {stats.valid} valid, {stats.invalid} invalid (skipped)")
+    logger.info(f"Banners: {stats.banners_sent} delivered, {stats.banners_failed} failed")
+    if stats.dead_lettered:
+        logger.warning(f"Kept {stats.dead_lettered} undelivered banners in the outbox, replay them with `python -m src.cli replay`")
+    if stats.duplicates:
+        logger.info(f"Skipped {stats.duplicates} duplicate banners")
+    logger.info(
+        f"Requests: {stats.bulk_requests} bulk, {stats.single_requests} single, "
+        f"{stats.fallback_requests} spent on {config.fallback_strategy} fallback"
+    )
+    for summary in stats.files:
+        logger.info(
+            f"{summary.path}: {summary.rows_read} rows, {summary.valid} valid, {summary.invalid} invalid, "
+            f"{summary.banners_sent} delivered, {summary.banners_failed} failed"
+        )
+
+def _count_fallback(delivery: _Delivery, requests: int) -> None:
+    delivery.stats.fallback_requests += requests
+    metrics.FALLBACK_REQUESTS.labels(delivery.config.fallback_strategy).inc(requests)
+
+def _batch_size(config: Config) -> AdaptiveBatchSize:
+    """Batch size of a run: adaptive within the configured bounds, else fixed at config.bulk_batch_size."""
+    if config.adaptive_batching:
+        sizer = AdaptiveBatchSize(
+            config.bulk_batch_size,
+            config.min_bulk_batch_size,
+            config.max_bulk_batch_size,
+            config.bulk_latency_target_seconds,
+        )
+    else:
+        size = config.bulk_batch_size
+        sizer = AdaptiveBatchSize(size, size, size, float("inf"))
+    metrics.BULK_BATCH_SIZE.set(sizer.size)
+    return sizer
+
+def _record_bulk(delivery: _Delivery, started: float, ok: bool, budget: RetryBudget) -> None:
+    """Feed the outcome of a batch's bulk request back into the batch size."""
+    size = delivery.batch_size.record(time.perf_counter() - started, ok, retried=budget.spent > 0)
+    metrics.BULK_BATCH_SIZE.set(size)
+
+def _fail_fast(delivery: _Delivery, banners: list[Banner], error: CircuitOpenError) -> list[Banner]:
+    metrics.BULK_FAILURES.inc()
+    logger.error(f"{error}, failing a batch of {len(banners)} banners without retrying")
+    return banners
+
+def _fallback_limiter(config: Config) -> Optional[TokenBucket]:
+    if config.fallback_rate_per_second <= 0:
+        return None
+    return TokenBucket(config.fallback_rate_per_second, burst=max(1, config.fallback_concurrency))
+
+def _show_banners_with_fallback(
+    client: ShowAdsClient,
+    banners: list[Banner],
+    delivery: _Delivery,
+    pool: ThreadPoolExecutor,
+) -> list[Banner]:
+    """Show banners in bulk, falling back to config.fallback_strategy if bulk fails.
+
+    Returns the banners that could not be shown. While the circuit breaker is open,
+    the batch fails at once without fallback.
+    """
+    delivery.stats.bulk_requests += 1
+    # Retries of the bulk request (429, 500, network errors) are seen through its budget
+    bulk_budget = delivery.retry_budget(delivery.config.max_retries)
+    started = time.perf_counter()
+    try:
+        ok = client.show_banners_bulk(banners, retry_budget=bulk_budget)
+    except CircuitOpenError as e:
+        return _fail_fast(delivery, banners, e)
+    _record_bulk(delivery, started, ok, bulk_budget)
+    if ok:
+        return []
+    metrics.BULK_FAILURES.inc()
+    budget = delivery.retry_budget(delivery.config.fallback_retry_budget)
+    if delivery.config.fallback_strategy == "bisect":
+        logger.error("Failed to show banners in bulk, bisecting the batch")
+        return _bisect(client, banners, delivery, budget)
+
     logger.error("Failed to show banners in bulk, falling back to single banner requests")
+    delivery.stats.single_requests += len(banners)
+    _count_fallback(delivery, len(banners))
+
+    def show(banner: Banner) -> bool:
+        # Single requests are rate limited and share one retry budget per batch
+        try:
+            if client.show_banner(banner, rate_limiter=delivery.limiter, retry_budget=budget):
+                return True
+        except CircuitOpenError:
+            return False
+        logger.error(f"Failed to show banner: {banner}")
+        return False
+
+    return [banner for banner, ok in zip(banners, pool.map(show, banners)) if not ok]
+
+def _bisect(client: ShowAdsClient, banners: list[Banner], delivery: _Delivery, budget: RetryBudget) -> list[Banner]:
+    """Resend both halves of a failed batch in bulk, recursing into halves that fail again.
+
+    Isolates k bad banners in O(k log n) requests while good banners still go out in bulk.
+    """
+    if len(banners) == 1:
+        logger.error(f"Failed to show banner: {banners[0]}")
+        return banners
+    failed: list[Banner] = []
+    middle = len(banners) // 2
+    for half in (banners[:middle], banners[middle:]):
+        delivery.stats.bulk_requests += 1
+        _count_fallback(delivery, 1)
+        try:
+            ok = client.show_banners_bulk(half, retry_budget=budget)
+        except CircuitOpenError:
+            failed.extend(half)
+            continue
+        if not ok:
+            failed.extend(_bisect(client, half, delivery, budget))
+    return failed
+
+async def _show_banners_with_fallback_async(
+    client: AsyncShowAdsClient,
+    banners: list[Banner],
+    delivery: _Delivery,
+    slots: asyncio.Semaphore,
+) -> list[Banner]:
+    """Async variant of _show_banners_with_fallback."""
+    delivery.stats.bulk_requests += 1
+    bulk_budget = delivery.retry_budget(delivery.config.max_retries)
+    started = time.perf_counter()
+    try:
+        ok = await client.show_banners_bulk(banners, retry_budget=bulk_budget)
+    except CircuitOpenError as e:
+        return _fail_fast(delivery, banners, e)
+    _record_bulk(delivery, started, ok, bulk_budget)
+    if ok:
+        return []
+    metrics.BULK_FAILURES.inc()
+    budget = delivery.retry_budget(delivery.config.fallback_retry_budget)
+    if delivery.config.fallback_strategy == "bisect":
+        logger.error("Failed to show banners in bulk, bisecting the batch")
+        return await _bisect_async(client, banners, delivery, budget, slots)
+
+    logger.error("Failed to show banners in bulk, falling back to single banner requests")
+    delivery.stats.single_requests += len(banners)
+    _count_fallback(delivery, len(banners))
+
+    async def show(banner: Banner) -> bool:
+        async with slots:
+            try:
+                if await client.show_banner(banner, rate_limiter=delivery.limiter, retry_budget=budget):
+                    return True
+            except CircuitOpenError:
+                return False
+        logger.error(f"Failed to show banner: {banner}")
+        return False
+
+    results = await asyncio.gather(*(show(banner) for banner in banners))
+    return [banner for banner, ok in zip(banners, results) if not ok]
+
+async def _bisect_async(
+    client: AsyncShowAdsClient,
+    banners: list[Banner],
+    delivery: _Delivery,
+    budget: RetryBudget,
+    slots: asyncio.Semaphore,
+) -> list[Banner]:
+    """Async variant of _bisect, sending both halves concurrently."""
+    if len(banners) == 1:
+        logger.error(f"Failed to show banner: {banners[0]}")
+        return banners
+
+    async def resend(half: list[Banner]) -> list[Banner]:
+        delivery.stats.bulk_requests += 1
+        _count_fallback(delivery, 1)
+        async with slots:
+            try:
+                ok = await client.show_banners_bulk(half, retry_budget=budget)
+            except CircuitOpenError:
+                return half
+        if ok:
+            return []
+        return await _bisect_async(client, half, delivery, budget, slots)
 
-    for banner in banners:
-        if not client.show_banner(banner):
-            logger.error(f"Failed to show banner: {banner}")
+    middle = len(banners) // 2
+    first, second = await asyncio.gather(resend(banners[:middle]), resend(banners[middle:]))
+    return first + second
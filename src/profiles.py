@@ -0,0 +1,149 @@
+import json
+import re
+import threading
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .async_showads_client import AsyncShowAdsClient
+from .config import Config
+from .models import AgeLimit
+from .outbox import Outbox, outbox_path
+from .showads_client import ShowAdsClient
+
+DEFAULT_PROFILE = "default"
+# Settings a profile may set; everything else is shared by all profiles of the process
+PROFILE_SETTINGS = ("project_key", "min_banner_id", "max_banner_id", "min_age", "max_age")
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+@dataclass(frozen=True)
+class Profile:
+    """Settings of one tenant: its ShowAds project key, banner id range and age limit.
+
+    Profiles are never changed in place, so a run that took a profile keeps the same
+    settings until it ends, whatever happens to the registry meanwhile.
+    """
+    name: str
+    config: Config
+    age_limit: AgeLimit
+
+    def to_dict(self) -> dict[str, object]:
+        """Public view of the profile, without its project key."""
+        return {
+            "name": self.name,
+            "min_banner_id": self.config.min_banner_id,
+            "max_banner_id": self.config.max_banner_id,
+            "min_age": self.age_limit.min_age,
+            "max_age": self.age_limit.max_age,
+        }
+
+    @classmethod
+    def of(cls, name: str, base: Config, settings: dict[str, object]) -> "Profile":
+        """Profile overriding base with settings (PROFILE_SETTINGS keys).
+
+        Profiles other than the default keep their state (dedup index, outbox) in their own
+        directory under base.state_dir, so tenants never see each other's banners.
+        """
+        if not _NAME_RE.match(name):
+            raise ValueError(f"Invalid profile name {name!r}: use letters, digits, - and _")
+        unknown = set(settings).difference(PROFILE_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown settings for profile {name}: {', '.join(sorted(unknown))}")
+        overrides = {key: value for key, value in settings.items() if key not in ("min_age", "max_age")}
+        if name != DEFAULT_PROFILE:
+            overrides["state_dir"] = str(Path(base.state_dir) / "profiles" / name)
+        defaults = AgeLimit()
+        age_limit = AgeLimit(
+            min_age=int(settings.get("min_age", defaults.min_age)),  # type: ignore[call-overload]
+            max_age=int(settings.get("max_age", defaults.max_age)),  # type: ignore[call-overload]
+        )
+        return cls(name, replace(base, **overrides), age_limit)  # type: ignore[arg-type]
+
+class ProfileRegistry:
+    """In-memory registry of the profiles served by one process, with their ShowAds clients.
+
+    Clients are created on first use and shared by the profiles with the same project key,
+    so each key has one connection pool and one access token.
+    """
+    def __init__(self, profiles: Iterable[Profile]):
+        self._profiles = {profile.name: profile for profile in profiles}
+        self._clients: dict[str, ShowAdsClient] = {}
+        self._async_clients: dict[str, AsyncShowAdsClient] = {}
+        self._outboxes: dict[str, Outbox] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, config: Config) -> "ProfileRegistry":
+        """The default profile from config, plus the profiles of config.profiles_file if set.
+
+        The file maps profile names to PROFILE_SETTINGS, e.g.
+        {"acme": {"project_key": "...", "max_banner_id": 50, "min_age": 21}}.
+        """
+        settings: dict[str, dict[str, object]] = {}
+        if config.profiles_file:
+            with open(config.profiles_file) as f:
+                settings = json.load(f)
+            if not isinstance(settings, dict) or not all(isinstance(value, dict) for value in settings.values()):
+                raise ValueError(f"{config.profiles_file} must map profile names to settings")
+        profiles = [Profile.of(DEFAULT_PROFILE, config, settings.pop(DEFAULT_PROFILE, {}))]
+        profiles += [Profile.of(name, config, values) for name, values in settings.items()]
+        return cls(profiles)
+
+    def get(self, name: str) -> Optional[Profile]:
+        with self._lock:
+            return self._profiles.get(name)
+
+    def all(self) -> list[Profile]:
+        with self._lock:
+            return list(self._profiles.values())
+
+    def set_age_limit(self, name: str, age_limit: AgeLimit) -> Optional[Profile]:
+        """Replace the age limit of a profile; runs already started keep the previous one."""
+        with self._lock:
+            profile = self._profiles.get(name)
+            if profile is None:
+                return None
+            profile = replace(profile, age_limit=AgeLimit(age_limit.min_age, age_limit.max_age))
+            self._profiles[name] = profile
+            return profile
+
+    def client(self, profile: Profile) -> ShowAdsClient:
+        with self._lock:
+            client = self._clients.get(profile.config.project_key)
+            if client is None:
+                client = self._clients[profile.config.project_key] = ShowAdsClient(profile.config)
+            return client
+
+    def async_client(self, profile: Profile) -> AsyncShowAdsClient:
+        with self._lock:
+            client = self._async_clients.get(profile.config.project_key)
+            if client is None:
+                client = self._async_clients[profile.config.project_key] = AsyncShowAdsClient(profile.config)
+            return client
+
+    def outbox(self, profile: Profile) -> Optional[Outbox]:
+        """Outbox of the profile's undelivered banners, None when the outbox is disabled."""
+        if not profile.config.outbox_enabled:
+            return None
+        with self._lock:
+            outbox = self._outboxes.get(profile.config.state_dir)
+            if outbox is None:
+                outbox = self._outboxes[profile.config.state_dir] = Outbox(outbox_path(profile.config.state_dir))
+            return outbox
+
+    def close(self) -> None:
+        """Close the sync clients and outboxes; async clients are closed by aclose()."""
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+            outboxes, self._outboxes = list(self._outboxes.values()), {}
+        for client in clients:
+            client.close()
+        for outbox in outboxes:
+            outbox.close()
+
+    async def aclose(self) -> None:
+        with self._lock:
+            clients, self._async_clients = list(self._async_clients.values()), {}
+        for client in clients:
+            await client.aclose()
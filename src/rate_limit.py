@@ -0,0 +1,68 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+
+from .retry import Deadline
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by threads and coroutines.
+
+    Allows `rate` requests per second on average with bursts of up to `burst`.
+    pause() stops all callers for a while, e.g. for a 429 Retry-After.
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        self._rate = rate
+        self._capacity = float(max(1, burst))
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take one token and return how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def acquire(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RetryBudget:
+    """Thread-safe number of retries shared by all requests of one unit of work.
+
+    With a deadline, requests using the budget also stop retrying once it passes.
+    """
+    def __init__(self, retries: int, deadline: Optional[Deadline] = None):
+        self._retries = retries
+        self._remaining = retries
+        self.deadline = deadline
+        self._lock = threading.Lock()
+
+    @property
+    def spent(self) -> int:
+        return self._retries - self._remaining
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
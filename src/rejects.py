@@ -0,0 +1,87 @@
+import csv
+import json
+import logging
+import time
+from pathlib import Path
+from types import TracebackType
+from typing import IO, Any, Optional
+
+from .csv_loader import Reject
+from .models import Customer
+
+logger = logging.getLogger(__name__)
+
+JSONL_SUFFIXES = (".jsonl", ".ndjson")
+
+class RejectSink:
+    """Buffered writer of rejected records to a CSV or JSON Lines file.
+
+    The format follows the file suffix: .jsonl/.ndjson for JSON Lines, CSV otherwise.
+    Each record holds the line (malformed records only), the reason and the raw fields.
+    The file is only created by the first record, so clean runs leave nothing behind;
+    with append, records are added to an existing file, e.g. when a job resumes.
+    """
+
+    def __init__(self, path: Path, append: bool = False, buffer_size: int = 1 << 20):
+        self.path = path
+        self.count = 0
+        self._append = append
+        self._buffer_size = buffer_size
+        self._jsonl = path.suffix.lower() in JSONL_SUFFIXES
+        self._f: Optional[IO[str]] = None
+        self._writer: Any = None
+
+    def write(self, reject: Reject) -> None:
+        f = self._f if self._f is not None else self._open()
+        fields = [reject.row.get(name) for name in Customer.header()]
+        if self._jsonl:
+            record = {"line": reject.line, "reason": reject.reason, **dict(zip(Customer.header(), fields))}
+            f.write(json.dumps(record) + "\n")
+        else:
+            self._writer.writerow(["" if reject.line is None else reject.line, reject.reason, *(v or "" for v in fields)])
+        self.count += 1
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def _open(self) -> IO[str]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        is_new = not (self._append and self.path.exists() and self.path.stat().st_size > 0)
+        self._f = self.path.open("a" if self._append else "w", newline="", buffering=self._buffer_size)
+        if not self._jsonl:
+            self._writer = csv.writer(self._f)
+            if is_new:
+                self._writer.writerow(["line", "reason", *Customer.header()])
+        return self._f
+
+    def __enter__(self) -> "RejectSink":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+def rejects_path(state_dir: str, rejects_id: str) -> Path:
+    """Where the rejects of an upload or job are kept for download."""
+    return Path(state_dir) / "rejects" / f"{rejects_id}.jsonl"
+
+def remove_expired_rejects(state_dir: str, retention_seconds: float) -> int:
+    """Delete the rejects of uploads and jobs not written to for retention_seconds; returns how many were deleted."""
+    expires_before = time.time() - retention_seconds
+    removed = 0
+    for path in (Path(state_dir) / "rejects").glob("*.jsonl"):
+        try:
+            if path.stat().st_mtime < expires_before:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            continue
+    if removed:
+        logger.info(f"Deleted {removed} rejects files older than {retention_seconds:g} seconds")
+    return removed
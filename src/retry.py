@@ -0,0 +1,163 @@
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit breaker is open."""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a run does not finish within its deadline."""
+
+
+class Deadline:
+    """Point in time after which no attempt or wait is started."""
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self._expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def after(cls, seconds: float) -> Optional["Deadline"]:
+        """Deadline in seconds from now, or None when seconds is 0 or less."""
+        return cls(seconds) if seconds > 0 else None
+
+    def remaining(self) -> float:
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self._expires_at
+
+
+class CircuitBreaker:
+    """Thread-safe breaker that fails fast while the API is clearly down.
+
+    Opens after `threshold` consecutive failures (5xx responses or network errors) and
+    rejects calls for `reset_seconds`. Then one trial call goes through: its success closes
+    the breaker, its failure opens it again. A threshold of 0 disables the breaker.
+    """
+    def __init__(self, threshold: int, reset_seconds: float):
+        self._threshold = threshold
+        self._reset_seconds = reset_seconds
+        self._failures = 0
+        self._open_until: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._open_until is not None
+
+    def check(self) -> bool:
+        """Raise CircuitOpenError unless a request may be sent now.
+
+        Returns True when the caller sends the trial request of a half-open breaker. The trial
+        ends with record_success or record_failure, or with end_trial if the call raised first.
+        """
+        if self._open_until is None:
+            return False
+        with self._lock:
+            if self._open_until is None:
+                return False
+            if time.monotonic() < self._open_until or self._trial:
+                raise CircuitOpenError("ShowAds circuit breaker is open")
+            # Half-open: this caller sends the trial request
+            self._trial = True
+            return True
+
+    def end_trial(self) -> None:
+        """Let the next call send a trial request when the current one ended without a response."""
+        with self._lock:
+            self._trial = False
+
+    def record_success(self) -> None:
+        if self._failures == 0 and self._open_until is None:
+            return
+        with self._lock:
+            if self._open_until is not None:
+                logger.info("ShowAds is responding again, closing the circuit breaker")
+            self._failures = 0
+            self._open_until = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        if self._threshold <= 0:
+            return
+        with self._lock:
+            self._failures += 1
+            if self._trial or (self._open_until is None and self._failures >= self._threshold):
+                logger.warning(
+                    f"ShowAds failed {self._failures} times in a row, "
+                    f"failing fast for {self._reset_seconds:g}s"
+                )
+                self._open_until = time.monotonic() + self._reset_seconds
+                self._trial = False
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How one call is retried: attempts, decorrelated-jitter backoff and a per-call deadline.
+
+    Each wait is drawn between base_seconds and three times the previous wait, capped at
+    cap_seconds, so concurrent callers spread out instead of retrying in lockstep.
+    """
+    max_attempts: int
+    base_seconds: float
+    cap_seconds: float = 30.0
+    call_deadline_seconds: float = 0.0
+
+    @classmethod
+    def from_config(cls, config: Config) -> "RetryPolicy":
+        return cls(
+            max_attempts=config.max_retries,
+            base_seconds=config.retry_backoff_seconds,
+            cap_seconds=config.retry_backoff_cap_seconds,
+            call_deadline_seconds=config.request_deadline_seconds,
+        )
+
+    def start(self, run_deadline: Optional[Deadline] = None) -> "RetryState":
+        """Start a call, which also stops at run_deadline when that comes first."""
+        deadline = Deadline.after(self.call_deadline_seconds)
+        if run_deadline is not None and (deadline is None or run_deadline.remaining() < deadline.remaining()):
+            deadline = run_deadline
+        return RetryState(self, deadline)
+
+
+class RetryState:
+    """Progress of one call through its RetryPolicy."""
+    def __init__(self, policy: RetryPolicy, deadline: Optional[Deadline]):
+        self._policy = policy
+        self._deadline = deadline
+        self._previous = policy.base_seconds
+        self.attempts = 1
+
+    def timeout(self) -> Optional[float]:
+        """Time left for the current attempt, None without a deadline."""
+        return self._deadline.remaining() if self._deadline is not None else None
+
+    def next_delay(self, retry_after: Optional[float] = None) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None if the call should give up.
+
+        A Retry-After from the server replaces the backoff. The call gives up once its
+        attempts are used or the wait would end past the deadline.
+        """
+        if self.attempts >= self._policy.max_attempts:
+            return None
+        if retry_after is not None:
+            delay = retry_after
+        else:
+            upper = max(self._policy.base_seconds, self._previous * 3)
+            delay = min(self._policy.cap_seconds, random.uniform(self._policy.base_seconds, upper))
+            self._previous = delay
+        if self._deadline is not None and delay >= self._deadline.remaining():
+            logger.warning(f"Giving up: retrying in {delay:.1f}s would pass the deadline")
+            return None
+        self.attempts += 1
+        return delay
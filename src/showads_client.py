@@ -1,12 +1,18 @@
 import logging
+import threading
 import time
 from dataclasses import dataclass
-from typing import Iterable, Optional, cast
+from email.utils import parsedate_to_datetime
+from typing import Iterable, Mapping, Optional, cast
 
 import requests
+from requests.adapters import HTTPAdapter
 
+from . import metrics, payload
 from .config import Config
 from .models import Banner
+from .rate_limit import RetryBudget, TokenBucket
+from .retry import CircuitBreaker, RetryPolicy
 
 logger = logging.getLogger(__name__)
 
@@ -15,30 +21,87 @@ class Token:
     access_token: str
     expires_at: float
 
-    def is_valid(self) -> bool:
-        return self.expires_at > time.time()
+    def is_valid(self, margin: float = 0) -> bool:
+        return self.expires_at - margin > time.time()
+
+def refresh_margin(config: Config) -> float:
+    """Seconds before expiry at which a token is proactively refreshed."""
+    return min(config.token_refresh_margin_seconds, config.token_expiry_seconds / 2)
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
 
 class ShowAdsClient:
+    """Thread-safe ShowAds client, meant to be shared by all uploads of a process.
+
+    Connections are pooled and kept alive across requests, and the access token is
+    refreshed by a single caller at a time, shortly before it expires. Retries follow
+    a RetryPolicy, and a circuit breaker shared by all callers fails fast while ShowAds is down.
+    """
     def __init__(self, config: Config):
         self._config = config
+        self._retry = RetryPolicy.from_config(config)
+        self.breaker = CircuitBreaker(config.circuit_breaker_threshold, config.circuit_breaker_reset_seconds)
+        self._encoder = payload.Encoder(config.request_compression)
         self._token: Optional[Token] = None
+        self._token_lock = threading.Lock()
         self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=config.http_pool_size, pool_maxsize=config.http_pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        if config.http_keepalive_seconds <= 0:
+            self._session.headers["Connection"] = "close"
+
+    @property
+    def token(self) -> Optional[Token]:
+        return self._token
+
+    def close(self) -> None:
+        self._session.close()
 
     def _auth_header(self) -> dict[str, str]:
+        margin = refresh_margin(self._config)
         token = self._token
-        if token is None or not token.is_valid():
-            token = self._refresh_token()
+        if token is None or not token.is_valid(margin):
+            with self._token_lock:
+                # Another thread may have refreshed the token while we waited
+                token = self._token
+                if token is None or not token.is_valid(margin):
+                    token = self._refresh_token()
         return {"Authorization": f"Bearer {token.access_token}"}
 
+    def _refresh_stale_token(self, stale_header: str) -> None:
+        with self._token_lock:
+            # Only the first thread to see the stale token refreshes it
+            token = self._token
+            if token is None or stale_header == f"Bearer {token.access_token}":
+                self._refresh_token()
+
     def _refresh_token(self) -> Token:
         url = f"{self._config.api_base_url}/auth"
         payload = {
             "ProjectKey": self._config.project_key
         }
-        for attempt in range(self._config.max_retries):
+        call = self._retry.start()
+        while True:
+            retry_after = None
             try:
-                response = self._session.post(url, json=payload)
+                with metrics.http_request("/auth"):
+                    response = self._session.post(url, json=payload, timeout=call.timeout())
+                metrics.http_response("/auth", response.status_code)
                 if response.status_code == 200:
+                    self.breaker.record_success()
                     data = cast(dict[str, str], response.json())
                     access_token = data.get("AccessToken")
                     if not access_token:
@@ -48,52 +111,122 @@ class ShowAdsClient:
                         expires_at=time.time() + self._config.token_expiry_seconds
                     )
                     self._token = token
+                    metrics.token_obtained()
                     logger.info("Obtained access token")
                     return token
                 if response.status_code in (401, 400):
+                    self.breaker.record_success()
                     raise RuntimeError(f"Auth request failed: {response.status_code} {response.text}")
                 # if status_code in (429, 500), we continue with backoff
-                self._backoff(attempt)
+                self._record_status(response.status_code)
+                retry_after = retry_after_seconds(response.headers) if response.status_code == 429 else None
             except requests.RequestException as e:
+                metrics.http_response("/auth", type(e).__name__)
                 logger.warning(f"Auth request error: {e}")
-                self._backoff(attempt)
-        raise RuntimeError("Failed to obtain access token")
-    
-    def _backoff(self, attempt: int) -> None:
-        delay = self._config.retry_backoff_seconds * (2.0 ** attempt)
-        time.sleep(min(delay, 30))
+                self.breaker.record_failure()
+            delay = call.next_delay(retry_after)
+            if delay is None:
+                raise RuntimeError("Failed to obtain access token")
+            self._sleep(delay, retry_after)
+            # The first attempt was let through by the request that needed the token
+            self.breaker.check()
 
-    def show_banner(self, banner: Banner) -> bool:
+    def _record_status(self, status_code: int) -> None:
+        """Feed an unsuccessful response to the breaker: only 5xx means ShowAds is down."""
+        if status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _sleep(self, delay: float, retry_after: Optional[float]) -> None:
+        metrics.retry_sleep("retry_after" if retry_after is not None else "backoff", delay)
+        time.sleep(delay)
+
+    def show_banner(
+        self,
+        banner: Banner,
+        rate_limiter: Optional[TokenBucket] = None,
+        retry_budget: Optional[RetryBudget] = None,
+    ) -> bool:
+        """Show a single banner.
+
+        Each attempt waits for rate_limiter, and retries stop once retry_budget is spent.
+        """
         url = f"{self._config.api_base_url}/banners/show"
-        payload = {
+        body = payload.encode_json({
             "VisitorCookie": banner.visitor_cookie,
             "BannerId": banner.banner_id
-        }
-        return self._post_with_retry(url, payload)
+        })
+        return self._post_with_retry(url, body, rate_limiter, retry_budget)
     
-    def show_banners_bulk(self, banners: Iterable[Banner]) -> bool:
+    def show_banners_bulk(self, banners: Iterable[Banner], retry_budget: Optional[RetryBudget] = None) -> bool:
         url = f"{self._config.api_base_url}/banners/show/bulk"
-        items = [{"VisitorCookie": banner.visitor_cookie, "BannerId": banner.banner_id} for banner in banners]
-        payload = {"Data": items}
-        return self._post_with_retry(url, payload)
+        return self._post_with_retry(url, payload.encode_bulk(banners), retry_budget=retry_budget)
     
-    def _post_with_retry(self, url: str, payload: object) -> bool:
-        for attempt in range(self._config.max_retries):
+    def _post_with_retry(
+        self,
+        url: str,
+        body: bytes,
+        rate_limiter: Optional[TokenBucket] = None,
+        retry_budget: Optional[RetryBudget] = None,
+    ) -> bool:
+        """POST a JSON body until it is accepted, retrying 429, 5xx and network errors.
+
+        A 401 refreshes the token; the first refresh of a call does not use up an attempt.
+        Raises CircuitOpenError instead of sending while the circuit breaker is open.
+        """
+        endpoint = url[len(self._config.api_base_url):]
+        # Compressed once, the same bytes are sent by every attempt
+        body, content_encoding = self._encoder.encode(body)
+        call = self._retry.start(retry_budget.deadline if retry_budget is not None else None)
+        refreshed = False
+        while True:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            trial = self.breaker.check()
+            retry_after = None
             try:
                 headers = {"Content-Type": "application/json"}
+                if content_encoding is not None:
+                    headers["Content-Encoding"] = content_encoding
                 headers.update(self._auth_header())
-                response = self._session.post(url, json=payload, headers=headers)
+                with metrics.http_request(endpoint, len(body)):
+                    response = self._session.post(url, data=body, headers=headers, timeout=call.timeout())
+                metrics.http_response(endpoint, response.status_code)
                 if response.status_code == 200:
+                    self.breaker.record_success()
                     return True
                 if response.status_code == 401:
+                    self.breaker.record_success()
                     logger.info("Access token expired or invalid, refreshing")
-                    self._refresh_token()
-                    continue
-                if response.status_code == 400:
+                    self._refresh_stale_token(headers["Authorization"])
+                    if not refreshed:
+                        refreshed = True
+                        continue
+                elif response.status_code == 400:
+                    self.breaker.record_success()
                     logger.error(f"Bad request {response.status_code}: {response.text}")
                     return False
-                # if status_code in (429, 500), we continue with backoff
-                self._backoff(attempt)
+                else:
+                    self._record_status(response.status_code)
+                    retry_after = retry_after_seconds(response.headers) if response.status_code == 429 else None
             except requests.RequestException as e:
+                metrics.http_response(endpoint, type(e).__name__)
                 logger.warning(f"Request error: {e}")
-        return False
+                self.breaker.record_failure()
+            except BaseException:
+                if trial:
+                    self.breaker.end_trial()
+                raise
+            delay = call.next_delay(retry_after)
+            if delay is None:
+                return False
+            if retry_budget is not None and not retry_budget.try_spend():
+                logger.warning("Retry budget exhausted")
+                return False
+            if rate_limiter is not None and retry_after is not None:
+                # Every caller sharing the limiter waits out the Retry-After
+                metrics.retry_sleep("retry_after", retry_after)
+                rate_limiter.pause(retry_after)
+                continue
+            self._sleep(delay, retry_after)
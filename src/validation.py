@@ -1,21 +1,34 @@
 import re
-from typing import Tuple
+from typing import Callable, Optional, Tuple
 
 from .config import Config
 from .models import AgeLimit, Customer
 
-_NAME_RE = re.compile(r"^[A-Za-z ]+$")
+# Letters and spaces, with at least one letter; also used by the columnar engine, hence the anchors
+_NAME_RE = re.compile(r"^ *[A-Za-z][A-Za-z ]*$")
 
 def validate_customer(customer: Customer, age_limit: AgeLimit, config: Config) -> Tuple[bool, str | None]:
-    """Validate a customer record.
+    """Validate a customer record whose name is already stripped, as parse_customer returns it.
 
     Returns (is_valid, error_message). Error is None when valid.
     """
+    error = customer_validator(age_limit, config)(customer)
+    return error is None, error
 
-    if not _NAME_RE.match(customer.name.strip()):
-        return False, f"invalid name: must contain only letters and spaces (got {customer.name})"
-    if not age_limit.is_valid(customer.age):
-        return False, f"invalid age: must be between {age_limit.min_age} and {age_limit.max_age} (got {customer.age})"
-    if not (config.min_banner_id <= customer.banner_id <= config.max_banner_id):
-        return False, f"invalid banner id: must be between {config.min_banner_id} and {config.max_banner_id} (got {customer.banner_id})"
-    return True, None
+def customer_validator(age_limit: AgeLimit, config: Config) -> Callable[[Customer], Optional[str]]:
+    """validate_customer for many customers: returns a function giving the error message, None when valid."""
+    # fullmatch: $ alone would also accept a name ending in a newline
+    match_name = _NAME_RE.fullmatch
+    min_age, max_age = age_limit.min_age, age_limit.max_age
+    min_banner_id, max_banner_id = config.min_banner_id, config.max_banner_id
+
+    def error(customer: Customer) -> Optional[str]:
+        if not match_name(customer.name):
+            return f"invalid name: must contain only letters and spaces (got {customer.name})"
+        if not min_age <= customer.age <= max_age:
+            return f"invalid age: must be between {min_age} and {max_age} (got {customer.age})"
+        if not min_banner_id <= customer.banner_id <= max_banner_id:
+            return f"invalid banner id: must be between {min_banner_id} and {max_banner_id} (got {customer.banner_id})"
+        return None
+
+    return error
@@ -0,0 +1,50 @@
+"""Fake ShowAds clients shared by the tests."""
+import asyncio
+from typing import Iterable
+
+from src.models import Banner
+
+
+class RecordingClient:
+    """Records every request. Requests carrying a cookie of failing fail, and so do all bulk requests with fail_bulk."""
+    def __init__(self, failing: Iterable[str] = (), fail_bulk: bool = False):
+        self.failing = set(failing)
+        self.fail_bulk = fail_bulk
+        self.bulk: list[list[Banner]] = []
+        self.single: list[Banner] = []
+
+    def bulk_cookies(self) -> list[list[str]]:
+        return [[banner.visitor_cookie for banner in batch] for batch in self.bulk]
+
+    def show_banners_bulk(self, banners, retry_budget=None):
+        batch = list(banners)
+        self.bulk.append(batch)
+        return not self.fail_bulk and not any(banner.visitor_cookie in self.failing for banner in batch)
+
+    def show_banner(self, banner, rate_limiter=None, retry_budget=None):
+        self.single.append(banner)
+        return banner.visitor_cookie not in self.failing
+
+    def close(self):
+        pass
+
+
+class AsyncRecordingClient(RecordingClient):
+    """RecordingClient for the async processor; tracks how many bulk requests overlap."""
+    def __init__(self, failing: Iterable[str] = (), fail_bulk: bool = False):
+        super().__init__(failing, fail_bulk)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def show_banners_bulk(self, banners, retry_budget=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return super().show_banners_bulk(banners)
+
+    async def show_banner(self, banner, rate_limiter=None, retry_budget=None):
+        return super().show_banner(banner, rate_limiter, retry_budget)
+
+    async def aclose(self):
+        pass
@@ -0,0 +1,370 @@
+import gzip
+import importlib
+import json
+import os
+import threading
+import time
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+import zstandard
+from fastapi.testclient import TestClient
+from prometheus_client.parser import text_string_to_metric_families
+
+from src import profiles
+from src.config import Config
+from tests.fakes import AsyncRecordingClient, RecordingClient
+
+CSV = b"Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJane Doe,10,c2,5\n"
+
+def make_config(**overrides) -> Config:
+    base = dict(
+        api_base_url="https://api.example",
+        project_key="dev-key",
+        min_banner_id=1,
+        max_banner_id=99,
+        token_expiry_seconds=84600,
+        max_retries=5,
+        retry_backoff_seconds=2,
+        bulk_batch_size=1000,
+        max_concurrent_uploads=1,
+    )
+    base.update(overrides)
+    return Config(**base)
+
+@pytest.fixture
+def sent(monkeypatch) -> RecordingClient:
+    """Fake ShowAds client given to every profile of the API."""
+    client = RecordingClient()
+    monkeypatch.setattr(profiles, "ShowAdsClient", lambda cfg: client)
+    monkeypatch.setattr(profiles, "AsyncShowAdsClient", lambda cfg: AsyncRecordingClient())
+    return client
+
+@pytest.fixture
+def api(monkeypatch, tmp_path, sent):
+    """The API module running with a test config and fake ShowAds clients."""
+    # The module loads its config from the environment on import
+    monkeypatch.setenv("SHOWADS_BASE_URL", "https://api.example")
+    module = importlib.import_module("src.api")
+    config = make_config(state_dir=str(tmp_path))
+    monkeypatch.setattr(module, "config", config)
+    monkeypatch.setattr(module, "upload_slots", threading.BoundedSemaphore(config.max_concurrent_uploads))
+    return module
+
+def upload(client: TestClient, data: bytes = CSV):
+    return client.post("/process/csv", files={"file": ("data.csv", data)})
+
+
+def test_upload_is_rejected_while_all_slots_are_taken(api, sent):
+    with TestClient(api.app) as client:
+        assert api.upload_slots.acquire(blocking=False)
+        busy = upload(client)
+        api.upload_slots.release()
+        done = upload(client)
+
+    assert busy.status_code == 503
+    assert busy.headers["Retry-After"] == "1"
+    assert done.status_code == 200
+    assert done.json()["valid_customers"] == 1
+    assert sent.bulk_cookies() == [["c1"]]
+    # The slot was released after the upload
+    assert api.upload_slots.acquire(blocking=False)
+
+
+def test_upload_slot_is_released_when_processing_fails(api, monkeypatch):
+    def broken_sink(path):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(api, "RejectSink", broken_sink)
+    with TestClient(api.app) as client:
+        failed = upload(client)
+
+    assert failed.status_code == 500
+    assert api.upload_slots.acquire(blocking=False)
+
+
+def chunked(data: bytes, size: int = 7):
+    """The body in small pieces, so the client sends it with chunked transfer encoding."""
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+COMPRESS = {"gzip": gzip.compress, "zstd": zstandard.ZstdCompressor().compress}
+
+
+@pytest.mark.parametrize("encoding", [None, "gzip", "zstd"])
+def test_stream_processes_a_chunked_body(api, sent, encoding):
+    rows = b"".join(b"John Doe,30,c%d,5\n" % i for i in range(50))
+    body = b"Name,Age,Cookie,Banner_id\n" + rows + b"Jane Doe,10,old,5\n"
+    headers = {"Content-Type": "text/csv"}
+    if encoding is not None:
+        body = COMPRESS[encoding](body)
+        headers["Content-Encoding"] = encoding
+
+    with TestClient(api.app) as client:
+        response = client.post("/process/csv/stream", content=chunked(body), headers=headers)
+
+    assert response.status_code == 200
+    assert (response.json()["valid_customers"], response.json()["invalid_customers"]) == (50, 1)
+    assert sent.bulk_cookies() == [[f"c{i}" for i in range(50)]]
+    assert api.upload_slots.acquire(blocking=False)
+
+
+def test_stream_rejects_unsupported_content_encoding(api, sent):
+    with TestClient(api.app) as client:
+        response = client.post(
+            "/process/csv/stream", content=chunked(CSV), headers={"Content-Type": "text/csv", "Content-Encoding": "br"}
+        )
+
+    assert response.status_code == 415
+    assert sent.bulk == []
+    assert api.upload_slots.acquire(blocking=False)
+
+
+def test_compressed_uploads_are_processed(api, sent):
+    with TestClient(api.app) as client:
+        responses = [
+            client.post("/process/csv", files={"file": (name, compress(CSV))})
+            for name, compress in (("data.csv.gz", COMPRESS["gzip"]), ("data.csv.zst", COMPRESS["zstd"]))
+        ]
+
+    assert [r.status_code for r in responses] == [200, 200]
+    assert sent.bulk_cookies() == [["c1"], ["c1"]]
+
+
+def wait_finished(client: TestClient, job_id: str) -> dict:
+    for _ in range(200):
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("succeeded", "failed", "cancelled"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_job_runs_in_the_background_and_reports_its_counts(api, sent):
+    with TestClient(api.app) as client:
+        created = client.post("/jobs", files={"file": ("data.csv", CSV)})
+        job = wait_finished(client, created.json()["id"])
+
+    assert created.status_code == 202
+    assert created.json()["status"] == "queued"
+    assert (job["status"], job["valid"], job["invalid"]) == ("succeeded", 1, 1)
+    assert "input_path" not in job
+    assert sent.bulk_cookies() == [["c1"]]
+
+
+def test_deleting_a_queued_job_cancels_it(api, sent, monkeypatch):
+    monkeypatch.setattr(api, "config", replace(api.config, job_workers=1))
+    release = threading.Event()
+    show_banners_bulk = sent.show_banners_bulk
+
+    def blocking_bulk(banners, retry_budget=None):
+        release.wait(timeout=5)
+        return show_banners_bulk(banners, retry_budget)
+
+    monkeypatch.setattr(sent, "show_banners_bulk", blocking_bulk)
+    with TestClient(api.app) as client:
+        running = client.post("/jobs", files={"file": ("a.csv", CSV)}).json()["id"]
+        queued = client.post("/jobs", files={"file": ("b.csv", CSV)}).json()["id"]
+        cancelled = client.delete(f"/jobs/{queued}")
+        release.set()
+        finished = wait_finished(client, running)
+        deleted_again = client.delete(f"/jobs/{running}")
+        later = client.get(f"/jobs/{queued}")
+
+    assert cancelled.status_code == 200
+    assert cancelled.json()["status"] == "cancelled"
+    assert later.json()["status"] == "cancelled"
+    assert finished["status"] == "succeeded"
+    # Finished jobs are returned as they are
+    assert deleted_again.json()["status"] == "succeeded"
+    assert sent.bulk_cookies() == [["c1"]]
+    assert list((Path(api.config.state_dir) / "uploads").iterdir()) == []
+
+
+@pytest.mark.parametrize("method", ["get", "delete"])
+def test_unknown_job_is_not_found(api, method):
+    with TestClient(api.app) as client:
+        response = getattr(client, method)("/jobs/missing")
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Job not found"
+
+
+def test_job_skips_malformed_rows_when_asked(api, sent):
+    data = CSV + b"Bob,forty,c3,5\nAnn,20,c4,5\n"
+    with TestClient(api.app) as client:
+        strict = wait_finished(client, client.post("/jobs", files={"file": ("a.csv", data)}).json()["id"])
+        created = client.post("/jobs?skip_malformed=true", files={"file": ("b.csv", data)}).json()
+        tolerant = wait_finished(client, created["id"])
+        rejects = client.get(tolerant["rejects_url"]).text.splitlines()
+
+    assert strict["status"] == "failed"
+    assert created["skip_malformed"] is True
+    assert (tolerant["status"], tolerant["valid"], tolerant["invalid"]) == ("succeeded", 2, 2)
+    assert any("Age is not an integer" in line for line in rejects)
+
+
+def test_rejects_of_an_upload_can_be_downloaded(api):
+    with TestClient(api.app) as client:
+        processed = upload(client).json()
+        found = client.get(processed["rejects_url"])
+        unknown = client.get("/rejects/0123abcd")
+        traversal = client.get("/rejects/..%2Fjobs")
+        dotted = client.get("/rejects/jobs.sqlite3")
+
+    assert found.status_code == 200
+    assert found.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["Cookie"] for line in found.text.splitlines()] == ["c2"]
+    assert [r.status_code for r in (unknown, traversal, dotted)] == [404, 404, 404]
+
+
+def test_expired_rejects_are_deleted_at_startup(api):
+    expired = Path(api.config.state_dir) / "rejects" / "expired.jsonl"
+    expired.parent.mkdir(parents=True)
+    expired.write_text("{}\n")
+    os.utime(expired, (0, 0))
+
+    with TestClient(api.app):
+        pass
+
+    assert not expired.exists()
+
+
+def validate(client: TestClient, data: bytes = CSV, name: str = "data.csv", query: str = ""):
+    return client.post(f"/validate/csv{query}", files={"file": (name, data)})
+
+
+def test_validate_reports_a_valid_upload_without_sending(api, sent):
+    with TestClient(api.app) as client:
+        response = validate(client, b"Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJane Doe,40,c2,7\n")
+
+    report = response.json()
+    assert response.status_code == 200
+    assert report["status"] == "validated"
+    assert (report["rows_read"], report["valid"], report["invalid"], report["bulk_requests"]) == (2, 2, 0, 1)
+    assert report["ages"] == {"30": 1, "40": 1}
+    assert report["banner_ids"] == {"5": 1, "7": 1}
+    assert sent.bulk == []
+    assert api.upload_slots.acquire(blocking=False)
+
+
+@pytest.mark.parametrize("engine", ["python", "columnar"])
+def test_validate_reports_invalid_rows(api, sent, monkeypatch, engine):
+    monkeypatch.setattr(api, "config", replace(api.config, validation_engine=engine))
+    with TestClient(api.app) as client:
+        response = validate(client)
+
+    report = response.json()
+    assert response.status_code == 200
+    assert (report["valid"], report["invalid"], report["malformed"]) == (1, 1, 0)
+    assert report["reasons"] == {"invalid age: must be between 18 and 100": 1}
+    assert report["ages"] == {"10": 1, "30": 1}
+    assert sent.bulk == []
+
+
+def test_validate_skips_malformed_rows_when_asked(api):
+    data = CSV + b"Bob,forty,c3,5\n"
+    with TestClient(api.app) as client:
+        strict = validate(client, data)
+        tolerant = validate(client, data, query="?skip_malformed=true")
+
+    assert strict.status_code == 400
+    assert "Invalid row" in strict.json()["detail"]
+    assert tolerant.status_code == 200
+    assert (tolerant.json()["valid"], tolerant.json()["invalid"], tolerant.json()["malformed"]) == (1, 2, 1)
+    assert api.upload_slots.acquire(blocking=False)
+
+
+def test_validate_rejects_files_that_are_not_csv(api):
+    with TestClient(api.app) as client:
+        response = validate(client, name="data.json")
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Only .csv, .csv.gz and .csv.zst files are supported"
+
+
+def scraped(client: TestClient) -> dict[str, float]:
+    """Samples of GET /metrics without labels, by name."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    return {
+        sample.name: sample.value
+        for family in text_string_to_metric_families(response.text)
+        for sample in family.samples
+        if not sample.labels
+    }
+
+
+def test_metrics_count_the_rows_of_an_upload(api):
+    with TestClient(api.app) as client:
+        before = scraped(client)
+        upload(client)
+        after = scraped(client)
+
+    assert after["showads_rows_parsed_total"] - before["showads_rows_parsed_total"] == 2
+    assert after["showads_rows_valid_total"] - before["showads_rows_valid_total"] == 1
+    assert after["showads_banners_sent_total"] - before["showads_banners_sent_total"] == 1
+
+
+@pytest.fixture
+def acme(api, monkeypatch, sent):
+    """Adds an "acme" profile with its own project key and ages 35-60; returns the project keys clients are made for."""
+    profiles_file = Path(api.config.state_dir) / "profiles.json"
+    profiles_file.write_text(json.dumps({"acme": {"project_key": "acme-key", "min_age": 35, "max_age": 60}}))
+    monkeypatch.setattr(api, "config", replace(api.config, profiles_file=str(profiles_file)))
+    keys = []
+
+    def client_for(cfg):
+        keys.append(cfg.project_key)
+        return sent
+
+    monkeypatch.setattr(profiles, "ShowAdsClient", client_for)
+    return keys
+
+
+def test_upload_uses_the_settings_of_its_profile(api, sent, acme):
+    data = CSV + b"Ann Lee,40,c3,5\n"
+    with TestClient(api.app) as client:
+        default = client.post("/process/csv", files={"file": ("a.csv", data)}).json()
+        tenant = client.post("/process/csv?profile=acme", files={"file": ("b.csv", data)}).json()
+
+    assert (default["valid_customers"], default["invalid_customers"]) == (2, 1)
+    assert (tenant["valid_customers"], tenant["invalid_customers"]) == (1, 2)
+    assert sent.bulk_cookies() == [["c1", "c3"], ["c3"]]
+    assert acme == ["dev-key", "acme-key"]
+
+
+def test_unknown_profile_is_not_found(api, acme):
+    with TestClient(api.app) as client:
+        responses = [
+            client.post("/process/csv?profile=other", files={"file": ("a.csv", CSV)}),
+            client.get("/config/age-limit?profile=other"),
+        ]
+
+    assert [r.status_code for r in responses] == [404, 404]
+    assert responses[0].json()["detail"] == "Profile not found: other"
+
+
+def test_profiles_are_listed_without_their_project_keys(api, acme):
+    with TestClient(api.app) as client:
+        listed = client.get("/profiles").json()
+
+    assert [p["name"] for p in listed] == ["default", "acme"]
+    assert listed[1] == {"name": "acme", "min_banner_id": 1, "max_banner_id": 99, "min_age": 35, "max_age": 60}
+    assert all("project_key" not in p for p in listed)
+
+
+def test_age_limit_of_a_profile_is_changed_alone(api, acme):
+    with TestClient(api.app) as client:
+        changed = client.put("/config/age-limit?profile=acme", json={"min_age": 40, "max_age": 50})
+        reversed_limit = client.put("/config/age-limit?profile=acme", json={"min_age": 50, "max_age": 40})
+        tenant = client.get("/config/age-limit?profile=acme").json()
+        default = client.get("/config/age-limit").json()
+
+    assert changed.status_code == 200
+    assert reversed_limit.status_code == 400
+    assert tenant == {"min_age": 40, "max_age": 50}
+    assert default == {"min_age": 18, "max_age": 100}
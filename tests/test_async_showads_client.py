@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+import httpx
+
+from src.async_showads_client import AsyncShowAdsClient
+from src.config import Config
+from src.models import Banner
+from src.retry import CircuitOpenError
+
+def make_config(**overrides) -> Config:
+    base = dict(
+        api_base_url="https://api.example",
+        project_key="dev-key",
+        min_banner_id=1,
+        max_banner_id=99,
+        token_expiry_seconds=84600,
+        max_retries=5,
+        retry_backoff_seconds=0,
+        bulk_batch_size=1000,
+    )
+    base.update(overrides)
+    return Config(**base)
+
+def run_with_handler(config: Config, handler, coro_fn):
+    async def run():
+        async with AsyncShowAdsClient(config, transport=httpx.MockTransport(handler)) as client:
+            return await coro_fn(client)
+    return asyncio.run(run())
+
+def test_show_banners_bulk_success_payload_shape():
+    config = make_config()
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if request.url.path == "/auth":
+            return httpx.Response(200, json={"AccessToken": "abc"})
+        return httpx.Response(200)
+
+    banners = [Banner(visitor_cookie="c1", banner_id=1), Banner(visitor_cookie="c2", banner_id=2)]
+    ok = run_with_handler(config, handler, lambda client: client.show_banners_bulk(banners))
+
+    assert ok is True
+    last_call = calls[-1]
+    assert str(last_call.url) == f"{config.api_base_url}/banners/show/bulk"
+    assert json.loads(last_call.content) == {
+        "Data": [
+            {"VisitorCookie": "c1", "BannerId": 1},
+            {"VisitorCookie": "c2", "BannerId": 2},
+        ]
+    }
+    assert last_call.headers["Authorization"] == "Bearer abc"
+
+
+def test_concurrent_requests_share_single_auth_call():
+    config = make_config()
+    auth_calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/auth":
+            auth_calls.append(request)
+            return httpx.Response(200, json={"AccessToken": "abc"})
+        return httpx.Response(200)
+
+    async def send_many(client: AsyncShowAdsClient):
+        banner = Banner(visitor_cookie="c1", banner_id=1)
+        return await asyncio.gather(*(client.show_banner(banner) for _ in range(10)))
+
+    results = run_with_handler(config, handler, send_many)
+
+    assert all(results)
+    assert len(auth_calls) == 1
+
+
+def test_401_refreshes_token_and_retries():
+    config = make_config()
+    tokens = iter(["old", "new"])
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/auth":
+            return httpx.Response(200, json={"AccessToken": next(tokens)})
+        seen.append(request.headers["Authorization"])
+        if request.headers["Authorization"] == "Bearer old":
+            return httpx.Response(401)
+        return httpx.Response(200)
+
+    ok = run_with_handler(config, handler, lambda client: client.show_banner(Banner(visitor_cookie="c1", banner_id=1)))
+
+    assert ok is True
+    assert seen == ["Bearer old", "Bearer new"]
+
+
+def test_bad_request_returns_false_without_retry():
+    config = make_config()
+    bulk_calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/auth":
+            return httpx.Response(200, json={"AccessToken": "abc"})
+        bulk_calls.append(request)
+        return httpx.Response(400, text="bad")
+
+    ok = run_with_handler(config, handler, lambda client: client.show_banners_bulk([Banner(visitor_cookie="c1", banner_id=1)]))
+
+    assert ok is False
+    assert len(bulk_calls) == 1
+
+
+def test_client_recovers_after_breaker_opened_on_auth():
+    config = make_config(circuit_breaker_threshold=2, circuit_breaker_reset_seconds=0.05)
+    auth_statuses = [500, 500, 200]
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if request.url.path == "/auth":
+            status = auth_statuses.pop(0)
+            return httpx.Response(status, json={"AccessToken": "abc"} if status == 200 else None)
+        return httpx.Response(200)
+
+    async def send(client: AsyncShowAdsClient) -> list[object]:
+        results: list[object] = []
+        try:
+            await client.show_banner(Banner(visitor_cookie="c1", banner_id=1))
+        except CircuitOpenError as e:
+            results.append(e)
+        await asyncio.sleep(0.06)
+        results.append(await client.show_banner(Banner(visitor_cookie="c2", banner_id=1)))
+        results.append(await client.show_banner(Banner(visitor_cookie="c3", banner_id=1)))
+        return results
+
+    failed, second, third = run_with_handler(config, handler, send)
+
+    assert isinstance(failed, CircuitOpenError)
+    assert (second, third) == (True, True)
+    assert calls.count("/auth") == 3
@@ -0,0 +1,9 @@
+from src.batching import AdaptiveBatchSize
+
+def test_adaptive_batch_size_grows_additively_and_halves_on_trouble():
+    size = AdaptiveBatchSize(initial=100, minimum=40, maximum=130, target_seconds=1.0)
+
+    assert [size.record(0.1, ok=True) for _ in range(4)] == [110, 120, 130, 130]
+    assert size.record(0.1, ok=True, retried=True) == 65
+    assert size.record(2.0, ok=True) == 40
+    assert size.record(0.1, ok=False) == 40
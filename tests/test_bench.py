@@ -0,0 +1,94 @@
+import json
+import time
+from pathlib import Path
+
+from bench.encode import encoders, measure
+from bench.fake_server import FakeSettings, FakeShowAds
+from bench.generate import generate_csv
+from bench.run import percentile, regressions
+from src.config import Config
+from src.csv_loader import CsvSource
+from src.models import AgeLimit, Banner
+from src.showads_client import ShowAdsClient
+from src.validation import validate_customer
+
+def make_config(**overrides) -> Config:
+    base = dict(
+        api_base_url="https://api.example",
+        project_key="dev-key",
+        min_banner_id=1,
+        max_banner_id=99,
+        token_expiry_seconds=84600,
+        max_retries=5,
+        retry_backoff_seconds=0,
+        bulk_batch_size=1000,
+    )
+    base.update(overrides)
+    return Config(**base)
+
+def test_generated_csv_has_requested_invalid_ratio(tmp_path: Path):
+    path = generate_csv(tmp_path / "bench.csv", 2000, invalid_ratio=0.25, seed=1)
+    config = make_config()
+
+    results = [validate_customer(c, AgeLimit(), config)[0] for c in CsvSource(path).row()]
+
+    assert len(results) == 2000
+    assert 0.2 < results.count(False) / len(results) < 0.3
+
+def test_fake_server_expires_tokens():
+    with FakeShowAds(FakeSettings(token_ttl_seconds=0.2)) as fake:
+        client = ShowAdsClient(make_config(api_base_url=fake.url))
+        assert client.show_banners_bulk([Banner("c1", 5), Banner("c2", 6)])
+        time.sleep(0.3)
+        assert client.show_banner(Banner("c3", 7))
+
+        snapshot = fake.snapshot()
+
+    assert snapshot["banners_shown"] == 3
+    assert snapshot["counts"]["/auth"] == 2
+    assert snapshot["counts"]["401"] == 1
+    assert len(snapshot["bulk_latencies"]) == 1
+
+def test_fake_server_injects_errors():
+    with FakeShowAds() as fake:
+        client = ShowAdsClient(make_config(api_base_url=fake.url, max_retries=2))
+        assert client.show_banner(Banner("c1", 5))
+        fake.settings = FakeSettings(rate_429=1.0, retry_after_seconds=1)
+
+        assert not client.show_banner(Banner("c1", 5))
+
+        assert fake.snapshot()["counts"]["429"] == 2
+
+def test_fake_server_decodes_compressed_bulk_bodies():
+    banners = [Banner(f"cookie-{i}", i % 99 + 1) for i in range(500)]
+    with FakeShowAds() as fake:
+        plain = ShowAdsClient(make_config(api_base_url=fake.url))
+        assert plain.show_banners_bulk(banners)
+        uncompressed = fake.snapshot()["bytes_received"]
+        fake.reset()
+        gzipped = ShowAdsClient(make_config(api_base_url=fake.url, request_compression="gzip"))
+        assert gzipped.show_banners_bulk(banners)
+        snapshot = fake.snapshot()
+
+    assert snapshot["banners_shown"] == 500
+    assert snapshot["bytes_decoded"] == uncompressed
+    assert snapshot["bytes_received"] < uncompressed / 4
+
+def test_regressions_compare_throughput_and_p99():
+    def result(rows_per_second: float, p99: float) -> dict:
+        return {"scenarios": [{"name": "cli", "rows_per_second": rows_per_second, "batch_latency_ms": {"p99": p99}}]}
+
+    assert regressions(result(90, 10), result(100, 10), tolerance=0.2) == []
+    assert len(regressions(result(70, 13), result(100, 10), tolerance=0.2)) == 2
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+
+def test_encoders_write_the_same_bulk_body():
+    banners = [Banner(f"cookie-{i}", i % 99 + 1) for i in range(50)] + [Banner('quo"te-é', 7)]
+    bodies = {name: json.loads(encode(banners)) for name, encode in encoders().items() if name != "orjson_dataclasses"}
+
+    assert {"json", "template", "template_buffer"} <= set(bodies)
+    assert all(body == bodies["json"] for body in bodies.values())
+    timings = measure(banners=50, repeat=3)
+    assert {t.name for t in timings} == set(encoders())
+    assert timings[0].relative == 1.0
+
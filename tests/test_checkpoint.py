@@ -0,0 +1,109 @@
+import asyncio
+import csv
+from pathlib import Path
+
+import pytest
+
+from src.checkpoint import Checkpoint, CheckpointStore, file_digest
+from src.config import Config
+from src.csv_loader import CsvSource
+from src.models import AgeLimit
+from src.processor import ProcessStats, process_csv, process_csv_async
+
+def make_config(**overrides) -> Config:
+    base = dict(
+        api_base_url="https://api.example",
+        project_key="dev-key",
+        min_banner_id=1,
+        max_banner_id=99,
+        token_expiry_seconds=84600,
+        max_retries=5,
+        retry_backoff_seconds=2,
+        bulk_batch_size=3,
+    )
+    base.update(overrides)
+    return Config(**base)
+
+def write_csv(path: Path, count: int) -> Path:
+    with path.open("w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Name", "Age", "Cookie", "Banner_id"])
+        for i in range(count):
+            writer.writerow(["John Doe", "30", f"c{i}", "5"])
+    return path
+
+class CrashingClient:
+    """Accepts crash_after bulk requests, then fails like a dying process."""
+    def __init__(self, crash_after: int | None = None):
+        self.crash_after = crash_after
+        self.cookies: list[str] = []
+
+    def show_banners_bulk(self, banners, retry_budget=None):
+        if self.crash_after is not None and len(self.cookies) >= self.crash_after * 3:
+            raise RuntimeError("crash")
+        self.cookies.extend(b.visitor_cookie for b in banners)
+        return True
+
+class AsyncCrashingClient(CrashingClient):
+    async def show_banners_bulk(self, banners, retry_budget=None):
+        return super().show_banners_bulk(banners)
+
+def test_rows_with_offsets_resume_after_offset(tmp_path):
+    source = CsvSource(write_csv(tmp_path / "data.csv", 5))
+
+    rows = list(source.rows_with_offsets())
+    resumed = list(source.rows_with_offsets(rows[1][1]))
+
+    assert [c.cookie for c, _ in resumed] == ["c2", "c3", "c4"]
+    assert rows[-1][1] == (tmp_path / "data.csv").stat().st_size
+
+
+def test_resume_skips_delivered_batches(tmp_path):
+    path = write_csv(tmp_path / "data.csv", 10)
+    store = CheckpointStore(tmp_path / "checkpoints.sqlite3")
+    key = file_digest(path)
+
+    first = CrashingClient(crash_after=2)
+    with pytest.raises(RuntimeError):
+        process_csv(str(path), make_config(), AgeLimit(), first, checkpoint=Checkpoint(store, key))
+
+    second = CrashingClient()
+    valid, _ = process_csv(str(path), make_config(), AgeLimit(), second, checkpoint=Checkpoint(store, key))
+
+    assert first.cookies == [f"c{i}" for i in range(6)]
+    assert second.cookies == [f"c{i}" for i in range(6, 10)]
+    assert valid == 4
+    # A finished file is not sent again
+    assert Checkpoint(store, key).offset == path.stat().st_size
+
+
+def test_async_checkpoint_reaches_end_of_file(tmp_path):
+    path = write_csv(tmp_path / "data.csv", 10)
+    store = CheckpointStore(tmp_path / "checkpoints.sqlite3")
+    checkpoint = Checkpoint(store, file_digest(path))
+
+    asyncio.run(process_csv_async(str(path), make_config(), AgeLimit(), AsyncCrashingClient(), checkpoint=checkpoint))
+
+    assert store.get(checkpoint.key) == path.stat().st_size
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_completed_run_is_not_read_again_on_resume(tmp_path, use_async):
+    path = write_csv(tmp_path / "data.csv", 4)
+    with path.open("a") as f:
+        # Invalid rows at the end of the file
+        f.write("John Doe,10,c8,5\nJohn Doe,30,c9,500\n")
+    store = CheckpointStore(tmp_path / "checkpoints.sqlite3")
+    key = file_digest(path)
+    stats = []
+
+    for client in (AsyncCrashingClient(), AsyncCrashingClient()) if use_async else (CrashingClient(), CrashingClient()):
+        run_stats = ProcessStats()
+        if use_async:
+            asyncio.run(process_csv_async(str(path), make_config(), AgeLimit(), client, run_stats, checkpoint=Checkpoint(store, key)))
+        else:
+            process_csv(str(path), make_config(), AgeLimit(), client, run_stats, checkpoint=Checkpoint(store, key))
+        stats.append((run_stats.rows_read, client.cookies))
+
+    assert stats == [(6, ["c0", "c1", "c2", "c3"]), (0, [])]
+    assert store.get(key) == path.stat().st_size
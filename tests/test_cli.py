@@ -1,5 +1,12 @@
+import json
+
+import pytest
+
+from src import columnar
 from src.config import Config
+from src.csv_loader import Reject
 from src.models import AgeLimit
+from src.processor import FileSummary
 import src.cli as cli
 
 
@@ -34,7 +41,7 @@ def test_main_happy_path_default_age(monkeypatch):
 
     called = {}
 
-    def fake_process_csv(path, config, age_limit, client):
+    def fake_process_csv(path, config, age_limit, client, **kwargs):
         called["args"] = dict(path=path, config=config, age_limit=age_limit, client=client)
 
     monkeypatch.setattr(cli, "process_csv", fake_process_csv)
@@ -55,7 +62,7 @@ def test_main_with_age_limit(monkeypatch):
 
     captured = {}
 
-    def fake_process_csv(path, config, age_limit, client):
+    def fake_process_csv(path, config, age_limit, client, **kwargs):
         captured["age_limit"] = age_limit
         captured["path"] = path
 
@@ -66,3 +73,201 @@ def test_main_with_age_limit(monkeypatch):
     assert rc == 0
     assert captured["path"] == "data.csv"
     assert captured["age_limit"] == AgeLimit(min_age=21, max_age=65)
+
+
+def test_main_rejects_file_enables_skip_malformed(monkeypatch, tmp_path):
+    monkeypatch.setattr(cli.Config, "load", lambda: make_config())
+    monkeypatch.setattr(cli, "ShowAdsClient", lambda cfg: object())
+
+    captured = {}
+
+    def fake_process_csv(path, config, age_limit, client, on_reject=None, **kwargs):
+        captured["config"] = config
+        on_reject(Reject(line=3, reason="malformed row: Age is not an integer (got 'x')", row={"Name": "Jo", "Age": "x"}))
+
+    monkeypatch.setattr(cli, "process_csv", fake_process_csv)
+    rejects_path = tmp_path / "rejects.csv"
+
+    rc = cli.main(["data.csv", "--rejects", str(rejects_path)])
+
+    assert rc == 0
+    assert captured["config"].skip_malformed_rows
+    assert rejects_path.read_text().splitlines() == [
+        "line,reason,Name,Age,Cookie,Banner_id",
+        "3,malformed row: Age is not an integer (got 'x'),Jo,x,,",
+    ]
+
+
+def test_main_reads_stdin_as_live_stream(monkeypatch):
+    monkeypatch.setattr(cli.Config, "load", lambda: make_config())
+    monkeypatch.setattr(cli, "ShowAdsClient", lambda cfg: object())
+
+    captured = {}
+
+    def fake_process_source(source, config, age_limit, client, **kwargs):
+        captured["source"] = source
+        captured["config"] = config
+
+    monkeypatch.setattr(cli, "process_source", fake_process_source)
+
+    rc = cli.main(["-", "--max-linger", "0.5"])
+
+    assert rc == 0
+    assert captured["source"].live
+    assert captured["source"].name == "<stdin>"
+    assert captured["config"].max_linger_seconds == 0.5
+
+
+def test_main_sends_several_files_through_one_client(monkeypatch, tmp_path):
+    monkeypatch.setattr(cli.Config, "load", lambda: make_config())
+    clients = []
+    monkeypatch.setattr(cli, "ShowAdsClient", lambda cfg: clients.append(object()) or clients[-1])
+    for name in ("a.csv", "b.csv"):
+        (tmp_path / name).write_text("Name,Age,Cookie,Banner_id\n")
+
+    captured = {}
+
+    def fake_process_source(source, config, age_limit, client, stats=None, **kwargs):
+        captured["paths"] = [part.path.name for part in source.sources]
+        stats.files.append(FileSummary("a.csv", rows_read=2, valid=2, banners_sent=1))
+
+    monkeypatch.setattr(cli, "process_source", fake_process_source)
+    summary = tmp_path / "summary.csv"
+
+    rc = cli.main([str(tmp_path / "*.csv"), "--summary", str(summary)])
+
+    assert rc == 0
+    assert len(clients) == 1
+    assert captured["paths"] == ["a.csv", "b.csv"]
+    assert summary.read_text().splitlines() == [
+        "path,rows_read,valid,invalid,malformed,banners_sent,banners_failed,duplicates",
+        "a.csv,2,2,0,0,1,0,1",
+    ]
+
+
+def test_main_dry_run_prints_report_without_a_client(monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(cli.Config, "load", lambda: make_config(bulk_batch_size=1))
+
+    def no_client(cfg):
+        raise AssertionError("dry run must not create a client")
+
+    monkeypatch.setattr(cli, "ShowAdsClient", no_client)
+    path = tmp_path / "data.csv"
+    path.write_text("Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJane Doe,40,c2,5\nBad1,30,c3,5\n")
+
+    rc = cli.main([str(path), "--dry-run"])
+
+    report = json.loads(capsys.readouterr().out)
+    assert rc == 0
+    assert (report["valid"], report["invalid"], report["bulk_requests"]) == (2, 1, 2)
+    assert report["banner_ids"] == {"5": 3}
+
+
+def test_main_dry_run_validates_with_the_selected_engine(monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(cli.Config, "load", lambda: make_config(bulk_batch_size=1))
+    engines = []
+    validated_chunks = columnar.validated_chunks
+
+    def recording(*args, **kwargs):
+        engines.append("columnar")
+        return validated_chunks(*args, **kwargs)
+
+    monkeypatch.setattr(columnar, "validated_chunks", recording)
+    path = tmp_path / "data.csv"
+    path.write_text("Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJane Doe,40,c2,5\nBad1,30,c3,5\n")
+
+    rc = cli.main([str(path), "--dry-run", "--engine", "columnar"])
+
+    report = json.loads(capsys.readouterr().out)
+    assert rc == 0
+    assert engines == ["columnar"]
+    assert (report["valid"], report["invalid"], report["bulk_requests"]) == (2, 1, 2)
+    assert report["ages"] == {"30": 2, "40": 1}
+    assert report["banner_ids"] == {"5": 3}
+
+
+def test_main_uses_settings_of_the_given_profile(monkeypatch, tmp_path):
+    profiles_file = tmp_path / "profiles.json"
+    profiles_file.write_text(json.dumps({"acme": {"project_key": "acme-key", "min_age": 30, "max_age": 60}}))
+    config = make_config(state_dir=str(tmp_path), profiles_file=str(profiles_file))
+    monkeypatch.setattr(cli.Config, "load", lambda: config)
+    monkeypatch.setattr(cli, "ShowAdsClient", lambda cfg: object())
+    captured = {}
+
+    def fake_process_csv(path, config, age_limit, client, **kwargs):
+        captured.update(config=config, age_limit=age_limit)
+
+    monkeypatch.setattr(cli, "process_csv", fake_process_csv)
+
+    rc = cli.main(["data.csv", "--profile", "acme"])
+
+    assert rc == 0
+    assert captured["config"].project_key == "acme-key"
+    assert captured["config"].state_dir == str(tmp_path / "profiles" / "acme")
+    assert captured["age_limit"] == AgeLimit(min_age=30, max_age=60)
+    with pytest.raises(SystemExit, match="Unknown profile: missing"):
+        cli.main(["data.csv", "--profile", "missing"])
+
+
+def test_main_resume_sends_a_finished_file_once_and_closes_the_store(monkeypatch, tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJane Doe,10,c2,5\n")
+    config = make_config(state_dir=str(tmp_path / "state"))
+    monkeypatch.setattr(cli.Config, "load", lambda: config)
+    sent = []
+
+    class DummyClient:
+        def __init__(self, cfg: Config):
+            pass
+
+        def show_banners_bulk(self, banners, retry_budget=None):
+            sent.append([b.visitor_cookie for b in banners])
+            return True
+
+    closed = []
+
+    class ClosingStore(cli.CheckpointStore):
+        def close(self):
+            closed.append(True)
+            super().close()
+
+    monkeypatch.setattr(cli, "ShowAdsClient", DummyClient)
+    monkeypatch.setattr(cli, "CheckpointStore", ClosingStore)
+
+    assert cli.main([str(path), "--resume"]) == 0
+    assert cli.main([str(path), "--resume"]) == 0
+
+    assert sent == [["c1"]]
+    assert closed == [True, True]
+
+
+def test_main_dedup_sends_a_banner_once_and_closes_the_index(monkeypatch, tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\n")
+    config = make_config(state_dir=str(tmp_path / "state"))
+    monkeypatch.setattr(cli.Config, "load", lambda: config)
+    sent = []
+
+    class DummyClient:
+        def __init__(self, cfg: Config):
+            pass
+
+        def show_banners_bulk(self, banners, retry_budget=None):
+            sent.append([b.visitor_cookie for b in banners])
+            return True
+
+    closed = []
+
+    class ClosingIndex(cli.DedupIndex):
+        def close(self):
+            closed.append(True)
+            super().close()
+
+    monkeypatch.setattr(cli, "ShowAdsClient", DummyClient)
+    monkeypatch.setattr(cli, "DedupIndex", ClosingIndex)
+
+    assert cli.main([str(path), "--dedup"]) == 0
+    assert cli.main([str(path), "--dedup"]) == 0
+
+    assert sent == [["c1"]]
+    assert closed == [True, True]
@@ -0,0 +1,197 @@
+import io
+from pathlib import Path
+
+import pytest
+
+from src import columnar
+from src.columnar import validated_chunks
+from src.config import Config
+from src.csv_loader import CsvSource, CsvStreamSource
+from src.models import AgeLimit
+from src.processor import ProcessStats, process_csv, process_source
+from tests.fakes import RecordingClient
+
+def make_config(**overrides) -> Config:
+    base = dict(
+        api_base_url="https://api.example",
+        project_key="dev-key",
+        min_banner_id=1,
+        max_banner_id=99,
+        token_expiry_seconds=84600,
+        max_retries=5,
+        retry_backoff_seconds=2,
+        bulk_batch_size=1000,
+    )
+    base.update(overrides)
+    return Config(**base)
+
+CSV = (
+    "Name,Age,Cookie,Banner_id\n"
+    "John Doe,30, c1 ,5\n"
+    "Bad_Name,30,c2,5\n"
+    "Old Man,120,c3,5\n"
+    "Jane Doe,40,c4,100\n"
+    "  Ann  ,18,c5,1\n"
+)
+
+def run(tmp_path: Path, text: str, engine: str, **overrides) -> tuple[ProcessStats, list, list]:
+    path = tmp_path / "data.csv"
+    path.write_text(text)
+    client = RecordingClient()
+    stats = ProcessStats()
+    rejects = []
+    config = make_config(bulk_batch_size=2, validation_engine=engine, **overrides)
+    process_csv(str(path), config, AgeLimit(), client, stats, on_reject=rejects.append)
+    return stats, client.bulk, rejects
+
+def test_columnar_matches_python_engine(tmp_path: Path):
+    expected = run(tmp_path, CSV, "python")
+    stats, bulk, errors = run(tmp_path, CSV, "columnar")
+
+    assert (stats.rows_read, stats.valid, stats.invalid) == (5, 2, 3)
+    assert [r.row["Cookie"] for r in errors] == ["c2", "c3", "c4"]
+    assert stats.counts() == expected[0].counts()
+    assert (bulk, errors) == expected[1:]
+
+def test_unparsable_numbers_fall_back_to_row_parser(tmp_path: Path):
+    text = "Name,Age,Cookie,Banner_id\nJohn Doe, 30,c1,5\nJane Doe,1_000,c2,5\n"
+    expected = run(tmp_path, text, "python")
+    stats, bulk, errors = run(tmp_path, text, "columnar")
+
+    assert (stats.valid, stats.invalid) == (1, 1)
+    assert (bulk, errors) == expected[1:]
+
+    with pytest.raises(ValueError, match="Invalid row"):
+        run(tmp_path, "Name,Age,Cookie,Banner_id\nJohn Doe,thirty,c1,5\n", "columnar")
+
+def test_missing_headers_raise(tmp_path: Path):
+    path = tmp_path / "data.csv"
+    path.write_text("Name,Age\nJohn,30\n")
+    with pytest.raises(ValueError, match="Missing headers"):
+        list(validated_chunks(CsvSource(path), make_config(), AgeLimit()))
+
+def test_reads_binary_streams_in_blocks():
+    rows = "".join(f"John Doe,30,c{i},5\n" for i in range(2000))
+    stream = io.BytesIO(("Name,Age,Cookie,Banner_id\n" + rows).encode())
+
+    chunks = list(validated_chunks(CsvStreamSource(stream), make_config(), AgeLimit(), block_size=4096))
+
+    assert len(chunks) > 1
+    assert sum(read for read, _, _ in chunks) == 2000
+    assert [b.visitor_cookie for _, banners, _ in chunks for b in banners][-1] == "c1999"
+
+def test_stream_source_through_processor():
+    stream = io.BytesIO(CSV.encode())
+    client = RecordingClient()
+
+    valid, invalid = process_source(CsvStreamSource(stream), make_config(validation_engine="columnar"), AgeLimit(), client)
+
+    assert (valid, invalid) == (2, 3)
+    assert [b.visitor_cookie for b in client.bulk[0]] == ["c1", "c5"]
+
+def test_skip_malformed_rows_match_python_engine(tmp_path: Path):
+    text = "Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJane Doe,thirty,c2,5\nAnn,20,c3,7\n"
+    path = tmp_path / "data.csv"
+    path.write_text(text)
+    rejects = {}
+    for engine in ("python", "columnar"):
+        rejects[engine] = []
+        config = make_config(validation_engine=engine, skip_malformed_rows=True)
+        stats = ProcessStats()
+        process_csv(str(path), config, AgeLimit(), RecordingClient(), stats, on_reject=rejects[engine].append)
+        assert (stats.rows_read, stats.valid, stats.invalid, stats.malformed) == (3, 2, 1, 1)
+
+    assert rejects["columnar"] == rejects["python"]
+
+MALFORMED_CSV = (
+    "Name,Age,Cookie,Banner_id\n"
+    "John Doe,30,c1,5\n"
+    "\n"
+    "Jane Doe,3\n"
+    "\r\n"
+    "\n"
+    "Ann,thirty,c3,5\n"
+    "Bob,40,c4,5\n"
+    "Eve\n"
+    "Old Man,120,c5,5\n"
+)
+
+def test_malformed_rows_and_lines_match_python_engine(tmp_path: Path):
+    path = tmp_path / "data.csv"
+    path.write_bytes(MALFORMED_CSV.encode())
+    results = {}
+    for engine in ("python", "columnar"):
+        rejects = []
+        stats = ProcessStats()
+        config = make_config(validation_engine=engine, skip_malformed_rows=True)
+        process_csv(str(path), config, AgeLimit(), RecordingClient(), stats, on_reject=rejects.append)
+        results[engine] = stats.counts(), sorted(rejects, key=lambda r: (r.line or 0, r.reason))
+
+    assert results["columnar"] == results["python"]
+    assert [r.line for r in results["columnar"][1] if r.line is not None] == [4, 7, 9]
+
+
+def test_malformed_lines_are_found_across_reads(tmp_path: Path):
+    rows = "".join(f"John Doe,30,c{i},5\n\n" for i in range(500)) + "Jane Doe,3\n"
+    stream = io.BytesIO(("Name,Age,Cookie,Banner_id\n" + rows).encode())
+    malformed = []
+
+    chunks = list(validated_chunks(CsvStreamSource(stream), make_config(), AgeLimit(), block_size=1024, on_malformed=malformed.append))
+
+    assert sum(read for read, _, _ in chunks) == 500
+    assert [r.line for r in malformed] == [1002]
+
+
+def test_missing_fields_without_skip_raise_like_the_python_engine(tmp_path: Path):
+    text = "Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJane Doe,3\n"
+    errors = {}
+    for engine in ("python", "columnar"):
+        with pytest.raises(ValueError, match="Invalid row") as exc:
+            run(tmp_path, text, engine)
+        errors[engine] = str(exc.value)
+
+    assert errors["columnar"] == errors["python"]
+
+EXTRA_FIELDS_CSV = (
+    "Name,Age,Cookie,Banner_id\n"
+    "John Doe,30,c1,5,extra\n"
+    "Jane Doe,40,c2,5\n"
+    "Bad_Name,30,c3,5,x,y\n"
+    "Ann,20,c4,7\n"
+    "Bob,40,c5,5,\n"
+)
+
+@pytest.mark.parametrize("skip_malformed", [False, True])
+def test_extra_fields_are_ignored_like_the_python_engine(tmp_path: Path, skip_malformed: bool):
+    expected = run(tmp_path, EXTRA_FIELDS_CSV, "python", skip_malformed_rows=skip_malformed)
+    stats, bulk, errors = run(tmp_path, EXTRA_FIELDS_CSV, "columnar", skip_malformed_rows=skip_malformed)
+
+    assert (stats.rows_read, stats.valid, stats.invalid, stats.malformed) == (5, 4, 1, 0)
+    assert stats.counts() == expected[0].counts()
+    assert (bulk, errors) == expected[1:]
+
+def test_records_with_other_field_counts_keep_file_order_across_blocks(tmp_path: Path):
+    rows = []
+    for i in range(600):
+        row = f"John Doe,30,c{i},5"
+        rows.append(row + ",extra" if i % 3 == 0 else "Jane Doe,3" if i % 50 == 1 else row)
+    text = "Name,Age,Cookie,Banner_id\n" + "\n".join(rows) + "\n\nJohn Doe,30,last,5,extra\n"
+    path = tmp_path / "data.csv"
+    path.write_text(text)
+    expected = run(tmp_path, text, "python", skip_malformed_rows=True)
+    malformed = []
+
+    chunks = list(validated_chunks(CsvSource(path), make_config(), AgeLimit(), block_size=1024, on_malformed=malformed.append))
+
+    expected_cookies = [b.visitor_cookie for batch in expected[1] for b in batch]
+    assert [b.visitor_cookie for _, banners, _ in chunks for b in banners] == expected_cookies
+    assert expected_cookies[-1] == "last"
+    assert sum(read for read, _, _ in chunks) == expected[0].rows_read - expected[0].malformed
+    assert malformed == [r for r in expected[2] if r.line is not None]
+
+def test_inputs_where_most_records_have_extra_fields_go_to_the_row_parser(tmp_path: Path, monkeypatch):
+    text = "Name,Age,Cookie,Banner_id\n" + "".join(f"John Doe,30,c{i},5,\n" for i in range(50)) + "Jane Doe,3\n"
+    expected = run(tmp_path, text, "python", skip_malformed_rows=True)
+    monkeypatch.setattr(columnar.pa_csv, "open_csv", None)
+
+    assert run(tmp_path, text, "columnar", skip_malformed_rows=True)[1:] == expected[1:]
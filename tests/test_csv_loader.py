@@ -1,6 +1,12 @@
 import csv
+import gzip
+import io
 from pathlib import Path
-from src.csv_loader import CsvSource
+
+import zstandard
+
+from src.csv_loader import ChunkStream, CsvSource, CsvStreamSource, FollowStream, expand_paths
+from src.models import Customer
 
 def write_csv(path: Path, headers: list[str], rows: list[dict[str, str]]) -> Path:
     with path.open("w") as f:
@@ -31,4 +37,157 @@ def test_csv_loader_missing_headers(tmp_path):
 		list(source.row())
 		assert False, "expected ValueError for missing headers"
 	except ValueError:
-		pass
\ No newline at end of file
+		pass
+
+def test_csv_stream_source_reads_binary_and_text_streams():
+	data = "Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJane Doe,20,c2,10\n"
+
+	from_bytes = list(CsvStreamSource(io.BytesIO(data.encode())).row())
+	from_text = list(CsvStreamSource(io.StringIO(data)).row())
+
+	assert from_bytes == from_text
+	assert [c.cookie for c in from_bytes] == ["c1", "c2"]
+
+
+def test_csv_stream_source_yields_rows_before_stream_ends():
+	pulled = []
+
+	def chunks():
+		for chunk in [b"Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\n", b"Jane Doe,20,c2,10\n"]:
+			pulled.append(chunk)
+			yield chunk
+
+	source = CsvStreamSource(io.BufferedReader(ChunkStream(chunks())))
+	rows = source.row()
+
+	first = next(rows)
+	assert first.cookie == "c1"
+	assert len(pulled) == 1
+	assert [c.cookie for c in rows] == ["c2"]
+
+
+def test_csv_loader_reports_malformed_rows_with_line_numbers(tmp_path):
+	path = tmp_path / "test.csv"
+	path.write_text("Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJane Doe,thirty,c2,5\nShort Row,20\nAnn,20,c4,7\n")
+	rejects = []
+
+	items = list(CsvSource(path).row(rejects.append))
+
+	assert [c.cookie for c in items] == ["c1", "c4"]
+	assert [(r.line, r.reason) for r in rejects] == [
+		(3, "malformed row: Age is not an integer (got 'thirty')"),
+		(4, "malformed row: missing Banner_id"),
+	]
+	assert rejects[0].row["Age"] == "thirty"
+
+
+def test_csv_loader_reject_lines_stay_absolute_after_resume(tmp_path):
+	path = tmp_path / "test.csv"
+	path.write_text("Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJane Doe,20,c2,5\nBad,x,c3,5\n")
+	offset = len("Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\n")
+	rejects = []
+
+	items = list(CsvSource(path).rows_with_offsets(offset, rejects.append))
+
+	assert [c.cookie for c, _ in items] == ["c2"]
+	assert [r.line for r in rejects] == [4]
+
+
+def test_follow_stream_waits_for_appended_rows(tmp_path):
+	path = tmp_path / "data.csv"
+	path.write_text("Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\n")
+
+	with io.BufferedReader(FollowStream(path.open("rb", buffering=0), poll_seconds=0.01)) as stream:
+		rows = CsvStreamSource(stream, live=True).row()
+		assert next(rows).cookie == "c1"
+		with path.open("a") as f:
+			f.write("Jane Doe,20,c2,10\n")
+		assert next(rows).cookie == "c2"
+		rows.close()
+
+
+def test_expand_paths_lists_directories_globs_and_files_once(tmp_path):
+	drop = tmp_path / "drop"
+	drop.mkdir()
+	for name in ("b.csv", "a.csv.gz", "notes.txt"):
+		(drop / name).write_text("")
+
+	paths = expand_paths([str(drop), str(drop / "b*.csv"), str(tmp_path / "missing.csv")])
+
+	assert paths == [drop / "a.csv.gz", drop / "b.csv", tmp_path / "missing.csv"]
+
+
+class ReadCounter(io.BytesIO):
+	def __init__(self, data: bytes):
+		super().__init__(data)
+		self.bytes_read = 0
+
+	def read(self, size=-1):
+		data = super().read(size)
+		self.bytes_read += len(data)
+		return data
+
+	def readline(self, size=-1):
+		data = super().readline(size)
+		self.bytes_read += len(data)
+		return data
+
+	def __next__(self):
+		line = self.readline()
+		if not line:
+			raise StopIteration
+		return line
+
+
+def test_resume_seeks_past_sent_rows_unless_lines_are_needed():
+	header = b"Name,Age,Cookie,Banner_id\n"
+	prefix = b"John Doe,30,c1,5\n" * 1000
+	data = header + prefix + b"Jane Doe,20,c2,10\n"
+
+	stream = ReadCounter(data)
+	items = list(CsvStreamSource(stream).rows_with_offsets(len(header + prefix)))
+	assert [(c.cookie, end) for c, end in items] == [("c2", len(data))]
+	assert stream.bytes_read < len(prefix)
+
+	stream = ReadCounter(data + b"Ann,x,c3,5\n")
+	rejects = []
+	list(CsvStreamSource(stream).rows_with_offsets(len(header + prefix), rejects.append))
+	assert [r.line for r in rejects] == [1003]
+
+
+def test_gzip_files_and_streams_are_decompressed_while_read(tmp_path):
+	data = "Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJane Doe,20,c2,10\n"
+	path = tmp_path / "test.csv.gz"
+	path.write_bytes(gzip.compress(data.encode()))
+	offset = len("Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\n")
+
+	assert [c.cookie for c in CsvSource(path).row()] == ["c1", "c2"]
+	assert [(c.cookie, end) for c, end in CsvSource(path).rows_with_offsets(offset)] == [("c2", len(data))]
+	stream = CsvStreamSource(io.BytesIO(gzip.compress(data.encode())), compression="gzip")
+	assert [c.cookie for c in stream.row()] == ["c1", "c2"]
+
+
+def test_zstd_files_and_streams_are_decompressed_while_read(tmp_path):
+	data = "Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJane Doe,20,c2,10\n"
+	compressed = zstandard.ZstdCompressor().compress(data.encode())
+	path = tmp_path / "test.csv.zst"
+	path.write_bytes(compressed)
+	offset = len("Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\n")
+
+	assert CsvSource(path).compression == "zstd"
+	assert [c.cookie for c in CsvSource(path).row()] == ["c1", "c2"]
+	assert [(c.cookie, end) for c, end in CsvSource(path).rows_with_offsets(offset)] == [("c2", len(data))]
+	stream = CsvStreamSource(io.BytesIO(compressed), compression="zstd")
+	assert [c.cookie for c in stream.row()] == ["c1", "c2"]
+
+
+def test_csv_loader_reads_columns_by_header_position(tmp_path):
+	path = tmp_path / "test.csv"
+	path.write_text("Banner_id,Cookie,Extra,Age,Name\n5, c1 ,x,30, John Doe \n\n7,c2,y\n")
+	rejects = []
+
+	items = list(CsvSource(path).row(rejects.append))
+
+	assert items == [Customer(name="John Doe", age=30, cookie="c1", banner_id=5)]
+	assert [(r.line, r.reason) for r in rejects] == [(4, "malformed row: missing Age")]
+	assert rejects[0].row == {"Banner_id": "7", "Cookie": "c2", "Extra": "y", "Age": None, "Name": None}
@@ -0,0 +1,79 @@
+import csv
+import time
+from pathlib import Path
+
+from src.config import Config
+from src.dedup import DedupIndex
+from src.models import AgeLimit, Banner
+from src.processor import ProcessStats, process_csv
+from tests.fakes import RecordingClient
+
+def make_config(**overrides) -> Config:
+    base = dict(
+        api_base_url="https://api.example",
+        project_key="dev-key",
+        min_banner_id=1,
+        max_banner_id=99,
+        token_expiry_seconds=84600,
+        max_retries=5,
+        retry_backoff_seconds=2,
+        bulk_batch_size=4,
+    )
+    base.update(overrides)
+    return Config(**base)
+
+def write_csv(path: Path, cookies: list[str]) -> Path:
+    with path.open("w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Name", "Age", "Cookie", "Banner_id"])
+        for cookie in cookies:
+            writer.writerow(["John Doe", "30", cookie, "5"])
+    return path
+
+def banner(cookie: str, banner_id: int = 5) -> Banner:
+    return Banner(visitor_cookie=cookie, banner_id=banner_id)
+
+def test_filter_new_drops_repeats_within_a_run(tmp_path):
+    index = DedupIndex(tmp_path / "dedup.sqlite3", ttl_seconds=60)
+
+    first = index.filter_new([banner("a"), banner("b"), banner("a")])
+    second = index.filter_new([banner("b"), banner("c"), banner("a", banner_id=6)])
+
+    assert first == [banner("a"), banner("b")]
+    assert second == [banner("c"), banner("a", banner_id=6)]
+
+
+def test_delivered_pairs_are_skipped_by_later_runs_until_ttl(tmp_path):
+    db_path = tmp_path / "dedup.sqlite3"
+    index = DedupIndex(db_path, ttl_seconds=60)
+    index.filter_new([banner("a")])
+    index.mark_delivered([banner("a")])
+    index.close()
+
+    assert DedupIndex(db_path, ttl_seconds=60).filter_new([banner("a"), banner("b")]) == [banner("b")]
+    time.sleep(0.05)
+    assert DedupIndex(db_path, ttl_seconds=0.01).filter_new([banner("a")]) == [banner("a")]
+
+
+def test_process_csv_counts_duplicates_and_keeps_batches_full(tmp_path):
+    path = write_csv(tmp_path / "data.csv", ["a", "b", "a", "c", "b", "d", "e", "a", "f"])
+    client = RecordingClient()
+    stats = ProcessStats()
+
+    process_csv(str(path), make_config(), AgeLimit(), client, stats, dedup=DedupIndex(tmp_path / "dedup.sqlite3", 60))
+
+    assert client.bulk_cookies() == [["a", "b", "c", "d"], ["e", "f"]]
+    assert (stats.valid, stats.duplicates, stats.banners_sent) == (9, 3, 6)
+
+
+def test_failed_banners_are_not_remembered_as_delivered(tmp_path):
+    path = write_csv(tmp_path / "data.csv", ["a", "bad", "c"])
+    db_path = tmp_path / "dedup.sqlite3"
+
+    process_csv(str(path), make_config(), AgeLimit(), RecordingClient(failing={"bad"}), dedup=DedupIndex(db_path, 60))
+    rerun = RecordingClient()
+    stats = ProcessStats()
+    process_csv(str(path), make_config(), AgeLimit(), rerun, stats, dedup=DedupIndex(db_path, 60))
+
+    assert rerun.bulk_cookies() == [["bad"]]
+    assert stats.duplicates == 2
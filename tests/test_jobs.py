@@ -0,0 +1,177 @@
+import csv
+import gzip
+import sqlite3
+import time
+from dataclasses import replace
+from pathlib import Path
+
+from src.config import Config
+from src.jobs import Job, JobManager, JobStatus, JobStore
+from src.models import AgeLimit
+from src.profiles import Profile, ProfileRegistry
+from tests.fakes import RecordingClient
+
+def make_config(**overrides) -> Config:
+    base = dict(
+        api_base_url="https://api.example",
+        project_key="dev-key",
+        min_banner_id=1,
+        max_banner_id=99,
+        token_expiry_seconds=84600,
+        max_retries=5,
+        retry_backoff_seconds=2,
+        bulk_batch_size=2,
+    )
+    base.update(overrides)
+    return Config(**base)
+
+def write_upload(path: Path, rows: int) -> None:
+    with path.open("w") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Name", "Age", "Cookie", "Banner_id"])
+        for i in range(rows):
+            writer.writerow(["John Doe", "30" if i % 2 else "10", f"c{i}", "5"])
+
+def wait_finished(manager: JobManager, job_id: str) -> Job:
+    for _ in range(200):
+        job = manager.get(job_id)
+        if job is not None and job.status.is_finished():
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+def test_job_store_round_trip(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    job = Job(
+        id="j1", status=JobStatus.QUEUED, filename="a.csv", input_path="/tmp/a.csv",
+        min_age=18, max_age=100, use_async=False, created_at=1.0,
+    )
+
+    store.save(job)
+
+    assert store.get("j1") == job
+    assert store.unfinished() == [job]
+    assert store.get("missing") is None
+
+
+def test_job_manager_runs_job_and_persists_counts(tmp_path):
+    config = make_config(state_dir=str(tmp_path))
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    manager = JobManager(config, store, RecordingClient())
+    job_id = manager.new_job_id()
+    write_upload(manager.input_path_for(job_id), rows=5)
+
+    manager.submit(job_id, "a.csv", AgeLimit())
+    job = wait_finished(manager, job_id)
+    manager.shutdown()
+
+    assert job.status == JobStatus.SUCCEEDED
+    assert (job.rows_read, job.valid, job.invalid, job.banners_sent, job.banners_failed) == (5, 2, 3, 2, 0)
+    assert store.get(job_id) == job
+    assert not manager.input_path_for(job_id).exists()
+
+
+
+def test_job_manager_keeps_compressed_uploads_compressed(tmp_path):
+    config = make_config(state_dir=str(tmp_path))
+    manager = JobManager(config, JobStore(tmp_path / "jobs.sqlite3"), RecordingClient())
+    job_id = manager.new_job_id()
+    input_path = manager.input_path_for(job_id, "a.csv.gz")
+    plain = tmp_path / "plain.csv"
+    write_upload(plain, rows=5)
+    input_path.write_bytes(gzip.compress(plain.read_bytes()))
+
+    manager.submit(job_id, "a.csv.gz", AgeLimit())
+    job = wait_finished(manager, job_id)
+    manager.shutdown()
+
+    assert input_path.name == f"{job_id}.csv.gz"
+    assert job.status == JobStatus.SUCCEEDED
+    assert (job.rows_read, job.valid, job.banners_sent) == (5, 2, 2)
+
+def test_recover_requeues_unfinished_jobs(tmp_path):
+    config = make_config(state_dir=str(tmp_path))
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    manager = JobManager(config, store, RecordingClient())
+    write_upload(manager.input_path_for("j1"), rows=3)
+    store.save(Job(
+        id="j1", status=JobStatus.RUNNING, filename="a.csv", input_path=str(manager.input_path_for("j1")),
+        min_age=18, max_age=100, use_async=False, created_at=1.0, started_at=2.0,
+    ))
+
+    assert manager.recover() == 1
+    job = wait_finished(manager, "j1")
+    manager.shutdown()
+
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.rows_read == 3
+
+
+def test_cancel_unknown_job_returns_none(tmp_path):
+    manager = JobManager(make_config(state_dir=str(tmp_path)), JobStore(tmp_path / "jobs.sqlite3"), RecordingClient())
+
+    assert manager.cancel("missing") is None
+    manager.shutdown()
+
+
+def test_cancel_does_not_cancel_a_job_a_worker_started_meanwhile(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    manager = JobManager(make_config(state_dir=str(tmp_path)), store, RecordingClient())
+    input_path = manager.input_path_for("j1")
+    write_upload(input_path, rows=3)
+    queued = Job(
+        id="j1", status=JobStatus.QUEUED, filename="a.csv", input_path=str(input_path),
+        min_age=18, max_age=100, use_async=False, created_at=1.0,
+    )
+    store.save(replace(queued, status=JobStatus.RUNNING, started_at=2.0))
+    real_get = store.get
+    # cancel reads the job while it is still queued, and a worker starts it right after
+    store.get = lambda job_id: queued
+    manager.cancel("j1")
+    store.get = real_get
+    manager.shutdown()
+
+    assert store.get("j1").status == JobStatus.RUNNING
+    assert input_path.exists()
+    assert not store.save_if(replace(queued, status=JobStatus.CANCELLED), JobStatus.QUEUED)
+
+
+def test_job_store_adds_new_columns_to_old_stores(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    conn = sqlite3.connect(str(path))
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, filename TEXT NOT NULL, "
+        "input_path TEXT NOT NULL, min_age INTEGER NOT NULL, max_age INTEGER NOT NULL, "
+        "use_async INTEGER NOT NULL, created_at REAL NOT NULL, started_at REAL, finished_at REAL, error TEXT, "
+        "rows_read INTEGER NOT NULL DEFAULT 0, valid INTEGER NOT NULL DEFAULT 0, invalid INTEGER NOT NULL DEFAULT 0, "
+        "banners_sent INTEGER NOT NULL DEFAULT 0, banners_failed INTEGER NOT NULL DEFAULT 0)"
+    )
+    conn.execute("INSERT INTO jobs (id, status, filename, input_path, min_age, max_age, use_async, created_at) "
+                 "VALUES ('j1', 'queued', 'a.csv', '/tmp/a.csv', 18, 100, 0, 1.0)")
+    conn.commit()
+    conn.close()
+
+    store = JobStore(path)
+
+    assert (store.get("j1").profile, store.get("j1").skip_malformed) == ("default", False)
+
+
+def test_job_manager_runs_job_with_its_profile(tmp_path, monkeypatch):
+    config = make_config(state_dir=str(tmp_path))
+    registry = ProfileRegistry([Profile.of("default", config, {}), Profile.of("acme", config, {"max_banner_id": 4})])
+    monkeypatch.setattr(registry, "client", lambda profile: RecordingClient())
+    manager = JobManager(config, JobStore(tmp_path / "jobs.sqlite3"), RecordingClient(), profiles=registry)
+    acme_id, missing_id = manager.new_job_id(), manager.new_job_id()
+    write_upload(manager.input_path_for(acme_id), rows=4)
+    write_upload(manager.input_path_for(missing_id), rows=4)
+
+    manager.submit(acme_id, "a.csv", AgeLimit(), profile="acme")
+    manager.submit(missing_id, "b.csv", AgeLimit(), profile="missing")
+    acme, missing = wait_finished(manager, acme_id), wait_finished(manager, missing_id)
+    manager.shutdown()
+
+    # Banner id 5 is outside the acme range, so every row is invalid
+    assert acme.status == JobStatus.SUCCEEDED
+    assert (acme.profile, acme.valid, acme.invalid) == ("acme", 0, 4)
+    assert missing.status == JobStatus.FAILED
+    assert "Unknown profile" in missing.error
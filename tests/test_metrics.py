@@ -0,0 +1,79 @@
+from pathlib import Path
+
+from prometheus_client import REGISTRY
+
+import src.cli as cli
+from src.config import Config
+from src.models import AgeLimit, Banner
+from src.processor import process_csv
+from src.showads_client import ShowAdsClient
+from tests.fakes import RecordingClient
+
+def make_config(**overrides) -> Config:
+    base = dict(
+        api_base_url="https://api.example",
+        project_key="dev-key",
+        min_banner_id=1,
+        max_banner_id=99,
+        token_expiry_seconds=84600,
+        max_retries=5,
+        retry_backoff_seconds=0,
+        bulk_batch_size=1000,
+    )
+    base.update(overrides)
+    return Config(**base)
+
+def sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def test_run_counters_are_exported(tmp_path: Path):
+    path = tmp_path / "data.csv"
+    path.write_text("Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nBad_Name,30,c2,5\nJane Doe,40,c3,7\nOld Man,120,c4,5\n")
+    invalid_name = "invalid name: must contain only letters and spaces"
+    names = [
+        ("showads_rows_parsed_total", {}),
+        ("showads_rows_valid_total", {}),
+        ("showads_rows_invalid_total", {"reason": invalid_name}),
+        ("showads_banners_sent_total", {}),
+        ("showads_banners_failed_total", {}),
+        ("showads_bulk_failures_total", {}),
+        ("showads_fallback_requests_total", {"strategy": "single"}),
+        ("showads_csv_parse_seconds_count", {}),
+    ]
+    before = [sample(name, **labels) for name, labels in names]
+
+    process_csv(str(path), make_config(fallback_rate_per_second=0), AgeLimit(), RecordingClient(failing={"c3"}, fail_bulk=True))
+
+    after = [sample(name, **labels) for name, labels in names]
+    assert [a - b for a, b in zip(after, before)] == [4, 2, 1, 1, 1, 1, 2, 1]
+
+def test_client_records_http_latency_and_statuses(requests_mock):
+    config = make_config()
+    requests_mock.post(f"{config.api_base_url}/auth", json={"AccessToken": "abc"})
+    requests_mock.post(f"{config.api_base_url}/banners/show/bulk", [{"status_code": 500}, {"status_code": 200}])
+    before = (
+        sample("showads_http_request_seconds_count", endpoint="/banners/show/bulk"),
+        sample("showads_http_responses_total", endpoint="/banners/show/bulk", status="500"),
+        sample("showads_retry_sleep_seconds_count", reason="backoff"),
+    )
+
+    assert ShowAdsClient(config).show_banners_bulk([Banner("c1", 5)])
+
+    after = (
+        sample("showads_http_request_seconds_count", endpoint="/banners/show/bulk"),
+        sample("showads_http_responses_total", endpoint="/banners/show/bulk", status="500"),
+        sample("showads_retry_sleep_seconds_count", reason="backoff"),
+    )
+    assert [a - b for a, b in zip(after, before)] == [2, 1, 1]
+    assert sample("showads_http_in_flight_requests", endpoint="/banners/show/bulk") == 0
+    assert sample("showads_token_age_seconds") >= 0
+
+def test_cli_writes_metrics_file(monkeypatch, tmp_path: Path):
+    monkeypatch.setattr(cli.Config, "load", lambda: make_config())
+    monkeypatch.setattr(cli, "ShowAdsClient", lambda cfg: object())
+    monkeypatch.setattr(cli, "process_csv", lambda *args, **kwargs: None)
+    metrics_path = tmp_path / "metrics.prom"
+
+    assert cli.main(["data.csv", "--metrics-file", str(metrics_path)]) == 0
+
+    assert "showads_rows_parsed_total" in metrics_path.read_text()
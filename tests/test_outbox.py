@@ -0,0 +1,87 @@
+from pathlib import Path
+
+import src.cli as cli
+from src.config import Config
+from src.models import AgeLimit, Banner
+from src.outbox import Outbox, outbox_path
+from src.processor import ProcessStats, process_csv, replay_outbox
+from tests.fakes import RecordingClient
+
+def make_config(**overrides) -> Config:
+    base = dict(
+        api_base_url="https://api.example",
+        project_key="dev-key",
+        min_banner_id=1,
+        max_banner_id=99,
+        token_expiry_seconds=84600,
+        max_retries=5,
+        retry_backoff_seconds=0,
+        bulk_batch_size=1000,
+    )
+    base.update(overrides)
+    return Config(**base)
+
+def write_csv(path: Path, rows: int) -> Path:
+    lines = ["Name,Age,Cookie,Banner_id"] + [f"John Doe,30,c{i},5" for i in range(rows)]
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+def test_outbox_is_created_on_first_banner(tmp_path):
+    outbox = Outbox(tmp_path / "outbox.sqlite3")
+
+    assert outbox.count() == 0
+    assert list(outbox.batches(10)) == []
+    assert not (tmp_path / "outbox.sqlite3").exists()
+
+    outbox.add([Banner(visitor_cookie="c1", banner_id=1), Banner(visitor_cookie="c2", banner_id=2)], "data.csv")
+    [entries] = list(outbox.batches(10))
+    outbox.remove([entries[0][0]])
+
+    assert [banner.visitor_cookie for _, banner in entries] == ["c1", "c2"]
+    assert outbox.count() == 1
+    outbox.close()
+
+
+def test_undelivered_banners_are_dead_lettered_and_replayed(tmp_path):
+    path = write_csv(tmp_path / "data.csv", 6)
+    outbox = Outbox(tmp_path / "outbox.sqlite3")
+    stats = ProcessStats()
+
+    process_csv(str(path), make_config(), AgeLimit(), RecordingClient({"c1", "c4"}), stats, outbox=outbox)
+
+    assert (stats.banners_sent, stats.banners_failed, stats.dead_lettered) == (4, 2, 2)
+    assert outbox.count() == 2
+
+    # c4 is still failing, so only c1 leaves the outbox
+    client = RecordingClient({"c4"})
+    assert replay_outbox(outbox, make_config(), client) == (1, 1)
+    assert [[b.visitor_cookie for b in batch] for batch in client.bulk][0] == ["c1", "c4"]
+    assert [banner.visitor_cookie for entries in outbox.batches(10) for _, banner in entries] == ["c4"]
+    outbox.close()
+
+
+def test_cli_replay_exits_with_1_while_banners_remain(monkeypatch, tmp_path):
+    config = make_config(state_dir=str(tmp_path))
+    monkeypatch.setattr(cli.Config, "load", lambda: config)
+    outbox = Outbox(outbox_path(config.state_dir))
+    outbox.add([Banner(visitor_cookie="c1", banner_id=1), Banner(visitor_cookie="c2", banner_id=1)], "data.csv")
+    outbox.close()
+
+    monkeypatch.setattr(cli, "ShowAdsClient", lambda cfg: RecordingClient({"c2"}))
+    assert cli.main(["replay", "--batch-size", "1"]) == 1
+
+    monkeypatch.setattr(cli, "ShowAdsClient", lambda cfg: RecordingClient(set()))
+    assert cli.main(["replay"]) == 0
+    assert Outbox(outbox_path(config.state_dir)).count() == 0
+
+
+def test_cli_processes_a_csv_file_named_replay_given_as_a_path(monkeypatch, tmp_path):
+    config = make_config(state_dir=str(tmp_path / "state"))
+    monkeypatch.setattr(cli.Config, "load", lambda: config)
+    client = RecordingClient(set())
+    monkeypatch.setattr(cli, "ShowAdsClient", lambda cfg: client)
+    (tmp_path / "replay").write_text("Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\n")
+    monkeypatch.chdir(tmp_path)
+
+    assert cli.main(["./replay"]) == 0
+    assert client.bulk_cookies() == [["c1"]]
@@ -0,0 +1,171 @@
+import csv
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from src import parallel
+from src.checkpoint import Checkpoint, CheckpointStore
+from src.config import Config
+from src.csv_loader import CsvSource
+from src.models import AgeLimit
+from src.parallel import byte_ranges, validated_ranges
+from src.processor import ProcessStats, process_csv
+from tests.fakes import RecordingClient
+
+def make_config(**overrides) -> Config:
+    base = dict(
+        api_base_url="https://api.example",
+        project_key="dev-key",
+        min_banner_id=1,
+        max_banner_id=99,
+        token_expiry_seconds=84600,
+        max_retries=5,
+        retry_backoff_seconds=2,
+        bulk_batch_size=1000,
+    )
+    base.update(overrides)
+    return Config(**base)
+
+def write_csv(path: Path, count: int) -> Path:
+    with path.open("w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Name", "Age", "Cookie", "Banner_id"])
+        for i in range(count):
+            name = "Bad_Name" if i % 7 == 0 else "John Doe"
+            writer.writerow([name, 18 + i % 90, f"c{i}", i % 120])
+    return path
+
+def test_byte_ranges_cover_data_lines(tmp_path: Path):
+    path = write_csv(tmp_path / "data.csv", 500)
+    data = path.read_bytes()
+
+    ranges = byte_ranges(path, range_bytes=256)
+
+    assert ranges[0][0] == data.index(b"\n") + 1
+    assert ranges[-1][1] == len(data)
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    assert all(data[end - 1:end] == b"\n" for _, end in ranges)
+
+def test_ranges_merge_in_file_order(tmp_path: Path):
+    path = write_csv(tmp_path / "data.csv", 500)
+    config = make_config()
+    serial = RecordingClient()
+    process_csv(str(path), config, AgeLimit(), serial)
+
+    results = list(validated_ranges(CsvSource(path), config, AgeLimit(), workers=3, range_bytes=256))
+
+    assert len(results) > 3
+    assert sum(r.rows_read for r in results) == 500
+    assert [b for r in results for b in r.banners()] == serial.bulk[0]
+
+def test_parallel_counts_match_serial(tmp_path: Path):
+    path = write_csv(tmp_path / "data.csv", 500)
+    serial, parallel = ProcessStats(), ProcessStats()
+    serial_client, parallel_client = RecordingClient(), RecordingClient()
+
+    process_csv(str(path), make_config(bulk_batch_size=50), AgeLimit(), serial_client, serial)
+    process_csv(str(path), make_config(bulk_batch_size=50, parse_workers=2), AgeLimit(), parallel_client, parallel)
+
+    assert parallel.counts() == serial.counts()
+    assert parallel_client.bulk == serial_client.bulk
+
+def test_parallel_run_checkpoints_to_end_of_file(tmp_path: Path):
+    path = write_csv(tmp_path / "data.csv", 100)
+    checkpoint = Checkpoint(CheckpointStore(tmp_path / "checkpoints.sqlite3"), "key")
+
+    process_csv(str(path), make_config(parse_workers=2), AgeLimit(), RecordingClient(), checkpoint=checkpoint)
+
+    assert checkpoint.offset == path.stat().st_size
+
+def test_parallel_rejects_have_file_line_numbers(tmp_path: Path):
+    path = write_csv(tmp_path / "data.csv", 200)
+    lines = path.read_text().splitlines(keepends=True)
+    lines[150] = "Bad Row,x,c,1\r\n"
+    path.write_text("".join(lines))
+    serial, parallel = [], []
+
+    process_csv(str(path), make_config(skip_malformed_rows=True), AgeLimit(), RecordingClient(), on_reject=serial.append)
+    results = validated_ranges(
+        CsvSource(path), make_config(skip_malformed_rows=True), AgeLimit(), workers=2, range_bytes=256,
+        on_malformed=parallel.append,
+    )
+    assert sum(r.rows_read for r in results) == 199
+
+    assert [r.line for r in parallel] == [r.line for r in serial if r.line is not None] == [151]
+
+def test_workers_are_spawned_not_forked(tmp_path: Path, monkeypatch):
+    path = write_csv(tmp_path / "data.csv", 50)
+    methods = []
+    real_pool = parallel.ProcessPoolExecutor
+
+    def recording_pool(**kwargs):
+        methods.append(kwargs["mp_context"].get_start_method())
+        return real_pool(**kwargs)
+
+    monkeypatch.setattr(parallel, "ProcessPoolExecutor", recording_pool)
+
+    results = list(validated_ranges(CsvSource(path), make_config(), AgeLimit(), workers=2, range_bytes=256))
+
+    assert methods == ["spawn"]
+    assert sum(r.rows_read for r in results) == 50
+
+QUOTED_CSV = (
+    'Name,Age,Cookie,Banner_id\n'
+    '"John\nDoe",30,c0,5\n'
+    'Jane Doe,30,"c1\n\nstill c1",5\n'
+    '"Ann ""A"" Lee",30,c2,5\n'
+    'Bob,30,c3,5\n'
+    '"Eve Doe",30,"c4\n",5\n'
+)
+
+def test_ranges_never_end_inside_quoted_fields(tmp_path: Path):
+    path = tmp_path / "data.csv"
+    path.write_text(QUOTED_CSV)
+    serial_stats, parallel_stats = ProcessStats(), ProcessStats()
+    serial, in_parallel = RecordingClient(), RecordingClient()
+
+    process_csv(str(path), make_config(skip_malformed_rows=True), AgeLimit(), serial, serial_stats)
+    results = list(validated_ranges(CsvSource(path), make_config(), AgeLimit(), workers=2, range_bytes=20))
+    process_csv(str(path), make_config(parse_workers=2), AgeLimit(), in_parallel, parallel_stats)
+
+    assert len(results) > 1
+    assert sum(r.rows_read for r in results) == 5
+    assert parallel_stats.counts() == serial_stats.counts()
+    assert in_parallel.bulk == serial.bulk
+
+
+def test_unclosed_quote_is_validated_serially(tmp_path: Path):
+    path = tmp_path / "data.csv"
+    path.write_text('Name,Age,Cookie,Banner_id\nJohn Doe,30,c0,5\nJane Doe,30,"c1,5\nBob,30,c2,5\n')
+    serial_stats, parallel_stats = ProcessStats(), ProcessStats()
+
+    with pytest.raises(parallel.NotSplittable):
+        byte_ranges(path, range_bytes=16)
+    process_csv(str(path), make_config(skip_malformed_rows=True), AgeLimit(), RecordingClient(), serial_stats)
+    process_csv(str(path), make_config(skip_malformed_rows=True, parse_workers=2), AgeLimit(), RecordingClient(), parallel_stats)
+
+    assert parallel_stats.counts() == serial_stats.counts()
+
+
+def test_script_without_main_guard_falls_back_to_serial(tmp_path: Path):
+    path = write_csv(tmp_path / "data.csv", 50)
+    script = tmp_path / "unguarded.py"
+    script.write_text(
+        "from src.models import AgeLimit\n"
+        "from src.processor import process_csv\n"
+        "from tests.fakes import RecordingClient\n"
+        "from tests.test_parallel import make_config\n"
+        f"print(process_csv({str(path)!r}, make_config(parse_workers=2), AgeLimit(), RecordingClient()))\n"
+    )
+
+    root = Path(__file__).parent.parent
+    run = subprocess.run(
+        [sys.executable, str(script)], env={**os.environ, "PYTHONPATH": str(root)}, capture_output=True, text=True, timeout=60
+    )
+
+    assert run.returncode == 0, run.stderr
+    assert run.stdout.splitlines()[-1] == str(process_csv(str(path), make_config(), AgeLimit(), RecordingClient()))
+    assert "validating" in run.stderr and "in one process" in run.stderr
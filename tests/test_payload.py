@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from src import payload
+from src.models import Banner
+
+BANNERS = [Banner(visitor_cookie="c1", banner_id=5), Banner(visitor_cookie='quo"te-é', banner_id=42)]
+EXPECTED = {"Data": [{"VisitorCookie": "c1", "BannerId": 5}, {"VisitorCookie": 'quo"te-é', "BannerId": 42}]}
+
+def test_bulk_body_matches_json_payload():
+    assert json.loads(payload.encode_bulk(BANNERS)) == EXPECTED
+
+
+def test_bulk_body_without_orjson_is_the_same_document(monkeypatch):
+    monkeypatch.setattr(payload, "orjson", None)
+
+    assert json.loads(payload.encode_bulk(BANNERS)) == EXPECTED
+    assert json.loads(payload.encode_json({"VisitorCookie": "c1", "BannerId": 5})) == {"VisitorCookie": "c1", "BannerId": 5}
+
+
+def test_gzip_encoder_compresses_large_bodies_only():
+    encoder = payload.Encoder("gzip")
+    body = payload.encode_bulk([Banner(visitor_cookie=f"cookie-{i}", banner_id=i % 99) for i in range(1000)])
+
+    compressed, encoding = encoder.encode(body)
+
+    assert encoding == "gzip"
+    assert len(compressed) < len(body) / 4
+    assert payload.decode(compressed, encoding) == body
+    assert encoder.encode(b'{"Data":[]}') == (b'{"Data":[]}', None)
+
+
+def test_zstd_encoder_round_trips_large_bodies():
+    encoder = payload.Encoder("zstd")
+    body = payload.encode_bulk([Banner(visitor_cookie=f"cookie-{i}", banner_id=i % 99) for i in range(1000)])
+
+    compressed, encoding = encoder.encode(body)
+
+    assert encoding == "zstd"
+    assert len(compressed) < len(body) / 4
+    assert payload.decode(compressed, encoding) == body
+    with pytest.raises(ValueError, match="Corrupt zstd"):
+        payload.decode(b"not zstd", "zstd")
+
+
+def test_unknown_or_unavailable_compression_is_rejected(monkeypatch):
+    with pytest.raises(ValueError):
+        payload.Encoder("brotli")
+    with pytest.raises(ValueError):
+        payload.decode(b"not gzip", "gzip")
+
+    monkeypatch.setattr(payload, "zstandard", None)
+    with pytest.raises(RuntimeError, match="zstandard"):
+        payload.Encoder("zstd")
@@ -0,0 +1,422 @@
+import asyncio
+import contextlib
+import csv
+import logging
+import os
+import threading
+from pathlib import Path
+
+import pytest
+
+from src.checkpoint import Checkpoint, CheckpointStore, file_digest
+from src.config import Config
+from src.csv_loader import CsvFiles, CsvSource, CsvStreamSource
+from src.dedup import DedupIndex
+from src.models import AgeLimit
+from src.outbox import Outbox
+from src import processor
+from src.processor import (
+    FileSummary,
+    ProcessStats,
+    process_csv,
+    process_csv_async,
+    process_source,
+    process_source_async,
+    validate_source,
+)
+from tests.fakes import AsyncRecordingClient, RecordingClient
+
+def make_config(**overrides) -> Config:
+    base = dict(
+        api_base_url="https://api.example",
+        project_key="dev-key",
+        min_banner_id=1,
+        max_banner_id=99,
+        token_expiry_seconds=84600,
+        max_retries=5,
+        retry_backoff_seconds=2,
+        bulk_batch_size=1000,
+    )
+    base.update(overrides)
+    return Config(**base)
+
+def write_csv(path: Path, rows: list[dict[str, str]]) -> Path:
+    with path.open("w") as f:
+        writer = csv.DictWriter(f, fieldnames=["Name", "Age", "Cookie", "Banner_id"])
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+def customer_rows(count: int, invalid_every: int = 0) -> list[dict[str, str]]:
+    rows = []
+    for i in range(count):
+        name = "Bad_Name" if invalid_every and i % invalid_every == 0 else "John Doe"
+        rows.append({"Name": name, "Age": "30", "Cookie": f"c{i}", "Banner_id": "5"})
+    return rows
+
+def test_process_csv_batches_valid_customers(tmp_path):
+    path = write_csv(tmp_path / "data.csv", customer_rows(25, invalid_every=5))
+    client = RecordingClient()
+
+    valid, invalid = process_csv(str(path), make_config(bulk_batch_size=10), AgeLimit(), client)
+
+    assert (valid, invalid) == (20, 5)
+    assert [len(batch) for batch in client.bulk] == [10, 10]
+
+
+def test_process_csv_falls_back_to_single_requests(tmp_path):
+    path = write_csv(tmp_path / "data.csv", customer_rows(3))
+    client = RecordingClient(fail_bulk=True)
+
+    process_csv(str(path), make_config(), AgeLimit(), client)
+
+    assert sorted(b.visitor_cookie for b in client.single) == ["c0", "c1", "c2"]
+
+
+def test_process_csv_async_matches_sync_counts_and_limits_in_flight(tmp_path):
+    path = write_csv(tmp_path / "data.csv", customer_rows(95, invalid_every=7))
+    config = make_config(bulk_batch_size=10, max_in_flight_batches=3)
+    client = AsyncRecordingClient()
+
+    result = asyncio.run(process_csv_async(str(path), config, AgeLimit(), client))
+
+    assert result == process_csv(str(path), config, AgeLimit(), RecordingClient())
+    assert sum(len(batch) for batch in client.bulk) == result[0]
+    assert client.max_in_flight == 3
+
+
+def test_process_csv_async_writes_its_state_off_the_event_loop(tmp_path):
+    path = write_csv(tmp_path / "data.csv", customer_rows(25))
+    writers = []
+
+    class RecordingStore(CheckpointStore):
+        def save(self, key, offset):
+            writers.append(("checkpoint", threading.current_thread()))
+            super().save(key, offset)
+
+    class RecordingIndex(DedupIndex):
+        def mark_delivered(self, banners):
+            writers.append(("dedup", threading.current_thread()))
+            super().mark_delivered(banners)
+
+    class RecordingOutbox(Outbox):
+        def add(self, banners, source):
+            writers.append(("outbox", threading.current_thread()))
+            super().add(banners, source)
+
+    store = RecordingStore(tmp_path / "checkpoints.sqlite3")
+    checkpoint = Checkpoint(store, file_digest(path))
+    outbox = RecordingOutbox(tmp_path / "outbox.sqlite3")
+    client = AsyncRecordingClient(failing={"c3"})
+    config = make_config(bulk_batch_size=10, max_in_flight_batches=3)
+
+    asyncio.run(
+        process_csv_async(
+            str(path), config, AgeLimit(), client, checkpoint=checkpoint,
+            dedup=RecordingIndex(tmp_path / "dedup.sqlite3", 3600), outbox=outbox,
+        )
+    )
+
+    assert {kind for kind, _ in writers} == {"checkpoint", "dedup", "outbox"}
+    assert threading.main_thread() not in {thread for _, thread in writers}
+    assert store.get(checkpoint.key) == path.stat().st_size
+    assert [banner.visitor_cookie for batch in outbox.batches(10) for _, banner in batch] == ["c3"]
+
+
+def test_fallback_shares_one_retry_budget_per_batch(tmp_path):
+    path = write_csv(tmp_path / "data.csv", customer_rows(10))
+    budgets = set()
+
+    class FailingClient(RecordingClient):
+        def show_banner(self, banner, rate_limiter=None, retry_budget=None):
+            budgets.add(id(retry_budget))
+            return False
+
+    stats = ProcessStats()
+    process_csv(str(path), make_config(fallback_concurrency=4), AgeLimit(), FailingClient(fail_bulk=True), stats)
+
+    assert len(budgets) == 1
+    assert (stats.banners_sent, stats.banners_failed) == (0, 10)
+
+
+class PoisonClient(RecordingClient):
+    """Rejects any bulk request containing a banner whose cookie is in bad."""
+    def __init__(self, bad: set[str]):
+        super().__init__()
+        self.bad = bad
+
+    def show_banners_bulk(self, banners, retry_budget=None):
+        super().show_banners_bulk(banners)
+        return not any(b.visitor_cookie in self.bad for b in banners)
+
+class AsyncPoisonClient(PoisonClient):
+    async def show_banners_bulk(self, banners, retry_budget=None):
+        return super().show_banners_bulk(banners)
+
+    async def show_banner(self, banner, rate_limiter=None, retry_budget=None):
+        return super().show_banner(banner)
+
+
+def test_bisect_fallback_isolates_poison_banners(tmp_path):
+    path = write_csv(tmp_path / "data.csv", customer_rows(64))
+    client = PoisonClient(bad={"c5", "c40"})
+    stats = ProcessStats()
+
+    process_csv(str(path), make_config(bulk_batch_size=64, fallback_strategy="bisect"), AgeLimit(), client, stats)
+
+    assert (stats.banners_sent, stats.banners_failed) == (62, 2)
+    assert client.single == []
+    # 2 bad items in 64 need far fewer than 64 extra requests
+    assert stats.fallback_requests == len(client.bulk) - 1 < 30
+    assert stats.single_requests == 0
+
+
+def test_bisect_fallback_async_matches_sync(tmp_path):
+    path = write_csv(tmp_path / "data.csv", customer_rows(50))
+    config = make_config(bulk_batch_size=16, fallback_strategy="bisect")
+    sync_stats, async_stats = ProcessStats(), ProcessStats()
+
+    process_csv(str(path), config, AgeLimit(), PoisonClient(bad={"c3", "c33"}), sync_stats)
+    asyncio.run(process_csv_async(str(path), config, AgeLimit(), AsyncPoisonClient(bad={"c3", "c33"}), async_stats))
+
+    assert sync_stats.counts() == async_stats.counts()
+
+def test_skip_malformed_rows_counts_them_as_invalid(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJane Doe,thirty,c2,5\nBad_Name,30,c3,5\nAnn,20,c4,7\n")
+    client = RecordingClient()
+    stats = ProcessStats()
+    rejects = []
+
+    valid, invalid = process_csv(
+        str(path), make_config(skip_malformed_rows=True), AgeLimit(), client, stats, on_reject=rejects.append
+    )
+
+    assert (valid, invalid) == (2, 2)
+    assert (stats.rows_read, stats.malformed) == (4, 1)
+    assert [(r.line, r.row["Cookie"]) for r in rejects] == [(3, "c2"), (None, "c3")]
+    assert [b.visitor_cookie for b in client.bulk[0]] == ["c1", "c4"]
+
+def test_malformed_rows_abort_by_default(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("Name,Age,Cookie,Banner_id\nJane Doe,thirty,c2,5\n")
+
+    with pytest.raises(ValueError, match="Invalid row"):
+        process_csv(str(path), make_config(), AgeLimit(), RecordingClient())
+
+def test_invalid_rows_are_logged_as_periodic_summaries(tmp_path, caplog):
+    path = write_csv(tmp_path / "data.csv", customer_rows(10, invalid_every=2))
+
+    with caplog.at_level(logging.WARNING, logger="src.processor"):
+        process_csv(str(path), make_config(reject_log_interval=4), AgeLimit(), RecordingClient())
+
+    messages = [r.getMessage() for r in caplog.records]
+    assert messages == [
+        "Rejected 3 of 5 rows: invalid name: must contain only letters and spaces (3)",
+        "Rejected 5 of 9 rows: invalid name: must contain only letters and spaces (5)",
+        "Rejected 5 of 10 rows: invalid name: must contain only letters and spaces (5)",
+    ]
+
+
+
+def test_adaptive_batching_shrinks_after_retries_and_grows_back(tmp_path):
+    path = write_csv(tmp_path / "data.csv", customer_rows(60))
+    config = make_config(bulk_batch_size=10, adaptive_batching=True, min_bulk_batch_size=4, max_bulk_batch_size=12)
+
+    class ThrottledClient(RecordingClient):
+        def show_banners_bulk(self, banners, retry_budget=None):
+            if not self.bulk:
+                # First request needed a retry, like after a 429
+                retry_budget.try_spend()
+            return super().show_banners_bulk(banners, retry_budget)
+
+    client = ThrottledClient()
+    valid, _ = process_csv(str(path), config, AgeLimit(), client)
+
+    assert valid == 60
+    assert [len(batch) for batch in client.bulk] == [10, 5, 6, 7, 8, 9, 10, 5]
+
+
+def test_live_source_flushes_partial_batch_after_max_linger():
+    read_fd, write_fd = os.pipe()
+    first_batch_sent = threading.Event()
+
+    class SignallingClient(RecordingClient):
+        def show_banners_bulk(self, banners, retry_budget=None):
+            first_batch_sent.set()
+            return super().show_banners_bulk(banners, retry_budget)
+
+    def write_rows():
+        with open(write_fd, "w") as pipe:
+            pipe.write("Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJohn Doe,30,c2,5\n")
+            pipe.flush()
+            # The writer stays open, so only the linger timer can send these rows
+            first_batch_sent.wait(timeout=5)
+            pipe.write("John Doe,30,c3,5\n")
+
+    writer = threading.Thread(target=write_rows)
+    writer.start()
+    client = SignallingClient()
+    with open(read_fd, "rb") as stream:
+        source = CsvStreamSource(stream, label="<pipe>", live=True)
+        valid, _ = process_source(source, make_config(max_linger_seconds=0.05), AgeLimit(), client)
+    writer.join()
+
+    assert valid == 3
+    assert [[b.visitor_cookie for b in batch] for batch in client.bulk] == [["c1", "c2"], ["c3"]]
+
+
+@contextlib.contextmanager
+def lingering_pipe():
+    """A live source that gets two valid rows and an invalid one, then stays open."""
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b"Name,Age,Cookie,Banner_id\nJohn Doe,30,c1,5\nJohn Doe,30,c2,5\nBad1,30,c3,5\n")
+    stream = open(read_fd, "rb")
+    try:
+        yield CsvStreamSource(stream, label="<pipe>", live=True)
+    finally:
+        os.close(write_fd)
+        stream.close()
+
+
+def interrupt_when_lingering(monkeypatch, interrupt, banners: int) -> None:
+    """Call interrupt() once the batcher waits out the linger with `banners` banners buffered."""
+    read_ahead = processor._read_ahead
+
+    def watched(items, timeout, stop=None):
+        buffered = 0
+        interrupted = False
+
+        def wait():
+            nonlocal interrupted
+            if buffered == banners and not interrupted:
+                interrupted = True
+                interrupt()
+            return timeout()
+
+        for item in read_ahead(items, wait, stop):
+            if item[0] is not None:
+                buffered += 1
+            yield item
+
+    monkeypatch.setattr(processor, "_read_ahead", watched)
+
+
+def test_interrupted_live_source_sends_its_lingering_batch(monkeypatch):
+    def ctrl_c():
+        raise KeyboardInterrupt
+
+    interrupt_when_lingering(monkeypatch, ctrl_c, banners=2)
+    client = RecordingClient()
+    with lingering_pipe() as source, pytest.raises(KeyboardInterrupt):
+        process_source(source, make_config(max_linger_seconds=60), AgeLimit(), client)
+
+    assert [[b.visitor_cookie for b in batch] for batch in client.bulk] == [["c1", "c2"]]
+
+
+def test_cancelled_async_live_source_sends_its_lingering_batch(monkeypatch):
+    client = AsyncRecordingClient()
+
+    async def run():
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        interrupt_when_lingering(monkeypatch, lambda: loop.call_soon_threadsafe(task.cancel), banners=2)
+        with lingering_pipe() as source:
+            await process_source_async(source, make_config(max_linger_seconds=60), AgeLimit(), client)
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(run())
+
+    assert [[b.visitor_cookie for b in batch] for batch in client.bulk] == [["c1", "c2"]]
+
+
+def test_cancelled_async_live_source_stays_cancelled_when_the_lingering_batch_fails(monkeypatch, caplog):
+    class FailingClient(AsyncRecordingClient):
+        async def show_banners_bulk(self, banners, retry_budget=None):
+            await super().show_banners_bulk(banners, retry_budget)
+            raise RuntimeError("connection reset")
+
+    client = FailingClient()
+
+    async def run():
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        interrupt_when_lingering(monkeypatch, lambda: loop.call_soon_threadsafe(task.cancel), banners=2)
+        with lingering_pipe() as source:
+            await process_source_async(source, make_config(max_linger_seconds=60), AgeLimit(), client)
+
+    with pytest.raises(asyncio.CancelledError), caplog.at_level(logging.ERROR):
+        asyncio.run(run())
+
+    assert len(client.bulk) == 1
+    assert "Failed to deliver the buffered banners" in caplog.text
+
+
+def test_csv_files_fill_batches_across_files_and_summarize_each_file(tmp_path):
+    def rows(prefix: str, count: int) -> list[dict[str, str]]:
+        return [{"Name": "John Doe", "Age": "30", "Cookie": f"{prefix}{i}", "Banner_id": "5"} for i in range(count)]
+
+    first = write_csv(tmp_path / "a.csv", rows("a", 5) + [{"Name": "Bad_Name", "Age": "30", "Cookie": "x", "Banner_id": "5"}])
+    empty = write_csv(tmp_path / "b.csv", [])
+    last = write_csv(tmp_path / "c.csv", rows("c", 3))
+
+    class PoisonClient(RecordingClient):
+        def show_banners_bulk(self, banners, retry_budget=None):
+            super().show_banners_bulk(banners, retry_budget)
+            return all(b.visitor_cookie != "c1" for b in banners)
+
+        def show_banner(self, banner, rate_limiter=None, retry_budget=None):
+            return banner.visitor_cookie != "c1"
+
+    client = PoisonClient()
+    stats = ProcessStats()
+    source = CsvFiles.of([first, empty, last])
+
+    valid, invalid = process_source(source, make_config(bulk_batch_size=4), AgeLimit(), client, stats=stats)
+
+    assert (valid, invalid) == (8, 1)
+    assert [[b.visitor_cookie for b in batch] for batch in client.bulk] == [["a0", "a1", "a2", "a3"], ["a4", "c0", "c1", "c2"]]
+    assert stats.files == [
+        FileSummary(str(first), rows_read=6, valid=5, invalid=1, banners_sent=5),
+        FileSummary(str(empty)),
+        FileSummary(str(last), rows_read=3, valid=3, banners_sent=2, banners_failed=1),
+    ]
+    async_stats = ProcessStats()
+
+    class AsyncPoisonClient(PoisonClient):
+        async def show_banners_bulk(self, banners, retry_budget=None):
+            return super().show_banners_bulk(banners, retry_budget)
+
+        async def show_banner(self, banner, rate_limiter=None, retry_budget=None):
+            return super().show_banner(banner)
+
+    asyncio.run(process_source_async(source, make_config(bulk_batch_size=4), AgeLimit(), AsyncPoisonClient(), stats=async_stats))
+    assert async_stats.files == stats.files
+
+
+@pytest.mark.parametrize("engine,workers", [("python", 1), ("columnar", 1), ("python", 2), ("columnar", 2)])
+def test_validate_source_reports_without_a_client(tmp_path, engine, workers):
+    rows = customer_rows(5, invalid_every=3) + [
+        {"Name": "John Doe", "Age": "10", "Cookie": "y", "Banner_id": "7"},
+        {"Name": "John Doe", "Age": "x", "Cookie": "z", "Banner_id": "7"},
+    ]
+    path = write_csv(tmp_path / "data.csv", rows)
+    rejects = []
+
+    report = validate_source(
+        CsvSource(path),
+        make_config(bulk_batch_size=2, skip_malformed_rows=True, validation_engine=engine, parse_workers=workers),
+        AgeLimit(),
+        rejects.append,
+    )
+
+    assert (report.rows_read, report.valid, report.invalid, report.malformed) == (7, 3, 4, 1)
+    assert report.reasons == {
+        "invalid name: must contain only letters and spaces": 2,
+        "invalid age: must be between 18 and 100": 1,
+        "malformed row: Age is not an integer": 1,
+    }
+    assert report.ages == {10: 1, 30: 5}
+    assert report.banner_ids == {5: 5, 7: 1}
+    assert report.bulk_requests == 2
+    assert len(rejects) == 4
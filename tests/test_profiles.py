@@ -0,0 +1,120 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from src import profiles
+from src.config import Config
+from src.models import AgeLimit
+from src.profiles import DEFAULT_PROFILE, Profile, ProfileRegistry
+
+def make_config(**overrides) -> Config:
+    base = dict(
+        api_base_url="https://api.example",
+        project_key="dev-key",
+        min_banner_id=1,
+        max_banner_id=99,
+        token_expiry_seconds=84600,
+        max_retries=5,
+        retry_backoff_seconds=2,
+        bulk_batch_size=2,
+    )
+    base.update(overrides)
+    return Config(**base)
+
+class DummyClient:
+    def __init__(self, config: Config):
+        self.config = config
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def test_load_without_file_has_only_the_default_profile():
+    config = make_config()
+
+    registry = ProfileRegistry.load(config)
+
+    assert [profile.name for profile in registry.all()] == [DEFAULT_PROFILE]
+    default = registry.get(DEFAULT_PROFILE)
+    assert default.config == config
+    assert default.age_limit == AgeLimit()
+    assert registry.get("acme") is None
+
+
+def test_load_reads_profiles_file(tmp_path):
+    path = tmp_path / "profiles.json"
+    path.write_text(json.dumps({
+        "default": {"min_age": 21},
+        "acme": {"project_key": "acme-key", "max_banner_id": 50, "min_age": 30, "max_age": 60},
+    }))
+    config = make_config(state_dir=str(tmp_path / "state"), profiles_file=str(path))
+
+    registry = ProfileRegistry.load(config)
+
+    default, acme = registry.get(DEFAULT_PROFILE), registry.get("acme")
+    assert default.age_limit == AgeLimit(min_age=21, max_age=100)
+    assert default.config.state_dir == config.state_dir
+    assert acme.config.project_key == "acme-key"
+    assert (acme.config.min_banner_id, acme.config.max_banner_id) == (1, 50)
+    assert acme.age_limit == AgeLimit(min_age=30, max_age=60)
+    assert Path(acme.config.state_dir) == tmp_path / "state" / "profiles" / "acme"
+    assert acme.to_dict() == {"name": "acme", "min_banner_id": 1, "max_banner_id": 50, "min_age": 30, "max_age": 60}
+
+
+@pytest.mark.parametrize(
+    ("name", "settings"),
+    [("acme", {"state_dir": "/tmp"}), ("../acme", {}), ("", {})],
+)
+def test_profile_rejects_unknown_settings_and_bad_names(name, settings):
+    with pytest.raises(ValueError):
+        Profile.of(name, make_config(), settings)
+
+
+def test_set_age_limit_leaves_earlier_snapshots_unchanged():
+    registry = ProfileRegistry.load(make_config())
+    before = registry.get(DEFAULT_PROFILE)
+
+    updated = registry.set_age_limit(DEFAULT_PROFILE, AgeLimit(min_age=40, max_age=50))
+
+    assert before.age_limit == AgeLimit()
+    assert updated.age_limit == AgeLimit(min_age=40, max_age=50)
+    assert registry.get(DEFAULT_PROFILE) == updated
+    assert registry.set_age_limit("missing", AgeLimit()) is None
+
+
+def test_clients_are_shared_by_profiles_with_the_same_key(monkeypatch):
+    monkeypatch.setattr(profiles, "ShowAdsClient", DummyClient)
+    config = make_config()
+    registry = ProfileRegistry([
+        Profile.of(DEFAULT_PROFILE, config, {}),
+        Profile.of("young", config, {"max_age": 30}),
+        Profile.of("acme", config, {"project_key": "acme-key"}),
+    ])
+
+    default, young, acme = (registry.get(name) for name in ("default", "young", "acme"))
+    client = registry.client(default)
+
+    assert registry.client(young) is client
+    assert registry.client(acme) is not client
+    assert registry.client(acme).config.project_key == "acme-key"
+    registry.close()
+    assert client.closed
+
+
+def test_outboxes_are_kept_per_profile(tmp_path):
+    config = make_config(state_dir=str(tmp_path))
+    registry = ProfileRegistry([Profile.of(DEFAULT_PROFILE, config, {}), Profile.of("acme", config, {})])
+
+    default_outbox = registry.outbox(registry.get(DEFAULT_PROFILE))
+    acme_outbox = registry.outbox(registry.get("acme"))
+
+    assert default_outbox is not acme_outbox
+    assert registry.outbox(registry.get("acme")) is acme_outbox
+    registry.close()
+
+
+def test_outbox_is_none_when_disabled(tmp_path):
+    registry = ProfileRegistry.load(make_config(state_dir=str(tmp_path), outbox_enabled=False))
+
+    assert registry.outbox(registry.get(DEFAULT_PROFILE)) is None
@@ -0,0 +1,30 @@
+import time
+
+from src.rate_limit import RetryBudget, TokenBucket
+
+def test_token_bucket_allows_burst_then_throttles():
+    bucket = TokenBucket(rate=20, burst=2)
+
+    start = time.monotonic()
+    for _ in range(4):
+        bucket.acquire()
+    elapsed = time.monotonic() - start
+
+    # Two tokens are free, the next two wait 1/20s each
+    assert 0.08 <= elapsed < 0.5
+
+
+def test_token_bucket_pause_delays_next_acquire():
+    bucket = TokenBucket(rate=1000, burst=10)
+    bucket.pause(0.1)
+
+    start = time.monotonic()
+    bucket.acquire()
+
+    assert time.monotonic() - start >= 0.09
+
+
+def test_retry_budget_is_shared_until_spent():
+    budget = RetryBudget(2)
+
+    assert [budget.try_spend() for _ in range(3)] == [True, True, False]
@@ -0,0 +1,64 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from src.csv_loader import Reject
+from src.models import Customer
+from src.rejects import RejectSink, rejects_path, remove_expired_rejects
+
+MALFORMED = Reject(line=3, reason="malformed row: Age is not an integer (got 'x')", row={"Name": "Jo", "Age": "x"})
+INVALID = Reject.for_customer(Customer("B_", 20, "c1", 5), "invalid name: must contain only letters and spaces (got B_)")
+
+def test_csv_sink_writes_header_and_raw_fields(tmp_path: Path):
+    path = tmp_path / "rejects.csv"
+    with RejectSink(path) as sink:
+        sink.write(MALFORMED)
+        sink.write(INVALID)
+
+    assert sink.count == 2
+    assert path.read_text().splitlines() == [
+        "line,reason,Name,Age,Cookie,Banner_id",
+        "3,malformed row: Age is not an integer (got 'x'),Jo,x,,",
+        ",invalid name: must contain only letters and spaces (got B_),B_,20,c1,5",
+    ]
+
+def test_jsonl_sink_by_suffix(tmp_path: Path):
+    path = tmp_path / "rejects.jsonl"
+    with RejectSink(path) as sink:
+        sink.write(INVALID)
+
+    assert [json.loads(line) for line in path.read_text().splitlines()] == [{
+        "line": None,
+        "reason": "invalid name: must contain only letters and spaces (got B_)",
+        "Name": "B_",
+        "Age": "20",
+        "Cookie": "c1",
+        "Banner_id": "5",
+    }]
+
+def test_sink_creates_file_on_first_reject_and_appends(tmp_path: Path):
+    path = tmp_path / "nested" / "rejects.csv"
+    with RejectSink(path, append=True):
+        pass
+    assert not path.exists()
+
+    for _ in range(2):
+        with RejectSink(path, append=True) as sink:
+            sink.write(MALFORMED)
+
+    lines = path.read_text().splitlines()
+    assert lines[0] == "line,reason,Name,Age,Cookie,Banner_id"
+    assert len(lines) == 3
+
+def test_expired_rejects_are_removed(tmp_path: Path):
+    old, fresh = rejects_path(str(tmp_path), "old"), rejects_path(str(tmp_path), "fresh")
+    for path in (old, fresh):
+        with RejectSink(path) as sink:
+            sink.write(INVALID)
+    two_hours_ago = time.time() - 7200
+    os.utime(old, (two_hours_ago, two_hours_ago))
+
+    assert remove_expired_rejects(str(tmp_path), retention_seconds=3600) == 1
+    assert (old.exists(), fresh.exists()) == (False, True)
+    assert remove_expired_rejects(str(tmp_path / "missing"), retention_seconds=3600) == 0
@@ -0,0 +1,181 @@
+import time
+from pathlib import Path
+
+import pytest
+import requests
+
+from src.config import Config
+from src.models import AgeLimit, Banner
+from src.processor import process_csv
+from src.retry import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, RetryPolicy
+from src.showads_client import ShowAdsClient
+from tests.fakes import RecordingClient
+
+def make_config(**overrides) -> Config:
+    base = dict(
+        api_base_url="https://api.example",
+        project_key="dev-key",
+        min_banner_id=1,
+        max_banner_id=99,
+        token_expiry_seconds=84600,
+        max_retries=5,
+        retry_backoff_seconds=0,
+        bulk_batch_size=1000,
+    )
+    base.update(overrides)
+    return Config(**base)
+
+def write_csv(path: Path, rows: int) -> Path:
+    lines = ["Name,Age,Cookie,Banner_id"] + [f"John Doe,30,c{i},5" for i in range(rows)]
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+def test_backoff_is_jittered_and_capped():
+    policy = RetryPolicy(max_attempts=100, base_seconds=1, cap_seconds=5)
+
+    delays = [policy.start().next_delay() for _ in range(50)]
+    call = policy.start()
+    later = [call.next_delay() for _ in range(20)]
+
+    assert all(1 <= delay <= 3 for delay in delays)
+    assert len(set(delays)) > 1
+    assert all(1 <= delay <= 5 for delay in later)
+
+
+def test_retry_after_replaces_backoff_and_attempts_run_out():
+    call = RetryPolicy(max_attempts=3, base_seconds=1).start()
+
+    assert call.next_delay(retry_after=7.5) == 7.5
+    assert call.next_delay() is not None
+    assert call.next_delay() is None
+
+
+def test_call_gives_up_when_wait_would_pass_deadline():
+    call = RetryPolicy(max_attempts=5, base_seconds=1, call_deadline_seconds=10).start()
+
+    assert call.next_delay(retry_after=20) is None
+    assert RetryPolicy(max_attempts=5, base_seconds=0).start(Deadline(0.01)).timeout() <= 0.01
+
+
+def test_circuit_breaker_opens_then_lets_one_trial_through():
+    breaker = CircuitBreaker(threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    time.sleep(0.06)
+    breaker.check()
+    # Only one trial request while half-open
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    breaker.record_success()
+    breaker.check()
+    assert not breaker.is_open
+
+
+def test_client_backs_off_on_network_errors(requests_mock):
+    config = make_config()
+    client = ShowAdsClient(config)
+    requests_mock.post(f"{config.api_base_url}/auth", json={"AccessToken": "abc"})
+    requests_mock.post(f"{config.api_base_url}/banners/show", [
+        {"exc": requests.ConnectionError("reset")},
+        {"status_code": 200},
+    ])
+
+    assert client.show_banner(Banner(visitor_cookie="c1", banner_id=1)) is True
+
+
+def test_token_refresh_does_not_use_up_an_attempt(requests_mock):
+    config = make_config(max_retries=1)
+    client = ShowAdsClient(config)
+    requests_mock.post(f"{config.api_base_url}/auth", [
+        {"json": {"AccessToken": "old"}},
+        {"json": {"AccessToken": "new"}},
+    ])
+    requests_mock.post(f"{config.api_base_url}/banners/show", [{"status_code": 401}, {"status_code": 200}])
+
+    assert client.show_banner(Banner(visitor_cookie="c1", banner_id=1)) is True
+
+
+def test_client_fails_fast_once_breaker_opens(requests_mock):
+    config = make_config(circuit_breaker_threshold=3)
+    client = ShowAdsClient(config)
+    requests_mock.post(f"{config.api_base_url}/auth", json={"AccessToken": "abc"})
+    show = requests_mock.post(f"{config.api_base_url}/banners/show", status_code=503)
+
+    with pytest.raises(CircuitOpenError):
+        client.show_banner(Banner(visitor_cookie="c1", banner_id=1))
+    with pytest.raises(CircuitOpenError):
+        client.show_banner(Banner(visitor_cookie="c2", banner_id=1))
+    assert show.call_count == 3
+
+
+def test_client_recovers_after_breaker_opened_on_auth(requests_mock):
+    config = make_config(circuit_breaker_threshold=2, circuit_breaker_reset_seconds=0.05)
+    client = ShowAdsClient(config)
+    auth = requests_mock.post(f"{config.api_base_url}/auth", [
+        {"status_code": 500},
+        {"status_code": 500},
+        {"json": {"AccessToken": "abc"}},
+    ])
+    requests_mock.post(f"{config.api_base_url}/banners/show", status_code=200)
+
+    with pytest.raises(CircuitOpenError):
+        client.show_banner(Banner(visitor_cookie="c1", banner_id=1))
+    time.sleep(0.06)
+
+    # The trial request fetches the token itself instead of being refused by its own breaker
+    assert client.show_banner(Banner(visitor_cookie="c2", banner_id=1)) is True
+    assert client.show_banner(Banner(visitor_cookie="c3", banner_id=1)) is True
+    assert auth.call_count == 3
+    assert not client.breaker.is_open
+
+
+def test_trial_that_raises_lets_the_next_call_try(requests_mock):
+    config = make_config(circuit_breaker_threshold=1, circuit_breaker_reset_seconds=0.05)
+    client = ShowAdsClient(config)
+    requests_mock.post(f"{config.api_base_url}/auth", [
+        {"status_code": 500},
+        {"exc": ValueError("unexpected")},
+        {"json": {"AccessToken": "abc"}},
+    ])
+    requests_mock.post(f"{config.api_base_url}/banners/show", status_code=200)
+
+    with pytest.raises(CircuitOpenError):
+        client.show_banner(Banner(visitor_cookie="c1", banner_id=1))
+    time.sleep(0.06)
+    with pytest.raises(ValueError):
+        client.show_banner(Banner(visitor_cookie="c2", banner_id=1))
+
+    assert client.show_banner(Banner(visitor_cookie="c3", banner_id=1)) is True
+
+
+def test_open_circuit_fails_batches_without_fallback(tmp_path):
+    path = write_csv(tmp_path / "data.csv", 4)
+
+    class DownClient(RecordingClient):
+        def show_banners_bulk(self, banners, retry_budget=None):
+            raise CircuitOpenError("ShowAds circuit breaker is open")
+
+    client = DownClient()
+    process_csv(str(path), make_config(), AgeLimit(), client)
+
+    assert client.single == []
+
+
+def test_run_deadline_stops_before_next_batch(tmp_path):
+    path = write_csv(tmp_path / "data.csv", 4)
+
+    class SlowClient(RecordingClient):
+        def show_banners_bulk(self, banners, retry_budget=None):
+            assert retry_budget.deadline is not None
+            time.sleep(0.05)
+            return super().show_banners_bulk(banners, retry_budget)
+
+    client = SlowClient()
+    with pytest.raises(DeadlineExceeded):
+        process_csv(str(path), make_config(bulk_batch_size=2, run_deadline_seconds=0.02), AgeLimit(), client)
+    assert len(client.bulk) == 1
+
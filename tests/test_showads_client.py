@@ -1,8 +1,12 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
 from src.config import Config
 from src.models import Banner
-from src.showads_client import ShowAdsClient
+from src.rate_limit import RetryBudget, TokenBucket
+from src.showads_client import ShowAdsClient, Token
 
 def make_config(**overrides) -> Config:
     base = dict(
@@ -33,7 +37,7 @@ def test_auth_success_returns_bearer_header(requests_mock):
 
 
 def test_auth_retries_on_500_then_succeeds(requests_mock):
-    config = make_config(max_retries=5)
+    config = make_config(max_retries=5, retry_backoff_seconds=0)
     client = ShowAdsClient(config)
     auth_url = f"{config.api_base_url}/auth"
     requests_mock.post(auth_url, [
@@ -101,3 +105,63 @@ def test_show_banners_bulk_success_payload_shape(requests_mock):
         ]
     }
     assert last_call.headers["Authorization"] == "Bearer abc"
+
+
+def test_concurrent_threads_share_single_auth_call(requests_mock):
+    config = make_config()
+    client = ShowAdsClient(config)
+    auth_url = f"{config.api_base_url}/auth"
+    requests_mock.post(auth_url, json={"AccessToken": "abc"})
+    requests_mock.post(f"{config.api_base_url}/banners/show", status_code=200)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda i: client.show_banner(Banner(visitor_cookie=f"c{i}", banner_id=1)), range(16)))
+
+    assert all(results)
+    assert sum(1 for call in requests_mock.request_history if call.url == auth_url) == 1
+
+
+def test_token_is_refreshed_before_it_expires(requests_mock):
+    config = make_config(token_expiry_seconds=1000, token_refresh_margin_seconds=100)
+    client = ShowAdsClient(config)
+    requests_mock.post(f"{config.api_base_url}/auth", [
+        {"json": {"AccessToken": "first"}},
+        {"json": {"AccessToken": "second"}},
+    ])
+
+    assert client._auth_header()["Authorization"] == "Bearer first"
+    # Still valid, but inside the refresh margin
+    client._token = Token(access_token="first", expires_at=time.time() + 50)
+
+    assert client._auth_header()["Authorization"] == "Bearer second"
+
+
+def test_show_banner_stops_retrying_when_budget_is_spent(requests_mock):
+    config = make_config(max_retries=5, retry_backoff_seconds=0)
+    client = ShowAdsClient(config)
+    show_url = f"{config.api_base_url}/banners/show"
+    requests_mock.post(f"{config.api_base_url}/auth", json={"AccessToken": "abc"})
+    requests_mock.post(show_url, status_code=500)
+
+    ok = client.show_banner(Banner(visitor_cookie="c1", banner_id=1), retry_budget=RetryBudget(1))
+
+    assert ok is False
+    # First attempt plus the single budgeted retry
+    assert sum(1 for call in requests_mock.request_history if call.url == show_url) == 2
+
+
+def test_show_banner_429_retry_after_pauses_rate_limiter(requests_mock):
+    config = make_config(retry_backoff_seconds=0)
+    client = ShowAdsClient(config)
+    requests_mock.post(f"{config.api_base_url}/auth", json={"AccessToken": "abc"})
+    requests_mock.post(f"{config.api_base_url}/banners/show", [
+        {"status_code": 429, "headers": {"Retry-After": "0.2"}},
+        {"status_code": 200},
+    ])
+    limiter = TokenBucket(rate=1000, burst=10)
+
+    start = time.monotonic()
+    ok = client.show_banner(Banner(visitor_cookie="c1", banner_id=1), rate_limiter=limiter)
+
+    assert ok is True
+    assert time.monotonic() - start >= 0.19
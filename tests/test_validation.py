@@ -1,6 +1,6 @@
 from src.config import Config
 from src.models import AgeLimit, Customer
-from src.validation import validate_customer
+from src.validation import customer_validator, validate_customer
 
 
 def make_config(**overrides) -> Config:
@@ -96,3 +96,31 @@ def test_validate_customer_banner_id_above_max_is_invalid():
 
     assert is_valid is False
     assert f"between {config.min_banner_id} and {config.max_banner_id}" in error
+
+
+def test_customer_validator_matches_validate_customer():
+    config = make_config(min_banner_id=10, max_banner_id=20)
+    age_limit = AgeLimit(min_age=21, max_age=65)
+    error_of = customer_validator(age_limit, config)
+    customers = [
+        Customer(name="John", age=30, cookie="c1", banner_id=15),
+        Customer(name="John3", age=30, cookie="c2", banner_id=15),
+        Customer(name="John", age=70, cookie="c3", banner_id=15),
+        Customer(name="John", age=30, cookie="c4", banner_id=9),
+    ]
+
+    for customer in customers:
+        is_valid, error = validate_customer(customer, age_limit, config)
+        assert error_of(customer) == error
+        assert is_valid is (error is None)
+
+
+def test_validate_customer_rejects_blank_names_and_trailing_newlines():
+    config = make_config()
+
+    for name in ("   ", "", "Bob\n"):
+        is_valid, error = validate_customer(Customer(name=name, age=30, cookie="c1", banner_id=5), AgeLimit(), config)
+
+        assert is_valid is False
+        assert "invalid name" in error
+    assert validate_customer(Customer(name=" Bob Lee ", age=30, cookie="c1", banner_id=5), AgeLimit(), config)[0] is True